@@ -0,0 +1,93 @@
+# bench/memory.py
+"""
+Пиковая память подготовки выписки: обычный вид против LEAN_FRAMES (frames.py).
+
+    PYTHONPATH=. python -m bench.memory --rows 200000
+
+Синтетическая выписка (наименования, ИНН, счета, суммы, назначения) в
+временном каталоге; каждый режим — в отдельном процессе (пик RSS процесса не
+сбрасывается): чтение CSV + tx_id → признаки → ml_metric → id → маппинг
+строк отчёта (export._build_by_id). Память (MEMORY_BACKEND=memory) пустая,
+кэш ml_metric выключен — меряется только сама выписка. Печатается прирост
+пикового RSS к процессу после импортов, в пересчёте на 1 млн строк, и размер
+итогового DataFrame.
+"""
+import argparse, csv, json, os, random, resource, subprocess, sys, tempfile, time
+
+from bench.sharding import _make_model
+
+
+def _make_statement(path, rows, rnd):
+    n_cp = max(100, rows // 50)
+    forms = ("ООО", "АО", "ИП", "ФЛ")
+    names = [f"{rnd.choice(forms)} «{rnd.choice(('Ромашка', 'Вектор', 'Альфа', 'Север', 'Техно'))}-{i}»"
+             for i in range(n_cp)]
+    inns = [7700000000 + i for i in range(n_cp)]
+    accs = [f"40702810{i:012d}" for i in range(n_cp)]
+    purposes = ("оплата по счету №{} от {:02d}.03.2024, в т.ч. НДС", "аренда офиса за {} {:02d}",
+                "возврат займа по договору {} от {:02d}.01.2024", "поставка товара, счет {} / {:02d}")
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["id", "date", "debit_account", "debit_name", "debit_inn", "credit_account", "credit_name",
+                    "credit_inn", "debit_amount", "credit_amount", "purpose"])
+        for i in range(rows):
+            d, c = rnd.sample(range(n_cp), 2)
+            amount = rnd.choice((10000, 15000.5, 250000, 1234.56, rnd.randint(1, 10**6) / 100))
+            w.writerow([i + 1, f"2024-{rnd.randint(1, 6):02d}-{rnd.randint(1, 28):02d} {rnd.randint(0, 23):02d}:00:00",
+                        accs[d], names[d], inns[d], accs[c], names[c], inns[c], amount, amount,
+                        rnd.choice(purposes).format(rnd.randint(1, 9999), rnd.randint(1, 28))])
+
+
+def _rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024     # Linux: КБ
+
+
+def _child(csv_path):
+    """Этапы run_pipeline до LLM, как в последовательном прогоне (pipeline._run_pipeline)."""
+    from src.agent_lc.export import _build_by_id
+    from src.agent_lc.features import build_base_features
+    from src.agent_lc.frames import frame_bytes, lean_frame, read_dtypes
+    from src.agent_lc.identity import tx_ids
+    from src.agent_lc.model import predict_with_pipeline
+    from src.agent_lc.pipeline import _ensure_ids, _read_csv_robust
+    from src.agent_lc.config import LEAN_FRAMES
+    base = _rss_mb()
+    t0 = time.perf_counter()
+    df_raw = _read_csv_robust(csv_path, dtype=read_dtypes())
+    df_raw["tx_id"] = tx_ids(df_raw)
+    lean_frame(df_raw)
+    df_prep = lean_frame(build_base_features(df_raw, inplace=LEAN_FRAMES))
+    df_scored = _ensure_ids(predict_with_pipeline(None, df_prep))
+    by_id = _build_by_id(df_scored)
+    print(json.dumps(dict(base_mb=base, peak_mb=_rss_mb(), frame_mb=frame_bytes(df_scored) / 2**20,
+                          rows=len(by_id), wall_s=time.perf_counter() - t0)))
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--rows", type=int, default=200_000)
+    p.add_argument("--child", help=argparse.SUPPRESS)
+    args = p.parse_args()
+    if args.child:
+        return _child(args.child)
+
+    tmp = tempfile.mkdtemp(prefix="bench_memory_")
+    model = os.path.join(tmp, "model.joblib")
+    csv_path = os.path.join(tmp, "statement.csv")
+    _make_statement(csv_path, args.rows, random.Random(7))
+    _make_model(model)
+    per = 1_000_000 / args.rows
+    print(f"выписка {args.rows} строк, {os.path.getsize(csv_path) / 2**20:.1f} МБ CSV")
+    for lean in ("0", "1"):
+        env = dict(os.environ, LEAN_FRAMES=lean, MODEL_PATH=model, MEMORY_BACKEND="memory", ML_CACHE="0",
+                   DB_PATH=os.path.join(tmp, "mem.sqlite"))
+        out = subprocess.run([sys.executable, "-m", "bench.memory", "--child", csv_path], env=env,
+                             check=True, capture_output=True, text=True).stdout
+        r = json.loads(out.strip().splitlines()[-1])
+        grow = r["peak_mb"] - r["base_mb"]
+        print(f"  LEAN_FRAMES={lean}: пик RSS +{grow:,.0f} МБ ({grow * per:,.0f} МБ на 1 млн строк), "
+              f"df_scored {r['frame_mb']:,.0f} МБ ({r['frame_mb'] * per:,.0f} МБ на 1 млн), {r['wall_s']:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+# bench/network.py
+"""
+Сетевой риск на синтетическом графе: сборка CSR, холодный и тёплый пересчёт.
+
+    python -m bench.network --nodes 3000000 --edges 9000000
+
+Тёплый старт моделирует «следующую выписку»: меняется seed у --touched ИНН,
+итерации стартуют с прошлого r (как refresh_network_risk после прогона).
+"""
+import argparse, time
+
+import numpy as np
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--nodes", type=int, default=3_000_000)
+    p.add_argument("--edges", type=int, default=9_000_000)
+    p.add_argument("--touched", type=int, default=1000)
+    p.add_argument("--alpha", type=float, default=0.5)
+    args = p.parse_args()
+
+    from src.agent_lc.network import build_transition, propagate
+
+    rnd = np.random.default_rng(7)
+    n, m = args.nodes, args.edges
+    # «тяжёлый хвост» степеней: часть ИНН — хабы
+    src = (rnd.pareto(1.5, m) * 1000).astype(np.int64) % n
+    dst = rnd.integers(0, n, m)
+    cnt = rnd.integers(1, 20, m).astype(float)
+    amt = cnt * rnd.lognormal(11, 1.5, m)
+    seed = np.where(rnd.random(n) < 0.02, rnd.random(n), 0.0)
+
+    t0 = time.perf_counter()
+    P, deg = build_transition(src, dst, cnt, amt, n)
+    t_build = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    r, it_cold = propagate(P, deg, seed, args.alpha)
+    t_cold = time.perf_counter() - t0
+
+    touched = rnd.integers(0, n, args.touched)
+    seed2 = seed.copy()
+    seed2[touched] = rnd.random(args.touched)
+    t0 = time.perf_counter()
+    r2, it_warm = propagate(P, deg, seed2, args.alpha, r0=r)
+    t_warm = time.perf_counter() - t0
+
+    nbytes = P.data.nbytes + P.indices.nbytes + P.indptr.nbytes
+    print(f"[bench] граф: {n} ИНН, {m} рёбер, CSR {nbytes / 2**20:.0f} MB, сборка {t_build:.2f}s")
+    print(f"[bench] холодный пересчёт: {it_cold} итераций, {t_cold:.2f}s")
+    r_ref, _ = propagate(P, deg, seed2, args.alpha)
+    print(f"[bench] тёплый ({args.touched} ИНН изменились): {it_warm} итераций, {t_warm:.2f}s"
+          f" (расхождение с холодным {np.max(np.abs(r2 - r_ref)):.1e})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# bench/purpose_lsh.py
+"""
+Индекс назначений (MinHash/LSH) на синтетике: скорость вставки/поиска и чистота кластеров.
+
+    PYTHONPATH=. python -m bench.purpose_lsh --templates 20000 --variants 5 --probe 5000
+
+Шаблоны назначений — 3–5 общих слов («оплата», «поставка», «договор»…) и
+1–2 названия предмета из сгенерированного словаря; у каждого --variants
+вариантов с разными номерами/датами и мелкими правками (опечатка, лишнее
+слово). Индекс — во временном файле (PURPOSE_LSH_PATH). Пробы — новые
+варианты известных шаблонов: время поиска не должно расти с размером
+индекса. Качество — доля проб в кластере своего шаблона (полнота) и доля
+кластеров, смешавших разные шаблоны (ложные склейки); порог — PURPOSE_LSH_THRESHOLD.
+"""
+import argparse, os, random, tempfile, time
+
+
+WORDS = ("оплата поставка товар услуги договор счет аренда офиса склада транспортные подряд монтаж "
+         "оборудование консультационные агентское вознаграждение возврат займ проценты материалы ремонт "
+         "реализация продукция электроэнергия связь лицензия программное обеспечение обучение").split()
+
+
+SYLLABLES = "ка ро ми ст ла не ва то пр ин ре ко ле да ну си тек сер мат гор".split()
+
+
+def _names(rnd: random.Random, n: int):
+    """Названия предметов/договоров: сочетания слогов (в реальных назначениях словарь широкий)."""
+    return ["".join(rnd.choice(SYLLABLES) for _ in range(rnd.randint(2, 4))) for _ in range(n)]
+
+
+def _variant(rnd: random.Random, words, k: int) -> str:
+    w = list(words)
+    if k % 3 == 1:
+        w.insert(rnd.randrange(len(w) + 1), rnd.choice(("срочно", "частично", "окончательно")))
+    elif k % 3 == 2:
+        i = rnd.randrange(len(w))
+        w[i] = w[i][:-1] if len(w[i]) > 4 else w[i]
+    return (f"{' '.join(w)} по счету №{rnd.randint(1, 99999)} от {rnd.randint(1, 28):02d}."
+            f"{rnd.randint(1, 12):02d}.2024, в т.ч. НДС {rnd.randint(100, 99999)}")
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--templates", type=int, default=20_000)
+    p.add_argument("--variants", type=int, default=5)
+    p.add_argument("--probe", type=int, default=5_000)
+    p.add_argument("--chunk", type=int, default=10_000)
+    args = p.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ["PURPOSE_LSH_PATH"] = os.path.join(tmp, "purpose_lsh.sqlite")
+    os.environ["MEMORY_BACKEND"] = "sqlite"
+    from src.agent_lc import purpose_lsh
+
+    rnd = random.Random(7)
+    names = _names(rnd, 10_000)
+    templates = [rnd.sample(WORDS, rnd.randint(3, 5)) + rnd.sample(names, rnd.randint(1, 2))
+                 for _ in range(args.templates)]
+    texts = [(_variant(rnd, t, k), i) for i, t in enumerate(templates) for k in range(args.variants)]
+    rnd.shuffle(texts)
+
+    t0 = time.perf_counter()
+    templates_of = {}                   # кластер → шаблоны его текстов (чистота)
+    for i in range(0, len(texts), args.chunk):
+        part = texts[i:i + args.chunk]
+        t1 = time.perf_counter()
+        got = purpose_lsh.assign_clusters(t for t, _ in part)
+        for t, k in part:
+            templates_of.setdefault(got[t], set()).add(k)
+        dt = time.perf_counter() - t1
+        print(f"  индекс {i + len(part):>9} текстов: +{len(part)} за {dt:.2f}s ({len(part) / dt:,.0f}/s)")
+    build = time.perf_counter() - t0
+
+    probes = [(_variant(rnd, templates[i], rnd.randint(0, 2)), i)
+              for i in rnd.sample(range(args.templates), min(args.probe, args.templates))]
+    # кластер шаблона — по его первому варианту (как пришёл бы из истории)
+    ref = purpose_lsh.assign_clusters(_variant(random.Random(i), templates[i], 0) for _, i in probes)
+    ref_of = {i: ref[_variant(random.Random(i), templates[i], 0)] for _, i in probes}
+    t0 = time.perf_counter()
+    got = purpose_lsh.assign_clusters(t for t, _ in probes)
+    probe = time.perf_counter() - t0
+    hit = sum(got[t] == ref_of[i] for t, i in probes) / len(probes)
+
+    st = purpose_lsh.stats()
+    size = os.path.getsize(os.environ["PURPOSE_LSH_PATH"]) / 2**20
+    print(f"purpose_lsh: {len(texts)} текстов → {st['norms']} нормализованных, {st['clusters']} кластеров "
+          f"(шаблонов {args.templates}), {size:.1f} МБ, построение {build:.1f}s")
+    mixed = sum(len(v) > 1 for v in templates_of.values())
+    print(f"  кластеров с текстами разных шаблонов: {mixed} ({mixed / max(len(templates_of), 1):.2%})")
+    print(f"  поиск {len(probes)} новых вариантов: {probe:.2f}s ({len(probes) / probe:,.0f}/s), "
+          f"в кластере своего шаблона {hit:.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# bench/schema_v2.py
+"""
+Компактная схема памяти (v2) против исходной (v1): размер файла и скорость чтения.
+
+    python -m bench.schema_v2 --rows 1000000 --inns 100000 --probes 20000
+
+Строит v1-БД «как раньше» (ИНН/ts строками, purpose в каждой строке, половина
+ИНН с хвостом «.0» от pandas), замеряет, мигрирует её через mem_init() на месте
+и замеряет снова.
+"""
+import argparse, datetime as _dt, os, random, sqlite3, tempfile, time
+
+_SCHEMA_V1 = """
+    CREATE TABLE tx (tx_id TEXT PRIMARY KEY, ts TEXT, debit_inn TEXT, credit_inn TEXT, amount REAL, purpose TEXT);
+    CREATE TABLE decisions (tx_id TEXT PRIMARY KEY, p_ml REAL, p_prior REAL, p_llm REAL, p_final REAL,
+                            label_pred TEXT, is_suspicious INTEGER, rule_hits TEXT, reasons_llm TEXT, inserted_at TEXT);
+    CREATE TABLE agg_counterparty (inn TEXT PRIMARY KEY, cnt_total REAL, cnt_suspicious REAL, susp_rate REAL,
+                                   amt_total REAL, amt_suspicious REAL, last_seen_ts TEXT, watchlisted INTEGER DEFAULT 0,
+                                   p50 REAL, p75 REAL, p90 REAL, p95 REAL, llm_flags_total REAL DEFAULT 0,
+                                   llm_last_seen_ts TEXT);
+    CREATE TABLE llm_log (id INTEGER PRIMARY KEY AUTOINCREMENT, ts TEXT, endpoint TEXT, prompt TEXT, response TEXT, meta TEXT);
+    CREATE INDEX idx_tx_ts ON tx(ts);
+    CREATE INDEX idx_tx_debit ON tx(debit_inn);
+    CREATE INDEX idx_tx_credit ON tx(credit_inn);
+    CREATE INDEX idx_decisions_label ON decisions(label_pred);
+"""
+
+_PURPOSES = ["оплата по счету №{} от {:02d}.02.2024", "оплата по договору поставки №{} НДС не облагается",
+             "заработная плата за {} месяц", "аренда офиса по договору {} за {:02d} месяц",
+             "возврат займа по договору {}", "оплата услуг связи, лицевой счет {}"]
+
+
+def _days_since_v1(ts_str, now_ts):
+    """Как было: strptime на каждое чтение."""
+    if not ts_str:
+        return 1e6
+    dt = _dt.datetime.strptime(ts_str[:19], "%Y-%m-%d %H:%M:%S")
+    return max(0.0, (now_ts - dt.timestamp()) / 86400.0)
+
+
+def _build_v1(path, rows, n_inns, rnd):
+    con = sqlite3.connect(path)
+    con.executescript(_SCHEMA_V1)
+    inns = [7700000000 + i for i in range(n_inns)]
+    chunk, t0 = 100_000, time.time()
+    for start in range(0, rows, chunk):
+        tx, dec = [], []
+        for i in range(start, min(rows, start + chunk)):
+            d, c = rnd.choice(inns), rnd.choice(inns)
+            ts = f"2024-{1 + i % 12:02d}-{1 + i % 28:02d} {i % 24:02d}:{i % 60:02d}:00"
+            tpl = _PURPOSES[i % len(_PURPOSES)]
+            purpose = tpl.format(rnd.randrange(200), 1 + i % 12)
+            tx.append((str(i), ts, f"{d}.0" if i % 2 else str(d), str(c), float(rnd.randrange(1, 10**6)), purpose))
+            dec.append((str(i), .5, .5, .2, .5, "желтый", int(i % 7 == 0), "[]", "[]", ts))
+        con.executemany("INSERT INTO tx VALUES(?,?,?,?,?,?)", tx)
+        con.executemany("INSERT INTO decisions VALUES(?,?,?,?,?,?,?,?,?,?)", dec)
+        con.commit()
+    con.executemany("INSERT OR IGNORE INTO agg_counterparty(inn, cnt_total, last_seen_ts) VALUES(?,?,?)",
+                    [(str(i), 1.0, "2024-06-01 00:00:00") for i in inns])
+    con.commit(); con.close()
+    print(f"[bench] v1: {rows} tx построено за {time.time() - t0:.1f}s")
+    return [str(i) for i in inns]
+
+
+def _size_mb(path):
+    return sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p)) / 2**20
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--rows", type=int, default=1_000_000)
+    p.add_argument("--inns", type=int, default=100_000)
+    p.add_argument("--probes", type=int, default=20_000)
+    args = p.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix="bench_schema_"), "mem.sqlite")
+    os.environ["DB_PATH"] = path
+    rnd = random.Random(7)
+    inns = _build_v1(path, args.rows, args.inns, rnd)
+    probes = [rnd.choice(inns) for _ in range(args.probes)]
+    now = time.time()
+
+    con = sqlite3.connect(path)
+    size_v1 = _size_mb(path)
+    t0 = time.perf_counter()
+    for inn in probes:
+        r = con.execute("SELECT last_seen_ts, cnt_total FROM agg_counterparty WHERE inn=?", (inn,)).fetchone()
+        _days_since_v1(r[0] if r else None, now)
+        con.execute("SELECT amount, ts FROM tx WHERE debit_inn=? OR credit_inn=?", (inn, inn)).fetchall()
+    t_v1 = time.perf_counter() - t0
+    con.close()
+
+    from src.agent_lc.memory import mem_init, days_since, canon_inn
+    t0 = time.time()
+    mem_init()
+    t_mig = time.time() - t0
+
+    con = sqlite3.connect(path)
+    size_v2 = _size_mb(path)
+    t0 = time.perf_counter()
+    for inn in probes:
+        key = canon_inn(inn)
+        r = con.execute("SELECT last_seen_ts, cnt_total FROM agg_counterparty WHERE inn=?", (key,)).fetchone()
+        days_since(r[0] if r else None, now)
+        con.execute("SELECT amount, ts FROM tx_party WHERE inn=?", (key,)).fetchall()
+    t_v2 = time.perf_counter() - t0
+    con.close()
+
+    print(f"[bench] миграция v1→v2: {t_mig:.1f}s")
+    print(f"[bench] размер БД:   v1 {size_v1:.1f} MB → v2 {size_v2:.1f} MB ({100 * (1 - size_v2 / size_v1):.0f}% меньше)")
+    print(f"[bench] чтение ИНН:  v1 {1e3 * t_v1 / len(probes):.3f} ms → v2 {1e3 * t_v2 / len(probes):.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
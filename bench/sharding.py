@@ -0,0 +1,76 @@
+# bench/sharding.py
+"""
+Шардированный прогон против последовательного: время run_pipeline при разном числе воркеров.
+
+    python -m bench.sharding --rows 2000 --latency 0.2 --workers 1 2 4 8
+
+LLM подменяется заглушкой с фиксированной задержкой на пакет (как сетевой
+вызов), модель — маленький sklearn-пайплайн во временном каталоге, память —
+свежая БД на каждый прогон. Заглушка наследуется воркерами через fork (Linux).
+"""
+import argparse, csv, os, random, tempfile, time
+
+
+def _make_statement(path, rows, rnd):
+    inns = [7700000000 + i for i in range(max(50, rows // 20))]
+    with open(path, "w", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["id", "date", "debit_inn", "credit_inn", "credit_amount", "purpose"])
+        for i in range(rows):
+            d, c = rnd.sample(inns, 2)
+            w.writerow([i + 1, f"2024-{rnd.randint(1, 6):02d}-{rnd.randint(1, 28):02d} {rnd.randint(0, 23):02d}:00:00",
+                        d, c, rnd.choice([10000, 15000.5, 250000, 1234.56]), f"оплата по счету {i}"])
+
+
+def _make_model(path):
+    import joblib, numpy as np, pandas as pd
+    from sklearn.compose import ColumnTransformer
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import Pipeline
+    cols = ["amount", "round_amount", "anomaly_purpose", "dow", "hour", "transit_like"]
+    X = pd.DataFrame(np.random.rand(50, len(cols)), columns=cols)
+    y = np.arange(50) % 2
+    joblib.dump(Pipeline([("ct", ColumnTransformer([("num", "passthrough", cols)])),
+                          ("lr", LogisticRegression())]).fit(X, y), path)
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--rows", type=int, default=2000)
+    p.add_argument("--batch", type=int, default=10)
+    p.add_argument("--latency", type=float, default=0.2, help="секунд на один вызов LLM")
+    p.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = p.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench_sharding_")
+    os.environ["MODEL_PATH"] = os.path.join(tmp, "model.joblib")
+    os.environ["DB_PATH"] = os.path.join(tmp, "mem.sqlite")
+    os.environ["NETWORK_REFRESH"] = "0"
+    csv_path = os.path.join(tmp, "statement.csv")
+    _make_statement(csv_path, args.rows, random.Random(7))
+    _make_model(os.environ["MODEL_PATH"])
+
+    import src.agent_lc.tools as tools
+    from src.agent_lc import config, pipeline
+
+    def fake_call_llm(rows):
+        time.sleep(args.latency)
+        return {"overall_observation": "", "transactions": [
+            {"id": r["id"], "risk_label": "желтый", "risk_score": 0.5, "risk_explanation": "",
+             "recommendation": "", "flags": [], "primary_reasons": []} for r in rows]}
+    tools.call_llm = fake_call_llm
+
+    base = None
+    for w in args.workers:
+        if os.path.exists(config.DB_PATH):
+            os.remove(config.DB_PATH)
+        t0 = time.perf_counter()
+        res = pipeline.run_pipeline(csv_path, os.path.join(tmp, f"out_{w}.xlsx"),
+                                    llm_batch_size=args.batch, verbose=False, workers=w)
+        dt = time.perf_counter() - t0
+        base = base or dt
+        print(f"[bench] workers={w}: {dt:.1f}s  x{base / dt:.2f}  ({res['summary']['total']} tx)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# bench/startup.py
+"""
+Время запуска: импорт pipeline и cli.py --help, по `python -X importtime`.
+
+    PYTHONPATH=. python -m bench.startup
+    PYTHONPATH=. python -m bench.startup --max-import-ms 800 --max-help-ms 300   # регрессия → код 1
+
+Каждый замер — свежий процесс (лучший из --repeat). Печатается суммарное
+время импорта src.agent_lc.pipeline, самые дорогие модули и стена
+cli.py --help. Проверяется, что импорт pipeline не тянет отложенные стеки
+(langchain, GigaChat, requests, openpyxl, scipy, sklearn, joblib), а прогон
+без LLM (LLM_ENABLED=0, маленькая синтетическая выписка) — стек LLM.
+Нарушение или превышение порогов — код выхода 1.
+"""
+import argparse, json, os, subprocess, sys, tempfile, time
+
+# не должны импортироваться вместе с pipeline: грузятся на своём этапе
+LAZY = ("langchain", "langchain_core", "langchain_gigachat", "requests", "openpyxl", "scipy", "sklearn", "joblib")
+# не должны импортироваться прогоном без LLM
+LLM_STACK = ("langchain", "langchain_core", "langchain_gigachat", "requests", "src.agent_lc.llm")
+
+
+def _importtime(module: str, env: dict):
+    """→ (мс импорта module с зависимостями, {модуль верхнего уровня: собственные мс})."""
+    err = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], env=env,
+                         check=True, capture_output=True, text=True).stderr
+    total, own = None, {}
+    for line in err.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cum_us, name = (x.strip() for x in line[len("import time:"):].split("|"))
+        if not self_us.isdigit():
+            continue                                # заголовок
+        top = name.split(".")[0]
+        own[top] = own.get(top, 0) + int(self_us) / 1000
+        if name == module:
+            total = int(cum_us) / 1000
+    return total, own
+
+
+def _loaded(code: str, env: dict) -> set:
+    out = subprocess.run([sys.executable, "-c", code + "\nimport sys, json; print(json.dumps(sorted(sys.modules)))"],
+                         env=env, check=True, capture_output=True, text=True).stdout
+    return set(json.loads(out.strip().splitlines()[-1]))
+
+
+def _heavy(mods: set, names) -> list:
+    return sorted(n for n in names if n in mods)
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--top", type=int, default=8, help="самых дорогих пакетов в выводе")
+    p.add_argument("--max-import-ms", type=float, default=None, help="порог импорта pipeline")
+    p.add_argument("--max-help-ms", type=float, default=None, help="порог cli.py --help")
+    p.add_argument("--rows", type=int, default=200, help="строк выписки для прогона без LLM (0 — не проверять)")
+    args = p.parse_args()
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=root)
+    failed = []
+
+    runs = [_importtime("src.agent_lc.pipeline", env) for _ in range(args.repeat)]
+    total, own = min(runs, key=lambda r: r[0])
+    print(f"[startup] import src.agent_lc.pipeline: {total:.0f} мс (лучший из {args.repeat})")
+    for name, ms in sorted(own.items(), key=lambda kv: -kv[1])[:args.top]:
+        print(f"  {name:<24} {ms:7.1f} мс")
+    if args.max_import_ms is not None and total > args.max_import_ms:
+        failed.append(f"импорт pipeline {total:.0f} мс > {args.max_import_ms:.0f}")
+
+    walls = []
+    for _ in range(args.repeat):
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable, os.path.join(root, "cli.py"), "--help"], env=env, cwd=root,
+                       check=True, capture_output=True)
+        walls.append((time.perf_counter() - t0) * 1000)
+    print(f"[startup] cli.py --help: {min(walls):.0f} мс")
+    if args.max_help_ms is not None and min(walls) > args.max_help_ms:
+        failed.append(f"cli.py --help {min(walls):.0f} мс > {args.max_help_ms:.0f}")
+
+    eager = _heavy(_loaded("import src.agent_lc.pipeline", env), LAZY)
+    print(f"[startup] импорт pipeline тянет отложенное: {', '.join(eager) or '—'}")
+    if eager:
+        failed.append(f"импорт pipeline: {', '.join(eager)}")
+
+    if args.rows:
+        from bench.sharding import _make_model, _make_statement
+        import random
+        tmp = tempfile.mkdtemp(prefix="bench_startup_")
+        csv_path, model = os.path.join(tmp, "statement.csv"), os.path.join(tmp, "model.joblib")
+        _make_statement(csv_path, args.rows, random.Random(7))
+        _make_model(model)
+        code = (f"from src.agent_lc.pipeline import run_pipeline\n"
+                f"run_pipeline({csv_path!r}, {os.path.join(tmp, 'out.xlsx')!r}, verbose=False)")
+        ml_env = dict(env, LLM_ENABLED="0", MODEL_PATH=model, MEMORY_BACKEND="memory",
+                      DB_PATH=os.path.join(tmp, "mem.sqlite"), TRACE_DIR=os.path.join(tmp, "traces"))
+        t0 = time.perf_counter()
+        llm_mods = _heavy(_loaded(code, ml_env), LLM_STACK)
+        print(f"[startup] прогон без LLM ({args.rows} строк, {time.perf_counter() - t0:.1f}s) "
+              f"импортировал стек LLM: {', '.join(llm_mods) or '—'}")
+        if llm_mods:
+            failed.append(f"прогон без LLM: {', '.join(llm_mods)}")
+
+    if failed:
+        print("[startup] РЕГРЕССИЯ: " + "; ".join(failed))
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
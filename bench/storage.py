@@ -0,0 +1,68 @@
+# bench/storage.py
+"""
+Движки памяти (storage.py) на одних и тех же операциях: SQLite против in-memory.
+
+    python -m bench.storage --rows 50000 --decisions 5000
+
+Каждая операция интерфейса MemoryStore — предзагрузка выписки, пакетное и
+поштучное чтение агрегатов, upsert решений, полный пересчёт агрегатов, топ-N
+для отчёта. SQLite — свежая БД во временном каталоге.
+"""
+import argparse, os, random, tempfile, time
+
+
+def _statement(rows, rnd):
+    import pandas as pd
+    inns = [7700000000 + i for i in range(max(50, rows // 20))]
+    d = [rnd.choice(inns) for _ in range(rows)]
+    c = [rnd.choice(inns) for _ in range(rows)]
+    return pd.DataFrame({
+        "id": range(1, rows + 1),
+        "date": [f"2024-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d} 12:00:00" for _ in range(rows)],
+        "debit_inn": d, "credit_inn": c,
+        "amount": [round(rnd.lognormvariate(10, 1.5), 2) for _ in range(rows)],
+        "purpose": [f"оплата по счету {rnd.randint(1, 500)}" for _ in range(rows)],
+    }), inns
+
+
+def _run(store, df, inns, n_dec, rnd):
+    t = {}
+    t0 = time.perf_counter(); store.init(); store.bulk_preload(df); t["preload"] = time.perf_counter() - t0
+    t0 = time.perf_counter(); store.read_counterparties(inns); t["read batch"] = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for inn in inns[:1000]:
+        store.read_counterparty(inn)
+    t["read x1000"] = time.perf_counter() - t0
+    recs = df.sample(n_dec, random_state=1).to_dict("records")
+    t0 = time.perf_counter()
+    for r in recs:
+        store.upsert_decision(r, dict(p_ml=0.5, p_prior=0.1, p_llm=rnd.random(), p_final=0.5,
+                                      label_pred="желтый", is_suspicious=rnd.random() < 0.2))
+    t["upsert"] = time.perf_counter() - t0
+    t0 = time.perf_counter(); store.rebuild_aggregates(); t["rebuild"] = time.perf_counter() - t0
+    t0 = time.perf_counter(); top = store.top_counterparties(200); t["top200"] = time.perf_counter() - t0
+    return t, top
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--rows", type=int, default=50_000)
+    p.add_argument("--decisions", type=int, default=5_000)
+    args = p.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench_storage_")
+    os.environ["DB_PATH"] = os.path.join(tmp, "mem.sqlite")
+    from src.agent_lc.storage import SQLiteStore, InMemoryStore
+
+    df, inns = _statement(args.rows, random.Random(7))
+    res = {}
+    for name, cls in (("sqlite", SQLiteStore), ("memory", InMemoryStore)):
+        res[name], top = _run(cls(), df, inns, args.decisions, random.Random(3))
+        print(f"[bench] {name}: " + ", ".join(f"{k} {v:.3f}s" for k, v in res[name].items())
+              + f"  (топ: {top[0][0]} — {top[0][2]:.0f} подозр.)")
+    print("[bench] ускорение memory/sqlite: "
+          + ", ".join(f"{k} x{res['sqlite'][k] / max(res['memory'][k], 1e-9):.1f}" for k in res["sqlite"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# bench/tx_party.py
+"""
+Бенчмарк истории по ИНН: OR-скан по tx (как было) против tx_party.
+
+    python -m bench.tx_party --rows 10000000 --inns 200000 --probes 2000
+
+Строит временную БД (DB_PATH переопределяется до импорта memory), печатает
+EXPLAIN QUERY PLAN обоих вариантов и время на один ИНН. Для tx_party план
+обязан быть index-only (SEARCH ... USING PRIMARY KEY, без SCAN и без tx).
+Со схемы v2 индексов по debit_inn/credit_inn у tx нет — OR-вариант там полный
+скан, поэтому на больших --rows число --probes стоит уменьшить.
+
+10M tx / 200k ИНН / 200 проб (наполнение ~24 мин, БД ~1 ГБ):
+    OR + IN(decisions): 1711.957 ms/ИНН   (SCAN t)
+    tx_party (+JOIN):      0.314 ms/ИНН   (SEARCH p USING PRIMARY KEY)
+"""
+import argparse, os, random, tempfile, time
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--rows", type=int, default=10_000_000)
+    p.add_argument("--inns", type=int, default=200_000)
+    p.add_argument("--probes", type=int, default=2000)
+    p.add_argument("--db", default=None, help="путь к БД (по умолчанию — во временном каталоге)")
+    args = p.parse_args()
+
+    os.environ["DB_PATH"] = args.db or os.path.join(tempfile.mkdtemp(prefix="bench_tx_party_"), "mem.sqlite")
+    from src.agent_lc.memory import mem_init, _connect, _intern_purposes, _INSERT_TX, _PARTY_FROM_TX, to_epoch
+
+    mem_init()
+    con = _connect(); cur = con.cursor()
+    have = cur.execute("SELECT COUNT(*) FROM tx").fetchone()[0]
+    rnd = random.Random(42)
+    inns = [str(7700000000 + i) for i in range(args.inns)]
+
+    if have < args.rows:
+        t0 = time.time()
+        chunk = 200_000
+        for start in range(have, args.rows, chunk):
+            n = min(chunk, args.rows - start)
+            rows, dec = [], []
+            for i in range(start, start + n):
+                # «тяжёлый хвост»: часть ИНН встречается очень часто
+                d = inns[int(rnd.paretovariate(1.2)) % args.inns]
+                c = inns[rnd.randrange(args.inns)]
+                ts = to_epoch(f"2024-{1 + i % 12:02d}-{1 + i % 28:02d} {i % 24:02d}:00:00")
+                rows.append((str(i), ts, d, c, float(rnd.randrange(1, 10**6)), "оплата"))
+                if i % 3 == 0:
+                    dec.append((str(i), 0.5, 0.5, 0.2, 0.5, "желтый", int(i % 9 == 0), "[]", "[]", ts))
+            # та же вставка, что в memory.py: назначение — через словарь purpose_dict
+            _intern_purposes(cur, ["оплата"])
+            cur.executemany(_INSERT_TX, rows)
+            cur.executemany("""INSERT OR IGNORE INTO decisions(tx_id,p_ml,p_prior,p_llm,p_final,label_pred,
+                                   is_suspicious,rule_hits,reasons_llm,inserted_at)
+                               VALUES(?,?,?,?,?,?,?,?,?,?)""", dec)
+            con.commit()
+        cur.execute("DELETE FROM tx_party")
+        cur.execute(_PARTY_FROM_TX.format(where=""))
+        con.commit()
+        print(f"[bench] наполнение {args.rows} tx: {time.time() - t0:.1f}s")
+
+    q_or = """SELECT t.tx_id, t.amount, t.ts FROM tx t WHERE t.debit_inn = ? OR t.credit_inn = ?"""
+    q_party = """SELECT p.tx_id, p.amount, p.ts, d.is_suspicious, d.p_llm
+                   FROM tx_party p LEFT JOIN decisions d ON d.tx_id = p.tx_id
+                  WHERE p.inn = ?"""
+
+    print("[plan] OR-скан:")
+    for r in cur.execute("EXPLAIN QUERY PLAN " + q_or, ("x", "x")):
+        print("   ", r[-1])
+    print("[plan] tx_party:")
+    plan = [r[-1] for r in cur.execute("EXPLAIN QUERY PLAN " + q_party, ("x",))]
+    for line in plan:
+        print("   ", line)
+    party_line = next(l for l in plan if " p " in f" {l} ")
+    assert "USING PRIMARY KEY" in party_line or "COVERING INDEX" in party_line, "tx_party: план не index-only"
+    assert not any(l.startswith("SCAN") for l in plan), "tx_party: полный скан в плане"
+
+    probes = [inns[rnd.randrange(args.inns)] for _ in range(args.probes)]
+
+    t0 = time.perf_counter()
+    for inn in probes:
+        rows = cur.execute(q_or, (inn, inn)).fetchall()
+        ids = [r[0] for r in rows]
+        for i in range(0, len(ids), 900):
+            part = ids[i:i + 900]
+            cur.execute(f"SELECT tx_id, is_suspicious, p_llm FROM decisions WHERE tx_id IN ({','.join('?' * len(part))})",
+                        part).fetchall()
+    t_or = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for inn in probes:
+        cur.execute(q_party, (inn,)).fetchall()
+    t_party = time.perf_counter() - t0
+
+    con.close()
+    print(f"[bench] OR + IN(decisions): {1000 * t_or / len(probes):.3f} ms/ИНН")
+    print(f"[bench] tx_party (+JOIN):   {1000 * t_party / len(probes):.3f} ms/ИНН  (x{t_or / max(t_party, 1e-9):.1f})")
+
+
+if __name__ == "__main__":
+    main()
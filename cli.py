@@ -1,14 +1,56 @@
-import argparse, os
-from src.agent_lc.pipeline import run_pipeline
+import argparse, datetime, os
+
+def _deadline_s(value):
+    """'3600' → 3600 с; '06:30' → секунд до ближайших 06:30 по местному времени."""
+    if value is None:
+        return None
+    if ":" not in value:
+        return float(value)
+    now = datetime.datetime.now()
+    hh, mm = (int(x) for x in value.split(":"))
+    at = now.replace(hour=hh, minute=mm, second=0, microsecond=0)
+    if at <= now:
+        at += datetime.timedelta(days=1)
+    return (at - now).total_seconds()
 
 def main():
     p = argparse.ArgumentParser()
     p.add_argument("--csv", default="data/sample_transactions.csv")
     p.add_argument("--out", default="reports/risk_report.xlsx")
+    p.add_argument("--workers", type=int, default=None, help="процессов для шардированного прогона (PIPELINE_WORKERS)")
+    p.add_argument("--resume", action="store_true", help="продолжить прерванный прогон той же выписки")
+    p.add_argument("--two-phase", action="store_true", default=None,
+                   help="сначала отчёт без LLM, затем дополнить его ответами LLM (TWO_PHASE)")
+    p.add_argument("--deadline", default=None,
+                   help="срок LLM-этапа: секунд от старта или ЧЧ:ММ (LLM_DEADLINE_S); остаток — без LLM")
+    p.add_argument("--token-budget", type=int, default=None, help="предел токенов LLM на прогон (LLM_TOKEN_BUDGET)")
+    p.add_argument("--no-llm", dest="llm", action="store_false", default=None,
+                   help="только ML + prior + правила, без LLM (LLM_ENABLED=0)")
+    sub = p.add_subparsers(dest="cmd")
+    b = sub.add_parser("batch", help="много выписок одним процессом: модель и клиент LLM загружаются один раз")
+    b.add_argument("sources", nargs="+", help="каталоги (*.csv), маски (data/**/*.csv) или файлы выписок")
+    b.add_argument("--out-dir", default="reports/batch", help="отчёты по выпискам и batch_summary.xlsx")
+    b.add_argument("--jobs", type=int, default=4, help="выписок одновременно (потоки)")
+    b.add_argument("--llm-concurrency", type=int, default=None,
+                   help="одновременных запросов к LLM на все выписки (LLM_CONCURRENCY; 0 — без предела)")
+    b.add_argument("--retries", type=int, default=0, help="повторов упавшей выписки (с продолжением прогона)")
+    b.add_argument("--on-error", choices=("continue", "stop"), default="continue",
+                   help="после неудачи выписки: идти дальше или не начинать новые")
+    b.add_argument("--batch-size", type=int, default=10, help="строк в пакете LLM")
     args = p.parse_args()
+    if args.cmd == "batch":
+        from src.agent_lc.batch import run_batch
+        res = run_batch(args.sources, args.out_dir, jobs=args.jobs, llm_concurrency=args.llm_concurrency,
+                        on_error=args.on_error, retries=args.retries, llm_batch_size=args.batch_size)
+        raise SystemExit(1 if res["summary"]["failed"] else 0)
+    from src.agent_lc.pipeline import run_pipeline     # после разбора аргументов: --help — без pandas/модели
     os.makedirs(os.path.dirname(args.out), exist_ok=True)
-    res = run_pipeline(args.csv, args.out)
+    res = run_pipeline(args.csv, args.out, workers=args.workers, resume=args.resume, two_phase=args.two_phase,
+                       deadline_s=_deadline_s(args.deadline), token_budget=args.token_budget, llm=args.llm)
+    phase = res.pop("llm_phase", None)
     print(res)
+    if phase is not None:
+        print(phase.result())
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,91 @@
+# src/agent_lc/amounts.py
+"""
+Аномалия суммы относительно привычных сумм контрагента (вместо заглушки anomaly_amount = 0).
+
+Профиль ИНН — квантили p50/p75 его сумм на момент операции (history.AsOfHistory):
+история из памяти (одним пакетным запросом на всю выписку) плюс строки самой
+выписки, срез строго до ts строки. Так профиль не видит ни саму операцию, ни
+более поздние, даже если выписка (или пересекающаяся) уже загружалась в память.
+Суммы платежей распределены примерно лог-нормально, поэтому оценка робастная
+в лог-шкале:
+
+    z = (ln a − ln p50) / σ,   σ = (ln p75 − ln p50) / 0.6745
+
+(p75 − p50 — половина IQR, для нормального ≈ 0.6745σ). Интересен только
+«слишком большой» платёж: score = clip((z − 1) / 3, 0, 1), т.е. z ≥ 2.8
+даёт ≥ 0.6 (флаг amount_anomaly_strong). Берём максимум по дебету и кредиту.
+"""
+from typing import Optional, Tuple
+import numpy as np
+import pandas as pd
+
+from .storage import get_store
+from .history import AsOfHistory, canon_inn_array, statement_ts
+
+_EVENT_COLS = ["inn", "ts", "amount", "susp", "p_llm", "tx_id"]
+MIN_HISTORY = 5                # меньше операций в истории — профиля нет, аномалию не считаем
+_MIN_LOG_SIGMA = 0.25          # нижняя граница σ: у «однообразных» ИНН p75 == p50
+
+
+def load_amount_profiles(df: pd.DataFrame) -> Optional[Tuple[pd.DataFrame, dict]]:
+    """
+    История сумм всех ИНН выписки из памяти одним запросом → (события, архив) для as-of
+    профилей в add_amount_anomaly. None — в памяти по ним ничего нет.
+    """
+    if "debit_inn" not in df.columns or "credit_inn" not in df.columns:
+        return None
+    inns = np.unique(np.concatenate([canon_inn_array(df["debit_inn"]), canon_inn_array(df["credit_inn"])]))
+    inns = inns[inns != 0]
+    if not len(inns):
+        return None
+    events, archive = get_store().read_party_history(inns.tolist())
+    if not events and not archive:
+        return None
+    return pd.DataFrame(events, columns=_EVENT_COLS), archive
+
+
+def amount_score(amount: np.ndarray, cnt: np.ndarray, p50: np.ndarray, p75: np.ndarray) -> np.ndarray:
+    """Оценка 0..1 по лог-робастному z; NaN-профиль / мало истории → 0."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        la, l50, l75 = np.log(amount), np.log(p50), np.log(p75)
+        sigma = np.maximum((l75 - l50) / 0.6745, _MIN_LOG_SIGMA)
+        z = (la - l50) / sigma
+    ok = (amount > 0) & (p50 > 0) & (p75 > 0) & (cnt >= MIN_HISTORY) & np.isfinite(z)
+    return np.where(ok, np.clip((z - 1.0) / 3.0, 0.0, 1.0), 0.0)
+
+
+def _profile_history(df: pd.DataFrame, d: np.ndarray, c: np.ndarray, ts: np.ndarray, amount: np.ndarray,
+                     profiles: Optional[Tuple[pd.DataFrame, dict]]) -> AsOfHistory:
+    """Строки выписки + история из памяти без них (по tx_id) → AsOfHistory с p50/p75."""
+    self_tx = d == c                                 # платёж «сам себе» — один раз
+    inn = np.concatenate([d, c[~self_tx]])
+    at = np.nan_to_num(np.concatenate([ts, ts[~self_tx]]), nan=0.0).astype(np.int64)   # без даты — 0, как в памяти
+    amt = np.concatenate([amount, amount[~self_tx]])
+    archive = {}
+    if profiles is not None:
+        events, archive = profiles
+        if len(events):
+            own = df["tx_id"] if "tx_id" in df.columns else df["id"]
+            h = events[~events["tx_id"].astype(str).isin(own.astype(str))]
+            inn = np.concatenate([inn, h["inn"].to_numpy(dtype=np.int64)])
+            at = np.concatenate([at, h["ts"].fillna(0).to_numpy(dtype=np.int64)])
+            amt = np.concatenate([amt, h["amount"].fillna(0.0).to_numpy(dtype=float)])
+    ok = inn != 0
+    zeros = np.zeros(int(ok.sum()), dtype=np.int64)
+    return AsOfHistory(inn[ok], at[ok], amt[ok], zeros, zeros, archive, quantiles=(50, 75), decay=False)
+
+
+def add_amount_anomaly(df: pd.DataFrame, profiles: Optional[Tuple[pd.DataFrame, dict]] = None) -> pd.DataFrame:
+    """anomaly_amount: профиль p50/p75 каждого ИНН строки — на момент её ts (profiles — load_amount_profiles)."""
+    n = len(df)
+    score = np.zeros(n)
+    if n:
+        amount = pd.to_numeric(df["amount"], errors="coerce").fillna(0.0).to_numpy(dtype=float)
+        d, c = canon_inn_array(df["debit_inn"]), canon_inn_array(df["credit_inn"])
+        ts = statement_ts(df)
+        hist = _profile_history(df, d, c, ts, amount, profiles)
+        for inns in (d, c):
+            h = hist.lookup(inns, ts)
+            score = np.maximum(score, amount_score(amount, h["cnt_total"], h["p50"], h["p75"]))
+    df["anomaly_amount"] = score
+    return df
@@ -0,0 +1,150 @@
+# src/agent_lc/batch.py
+"""
+Пакетный прогон выписок (cli.py batch): конец месяца, сотни выписок филиалов.
+
+Отдельный процесс на выписку каждый раз заново грузит модель и проходит
+OAuth GigaChat. Здесь все выписки идут в одном процессе:
+
+  * модель загружается один раз (model.load_artifacts кэширует по файлу),
+    клиент LLM — один на процесс (llm._get_llm);
+  * выписки обрабатываются параллельно в --jobs потоках (LLM-этап — ожидание
+    сети), а одновременных запросов к LLM не больше --llm-concurrency на все
+    потоки сразу (llm.set_concurrency, LLM_CONCURRENCY);
+  * отчёт — на каждую выписку (<out-dir>/<имя>.xlsx), плюс общая сводка
+    <out-dir>/batch_summary.xlsx: статус, метки, вызовы/токены LLM, время;
+  * упавшая выписка повторяется --retries раз (с --resume: готовые пакеты
+    LLM не отправляются заново), затем --on-error: continue — остальные
+    идут дальше, stop — новые не начинаются (уже идущие доигрываются),
+    оставшиеся — skipped.
+
+Каждая выписка — обычный последовательный run_pipeline (workers=1, без
+двухфазности): шардирование внутри потока форкало бы процессы из потоков.
+С эфемерной памятью (MEMORY_BACKEND=memory) выписки идут по одной: хеш-таблицы
+InMemoryStore и его индекс назначений не рассчитаны на запись из нескольких потоков.
+"""
+import glob, os, threading, time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, Iterable, List, Optional
+
+import pandas as pd
+
+from .config import LLM_CONCURRENCY, LLM_ENABLED
+
+ON_ERROR = ("continue", "stop")
+
+
+def find_statements(sources: Iterable[str]) -> List[str]:
+    """Каталоги (все *.csv в них), маски (glob, ** — рекурсивно) и файлы → пути выписок без повторов."""
+    out: List[str] = []
+    for src in sources:
+        if os.path.isdir(src):
+            found = sorted(glob.glob(os.path.join(src, "*.csv")))
+        elif glob.has_magic(src):
+            found = sorted(p for p in glob.glob(src, recursive=True) if os.path.isfile(p))
+        else:
+            found = [src]
+        out.extend(os.path.abspath(p) for p in found)
+    return list(dict.fromkeys(out))
+
+
+def _report_paths(csvs: List[str], out_dir: str) -> Dict[str, str]:
+    """<имя выписки>.xlsx; одинаковые имена из разных каталогов — с суффиксом _2, _3…"""
+    taken, out = set(), {}
+    for p in csvs:
+        stem = os.path.splitext(os.path.basename(p))[0]
+        name, k = stem, 1
+        while name.lower() in taken:
+            k += 1
+            name = f"{stem}_{k}"
+        taken.add(name.lower())
+        out[p] = os.path.join(out_dir, f"{name}.xlsx")
+    return out
+
+
+def _row(csv_path: str, report: str) -> Dict[str, Any]:
+    return dict(csv=csv_path, status="skipped", report=report, total=None, red=None, yellow=None, green=None,
+                llm_calls=None, prompt_tokens=None, completion_tokens=None, rows_shared=None, rows_cached=None,
+                wall_s=None, attempts=0, error="")
+
+
+def run_batch(sources: Iterable[str], out_dir: str, jobs: int = 4, llm_concurrency: Optional[int] = None,
+              on_error: str = "continue", retries: int = 0, llm_batch_size: int = 10,
+              verbose: bool = True) -> Dict[str, Any]:
+    """
+    → {"statements": [строка сводки на выписку], "summary": итоги, "xlsx": путь сводки}.
+    llm_concurrency — None: LLM_CONCURRENCY (0 — без предела).
+    """
+    from .model import load_artifacts
+    from .pipeline import run_pipeline
+    from .storage import get_store
+
+    if on_error not in ON_ERROR:
+        raise ValueError(f"on_error={on_error!r}: ожидается одно из {ON_ERROR}")
+    csvs = find_statements(sources)
+    if not csvs:
+        raise FileNotFoundError(f"Нет выписок: {', '.join(sources)}")
+    os.makedirs(out_dir, exist_ok=True)
+    reports = _report_paths(csvs, out_dir)
+    rows = {p: _row(p, reports[p]) for p in csvs}
+    jobs = max(1, int(jobs))
+    if jobs > 1 and not get_store().shared:
+        if verbose:
+            print(f"[batch] память {type(get_store()).__name__} — одна на процесс без блокировок, выписки по одной")
+        jobs = 1
+
+    if LLM_ENABLED:
+        from . import llm
+        llm.set_concurrency(LLM_CONCURRENCY if llm_concurrency is None else llm_concurrency)
+    load_artifacts()                    # модель — один раз до потоков (дальше из кэша процесса)
+    stop = threading.Event()
+    t_batch = time.perf_counter()
+
+    def one(p: str) -> Dict[str, Any]:
+        r = rows[p]
+        if stop.is_set():
+            return r
+        t0 = time.perf_counter()
+        for attempt in range(retries + 1):
+            r["attempts"] = attempt + 1
+            try:
+                res = run_pipeline(p, r["report"], llm_batch_size=llm_batch_size, verbose=False, workers=1,
+                                   resume=attempt > 0, two_phase=False)
+            except Exception as e:
+                r.update(status="failed", error=f"{type(e).__name__}: {e}")
+                continue
+            u = res["llm_usage"]
+            r.update(status="ok", error="", report=res["xlsx"], **{k: res["summary"].get(k) for k in
+                     ("total", "red", "yellow", "green")},
+                     llm_calls=u.get("calls"), prompt_tokens=u.get("prompt_tokens"),
+                     completion_tokens=u.get("completion_tokens"), rows_shared=u.get("rows_shared"),
+                     rows_cached=u.get("rows_cached"))
+            break
+        r["wall_s"] = round(time.perf_counter() - t0, 2)
+        if r["status"] == "failed" and on_error == "stop":
+            stop.set()
+        return r
+
+    with ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="agent-lc-batch") as pool:
+        futures = [pool.submit(one, p) for p in csvs]
+        for i, f in enumerate(as_completed(futures), 1):
+            r = f.result()
+            if verbose and r["status"] != "skipped":
+                tail = (f"{r['red']}/{r['yellow']}/{r['green']} из {r['total']}, LLM {r['llm_calls']} выз."
+                        if r["status"] == "ok" else r["error"])
+                print(f"[batch] {i}/{len(csvs)} {r['status']:<6} {os.path.basename(r['csv'])}: {tail} "
+                      f"({r['wall_s']}s)")
+
+    table = pd.DataFrame([rows[p] for p in csvs])
+    ok = table[table["status"] == "ok"]
+    summary = dict(statements=len(table), **{s: int((table["status"] == s).sum()) for s in ("ok", "failed", "skipped")},
+                   **{k: int(ok[k].sum()) for k in ("total", "red", "yellow", "green", "llm_calls",
+                                                   "prompt_tokens", "completion_tokens")},
+                   wall_s=round(time.perf_counter() - t_batch, 2))
+    xlsx = os.path.join(out_dir, "batch_summary.xlsx")
+    with pd.ExcelWriter(xlsx, engine="openpyxl") as w:
+        table.to_excel(w, sheet_name="statements", index=False)
+        pd.DataFrame([summary]).to_excel(w, sheet_name="totals", index=False)
+    if verbose:
+        print(f"[batch] выписок {summary['statements']}: ok {summary['ok']}, failed {summary['failed']}, "
+              f"skipped {summary['skipped']} за {summary['wall_s']}s → {xlsx}")
+    return {"statements": table.to_dict("records"), "summary": summary, "xlsx": xlsx}
@@ -0,0 +1,135 @@
+# src/agent_lc/chains.py
+"""
+Транзитные цепочки: деньги пришли A → B и в течение окна ушли дальше B → C
+примерно той же суммой (не больше пришедшей, с допуском на комиссию).
+
+Граф — рёбра debit_inn → credit_inn (выписка + история tx из памяти),
+упорядоченные по времени. Входящие рёбра проиндексированы по ключу
+(credit_inn, корзина log-суммы): для исходящего ребра B → C с суммой a
+подходящие входящие лежат ровно в двух корзинах (своей и соседней сверху),
+поэтому поиск предшественника — searchsorted по отсортированному ключу,
+без попарного перебора. Каждое ребро получает не больше одного
+предшественника и одного последователя, цепочки собираются pointer jumping.
+
+Для строк выписки в цепочках из 2+ рёбер заполняются:
+  chain_id             — id первой операции цепочки ("chain:<tx_id>")
+  chain_length         — число операций в цепочке
+  chain_duration_hours — от первой до последней операции
+Остальным строкам — None (как было).
+"""
+from typing import Optional
+import numpy as np
+import pandas as pd
+
+from .config import CHAIN_WINDOW_HOURS, CHAIN_AMOUNT_TOL
+from .frequency import _build_events
+
+_LOOKBACK = 4          # сколько последних входящих рёбер в корзине проверяем на сумму/окно
+
+
+def _event_ids(df: pd.DataFrame, history: Optional[pd.DataFrame]) -> np.ndarray:
+    """tx_id событий в порядке _build_events (выписка, затем история без дублей)."""
+    own = (df["tx_id"] if "tx_id" in df.columns else df["id"]).astype(str)
+    ids = own.to_numpy(dtype=object)
+    if history is not None and len(history):
+        h = history["tx_id"].astype(str)
+        ids = np.concatenate([ids, h[~h.isin(own)].to_numpy(dtype=object)])
+    return ids
+
+
+def link_chains(d: np.ndarray, c: np.ndarray, ts: np.ndarray, amount: np.ndarray,
+                window_hours: float = CHAIN_WINDOW_HOURS, tol: float = CHAIN_AMOUNT_TOL):
+    """
+    Для каждого ребра — индекс предшественника в цепочке (-1, если нет).
+    d/c — int64-ИНН (0 = неизвестен), ts — epoch (NaN = без даты), amount > 0.
+    """
+    n = len(d)
+    pred = np.full(n, -1, dtype=np.int64)
+    ok = (d != 0) & (c != 0) & (d != c) & ~np.isnan(ts) & (amount > 0)
+    if ok.sum() < 2:
+        return pred
+
+    idx = np.flatnonzero(ok)
+    e_d, e_c, e_ts, e_amt = d[idx], c[idx], ts[idx].astype(np.int64), amount[idx]
+    m = len(idx)
+    # ранг по времени (ts, затем порядок) — рёбра цепочки строго возрастают по рангу, циклов нет
+    order = np.lexsort((np.arange(m), e_ts))
+    rank = np.empty(m, dtype=np.int64)
+    rank[order] = np.arange(m)
+
+    # корзины log-суммы шириной -ln(1-tol): a_in ∈ [a_out, a_out/(1-tol)] → корзина b или b+1
+    width = -np.log1p(-tol)
+    bucket = np.floor(np.log(e_amt) / width).astype(np.int64)
+    bucket -= bucket.min()
+    nb = int(bucket.max()) + 2
+    inn_code, _ = pd.factorize(np.concatenate([e_d, e_c]))
+    dc, cc = inn_code[:m].astype(np.int64), inn_code[m:].astype(np.int64)
+    if (int(inn_code.max()) + 1) * nb * m >= 2 ** 62:
+        raise ValueError("chains: слишком большой ключ индекса")
+
+    # индекс входящих рёбер: (credit_inn, корзина) → по рангу
+    in_key = (cc * nb + bucket) * m + rank
+    in_sort = np.argsort(in_key)
+    keys = in_key[in_sort]
+
+    best = np.full(m, -1, dtype=np.int64)          # локальный индекс предшественника
+    best_rank = np.full(m, -1, dtype=np.int64)
+    win = int(window_hours * 3600)
+    for db in (0, 1):
+        g = dc * nb + bucket + db
+        top = np.searchsorted(keys, g * m + rank, side="left") - 1     # последний в группе с рангом < своего
+        for k in range(_LOOKBACK):
+            p = top - k
+            valid = p >= 0
+            cand = in_sort[np.maximum(p, 0)]
+            valid &= (keys[np.maximum(p, 0)] // m) == g
+            valid &= (e_ts - e_ts[cand]) <= win
+            valid &= (e_amt <= e_amt[cand]) & (e_amt >= e_amt[cand] * (1 - tol))
+            take = valid & (rank[cand] > best_rank)
+            best = np.where(take, cand, best)
+            best_rank = np.where(take, rank[cand], best_rank)
+
+    # у входящего ребра — один последователь: самый ранний из претендентов
+    has = np.flatnonzero(best >= 0)
+    if len(has):
+        o = np.lexsort((rank[has], best[has]))
+        has = has[o]
+        first = np.r_[True, best[has][1:] != best[has][:-1]]
+        keep = has[first]
+        pred[idx[keep]] = idx[best[keep]]
+    return pred
+
+
+def chain_roots(pred: np.ndarray) -> np.ndarray:
+    """Голова цепочки для каждого ребра (pointer jumping, O(n log L))."""
+    root = np.where(pred >= 0, pred, np.arange(len(pred)))
+    while True:
+        nxt = root[root]
+        if np.array_equal(nxt, root):
+            return root
+        root = nxt
+
+
+def add_chain_features(df: pd.DataFrame, history: Optional[pd.DataFrame] = None,
+                       window_hours: float = CHAIN_WINDOW_HOURS, tol: float = CHAIN_AMOUNT_TOL) -> pd.DataFrame:
+    n = len(df)
+    d, c, ts, amt = _build_events(df, history)
+    ids = _event_ids(df, history)
+    pred = link_chains(d, c, ts, amt, window_hours, tol)
+    root = chain_roots(pred)
+
+    size = np.bincount(root, minlength=len(root))
+    t = np.where(np.isnan(ts), 0.0, ts)
+    last = pd.Series(t).groupby(root).transform("max").to_numpy()
+    r = root[:n]
+    in_chain = size[r] >= 2
+
+    # object + None, как прежние заглушки: downstream проверяет `is not None`
+    cid = np.full(n, None, dtype=object)
+    cln = np.full(n, None, dtype=object)
+    cdur = np.full(n, None, dtype=object)
+    cid[in_chain] = ["chain:" + x for x in ids[r[in_chain]]]
+    cln[in_chain] = size[r[in_chain]].tolist()
+    cdur[in_chain] = ((last[:n] - t[r])[in_chain] / 3600.0).tolist()
+    df["chain_id"], df["chain_length"], df["chain_duration_hours"] = cid, cln, cdur
+    return df
@@ -8,10 +8,12 @@ MODEL_PATH = os.getenv("MODEL_PATH", "models/best_pipeline_A_base__HGB.joblib")
 LE_PATH    = os.getenv("LE_PATH", "models/label_encoder_risk.joblib")
 DB_PATH    = os.getenv("DB_PATH", "db/agent_memory.sqlite")
 
+# движок памяти (storage.py): sqlite — постоянная БД в DB_PATH, memory — эфемерная в процессе
+MEMORY_BACKEND = os.getenv("MEMORY_BACKEND", "sqlite").strip().lower()
+
 MODEL_PATH = os.path.abspath(MODEL_PATH)
 LE_PATH    = os.path.abspath(LE_PATH)
 DB_PATH    = os.path.abspath(DB_PATH)
-os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
 
 # веса финальной смеси
 W_ML   = float(os.getenv("W_ML", 0.6))
@@ -22,3 +24,69 @@ THRESH = float(os.getenv("THRESH", 0.5))
 # llm
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o-mini")
+
+# retention памяти (см. retention.py)
+RETENTION_DAYS         = int(os.getenv("RETENTION_DAYS", 365))
+LLM_LOG_RETENTION_DAYS = int(os.getenv("LLM_LOG_RETENTION_DAYS", 90))
+ARCHIVE_DIR            = os.path.abspath(os.getenv("ARCHIVE_DIR", "db/archive"))
+
+# as-of история контрагентов (history.py): PRIOR без «заглядывания в будущее»
+ASOF_HISTORY = os.getenv("ASOF_HISTORY", "1") == "1"
+
+# затухающие агрегаты контрагента (memory.py): вес операции падает вдвое за DECAY_HALF_LIFE_DAYS суток
+# (не меньше суток); PRIOR_DECAY — PRIOR по ним (доля и число подозрительных с учётом давности)
+DECAY_HALF_LIFE_DAYS = max(1.0, float(os.getenv("DECAY_HALF_LIFE_DAYS", 90)))
+PRIOR_DECAY          = os.getenv("PRIOR_DECAY", "1") == "1"
+
+# транзитные цепочки (chains.py): окно перевода дальше и допуск суммы (комиссия/удержание)
+CHAIN_WINDOW_HOURS = float(os.getenv("CHAIN_WINDOW_HOURS", 72))
+CHAIN_AMOUNT_TOL   = float(os.getenv("CHAIN_AMOUNT_TOL", 0.05))
+
+# сетевой риск контрагентов (network.py): personalized PageRank по графу платежей
+NETWORK_ALPHA    = float(os.getenv("NETWORK_ALPHA", 0.5))
+NETWORK_TOL      = float(os.getenv("NETWORK_TOL", 1e-5))   # ошибка ≤ tol/(1-α) — меньше порога записи 1e-4
+NETWORK_MAX_ITER = int(os.getenv("NETWORK_MAX_ITER", 100))
+NETWORK_REFRESH  = os.getenv("NETWORK_REFRESH", "1") == "1"
+
+# телеметрия прогона (telemetry.py): JSON-трассы спанов; METRICS_TEXTFILE — Prometheus textfile (пусто — не писать)
+TRACE_DIR        = os.path.abspath(os.getenv("TRACE_DIR", "logs/traces"))
+METRICS_TEXTFILE = os.getenv("METRICS_TEXTFILE", "")
+
+# бюджет LLM-этапа (scheduler.py): срок, секунд от начала прогона, и/или токены; 0 — без предела.
+# С бюджетом строки идут в LLM по приоритету, остаток решается без LLM (llm_status=skipped)
+LLM_DEADLINE_S   = float(os.getenv("LLM_DEADLINE_S", 0))
+LLM_TOKEN_BUDGET = int(os.getenv("LLM_TOKEN_BUDGET", 0))
+
+# схлопывание равнозначных строк перед LLM (dedupe.py): одна строка группы в LLM, остальным — её ответ;
+# LLM_DEDUPE_AMOUNT_TOL — ширина корзины суммы (относительная)
+LLM_DEDUPE            = os.getenv("LLM_DEDUPE", "1") == "1"
+LLM_DEDUPE_AMOUNT_TOL = float(os.getenv("LLM_DEDUPE_AMOUNT_TOL", 0.05))
+
+# кластеры назначений (purpose_lsh.py, MinHash/LSH) и кэш объяснений LLM по профилю × кластеру;
+# PURPOSE_LSH_PATH пусто — рядом с DB_PATH; THRESHOLD — оценка Жаккара для попадания в кластер
+PURPOSE_LSH           = os.getenv("PURPOSE_LSH", "1") == "1"
+PURPOSE_LSH_PATH      = os.getenv("PURPOSE_LSH_PATH", "")
+PURPOSE_LSH_THRESHOLD = float(os.getenv("PURPOSE_LSH_THRESHOLD", 0.7))
+
+# двухфазный прогон (pipeline.py): отчёт без LLM сразу, LLM-фаза — в фоновом потоке
+TWO_PHASE = os.getenv("TWO_PHASE", "0") == "1"
+
+# кэш ml_metric (model.predict_with_pipeline): по отпечатку файла модели и хешу признаков строки
+ML_CACHE = os.getenv("ML_CACHE", "1") == "1"
+
+# экономный по памяти вид выписки (frames.py): category для контрагентов/ИНН/счетов/типов,
+# сужение чисел без потерь, признаки и ml_metric — в тот же DataFrame без копий
+LEAN_FRAMES = os.getenv("LEAN_FRAMES", "0") == "1"
+
+# шардированный прогон (sharding.py): >1 — модель/LLM/смешивание в N процессах
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", 1))
+
+# вызовы LLM (llm.py): повторы при ошибке API с экспоненциальной паузой; учёт — llm_usage.py
+LLM_RETRIES         = int(os.getenv("LLM_RETRIES", 2))
+LLM_RETRY_BACKOFF_S = float(os.getenv("LLM_RETRY_BACKOFF_S", 1.0))
+# потоковый ответ (llm.call_llm_stream): транзакции смешиваются и пишутся по мере генерации
+LLM_STREAM          = os.getenv("LLM_STREAM", "0") == "1"
+# одновременных запросов к LLM на процесс (0 — без предела); общий для выписок cli.py batch
+LLM_CONCURRENCY     = int(os.getenv("LLM_CONCURRENCY", 0))
+# 0 — прогон без LLM (ML + prior + правила, llm_status=skipped): стек LLM даже не импортируется
+LLM_ENABLED         = os.getenv("LLM_ENABLED", "1") == "1"
@@ -0,0 +1,144 @@
+# src/agent_lc/dedupe.py
+"""
+Схлопывание равнозначных строк выписки перед LLM.
+
+Зарплатные реестры, еженедельная оплата одному поставщику: десятки строк с
+одной парой ИНН, тем же назначением и близкой суммой. LLM на них отвечает
+одно и то же, а токены тратятся на каждую. Строки группируются по ключу
+
+    (ИНН дебета, ИНН кредита, нормализованное назначение, корзина суммы, набор флагов)
+
+  * назначение — нижний регистр, ё→е, числа/даты/номера → «#», без пунктуации;
+  * корзина суммы — логарифмическая, шириной LLM_DEDUPE_AMOUNT_TOL (5% — одна корзина);
+  * флаги — tools._flags_from_row (транзит, аномалии, стоп-слова, память).
+
+В LLM уходит первая строка группы (представитель). Остальным достаются его
+p_llm, объяснение и рекомендация, но смесь ML/PRIOR/правила и метка у
+каждой строки свои (tools.assess_like), а в отчёте видно, чей ответ взят
+(llm_shared_with). Шардирование идёт по паре ИНН, поэтому группа целиком
+попадает в один шард.
+
+Представители, чей профиль и кластер назначения уже объяснялись LLM в прошлых
+прогонах (purpose_lsh.py), в LLM тоже не уходят — объяснение берётся из кэша.
+"""
+import json, math
+from typing import Callable, Dict, List, Tuple
+
+import pandas as pd
+
+from .config import LLM_DEDUPE, LLM_DEDUPE_AMOUNT_TOL, PURPOSE_LSH
+from .memory import canon_inn
+from .purpose_lsh import normalize_purpose, lookup_explanations, remember_explanations
+from .storage import get_store
+from .telemetry import span
+
+
+# флаги, которые меняются от одного присутствия контрагента в памяти, а не от его профиля
+_VOLATILE_FLAGS = {"memory_recent_activity", "memory_above_p95"}
+
+
+def _amount_bucket(x) -> str:
+    try:
+        a = abs(float(x))
+    except (TypeError, ValueError):
+        return ""
+    if not a or math.isnan(a):
+        return "0"
+    return str(int(math.floor(math.log(a) / math.log1p(LLM_DEDUPE_AMOUNT_TOL))))
+
+
+def key_parts(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Части ключа равнозначности по признакам, уже посчитанным пайплайном:
+    profile — пара ИНН, корзина суммы, набор флагов; purpose — нормализованное назначение;
+    cache_profile — profile без флагов окна истории (_VOLATILE_FLAGS), ключ кэша объяснений между прогонами.
+    """
+    from .tools import _HIST_KEEP, _flags_from_row, _hist_from_base   # tools импортирует llm → тяжёлый импорт
+    has_hist = _HIST_KEEP.issubset(df.columns)
+    store = get_store()
+    defaults = _hist_from_base({})
+    parts = []
+    for r in json.loads(df.to_json(orient="records", force_ascii=False)):
+        hist = _hist_from_base(r if has_hist else {**r, **store.combine_hist_for_row(r)})
+        r = {**r, **{k: (defaults[k] if v is None else v) for k, v in hist.items()}}
+        amount = r.get("amount") if r.get("amount") is not None else r.get("debit_amount") or r.get("credit_amount")
+        head = "|".join((str(canon_inn(r.get("debit_inn")) or ""), str(canon_inn(r.get("credit_inn")) or ""),
+                         _amount_bucket(amount)))
+        flags = sorted(_flags_from_row(r))
+        parts.append((f"{head}|{','.join(flags)}", normalize_purpose(r.get("purpose")),
+                      f"{head}|{','.join(f for f in flags if f not in _VOLATILE_FLAGS)}"))
+    return pd.DataFrame(parts, index=df.index, columns=["profile", "purpose", "cache_profile"])
+
+
+def split_groups(df: pd.DataFrame, parts: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame, Dict[int, int]]:
+    """→ (представители, остальные члены групп, {id члена: id представителя})."""
+    keys = parts["profile"] + "|" + parts["purpose"]
+    first = ~keys.duplicated()
+    rep_id = pd.Series(df["id"].astype(int).to_numpy(), index=df.index).groupby(keys).transform("first")
+    members = df[~first]
+    return df[first], members, dict(zip(members["id"].astype(int), rep_id[~first].astype(int)))
+
+
+def _llm_answered(t: dict) -> bool:
+    """Итог построен на ответе LLM по самой строке (не фолбэк, не чужой/кэшированный ответ)."""
+    return ((t.get("evidence") or {}).get("llm_answer", True) and t.get("llm_shared_with") is None
+            and t.get("llm_cached_from") is None and t.get("llm_status") in (None, "done", "updated"))
+
+
+def run_deduplicated(df: pd.DataFrame, run: Callable[[pd.DataFrame], List[dict]]) -> List[dict]:
+    """
+    run(строки для LLM) → их итоговые транзакции. С LLM_DEDUPE в run идут только представители групп,
+    члены получают LLM-часть представителя; с PURPOSE_LSH представители с объяснением в кэше
+    решаются без вызова, а свежие ответы LLM пополняют кэш.
+    Представитель без ответа LLM (skipped / pending / error) — члены решаются без LLM с тем же статусом;
+    представитель, пропущенный в ответе, сам считается как фолбэк (ML + prior + правила) со статусом
+    error, а за ним и члены: окончательными они не становятся, следующий прогон отправит группу в LLM снова.
+    """
+    from .identity import decision_version
+    from .tools import assess_like, assess_without_llm
+    with span("dedupe", rows=len(df)) as sp:
+        parts = key_parts(df)
+        if LLM_DEDUPE:
+            reps, members, rep_of = split_groups(df, parts)
+        else:
+            reps, members, rep_of = df, df.iloc[:0], {}
+        sp["groups"], sp["saved"] = len(reps), len(members)
+
+    version = decision_version()
+    cached: Dict[int, dict] = {}
+    if PURPOSE_LSH:
+        with span("purpose_lsh", rows=len(reps)) as sp:
+            cached = lookup_explanations({int(i): (pr, pu) for i, pr, pu in zip(
+                reps["id"], parts.loc[reps.index, "cache_profile"], parts.loc[reps.index, "purpose"])}, version)
+            sp["hits"] = len(cached)
+    hit = reps["id"].astype(int).isin(cached).to_numpy()
+    tx = run(reps[~hit]) if (~hit).any() else []
+    if hit.any():
+        tx += assess_like(reps[hit].to_json(orient="records", force_ascii=False), cached)
+    lost = reps[~reps["id"].astype(int).isin({int(t["id"]) for t in tx if t.get("id") is not None}).to_numpy()]
+    if len(lost):
+        tx += assess_without_llm(lost.to_json(orient="records", force_ascii=False), llm_status="error")
+    if PURPOSE_LSH:
+        fresh = {int(t["id"]): t for t in tx if t.get("id") is not None and _llm_answered(t)}
+        rows = reps[reps["id"].astype(int).isin(fresh).to_numpy()]
+        with span("purpose_lsh_write", rows=len(rows)):
+            remember_explanations([(parts.at[i, "cache_profile"], parts.at[i, "purpose"],
+                                    None if pd.isna(tid) else str(tid), fresh[int(rid)])
+                                   for i, rid, tid in zip(rows.index, rows["id"], rows.get("tx_id", rows["id"]))],
+                                  version)
+    if not len(members):
+        return tx
+
+    by_id = {int(t["id"]): t for t in tx if t.get("id") is not None}
+    shared = {m: by_id[r] for m, r in rep_of.items() if r in by_id}
+    status = pd.Series([shared[m].get("llm_status", "") for m in members["id"].astype(int)], index=members.index)
+    with span("dedupe_spread", rows=len(members)):
+        like = members[~status.isin(["skipped", "pending", "error"])]
+        if len(like):
+            tx += assess_like(like.to_json(orient="records", force_ascii=False), shared)
+        # представитель без ответа LLM (skipped / pending / error) — члены без LLM с его статусом
+        for st in ("skipped", "pending", "error"):
+            part = members[status == st]
+            if len(part):
+                tx += assess_without_llm(part.to_json(orient="records", force_ascii=False), llm_status=st)
+    return tx
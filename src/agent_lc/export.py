@@ -1,31 +1,42 @@
 # src/agent_lc/export.py
-import pandas as pd, sqlite3, openpyxl
-from openpyxl.styles import Alignment, PatternFill
-from .config import DB_PATH
+import pandas as pd
+from .memory import SUMMARY_COLUMNS
+from .storage import get_store
 import numpy as np
 
+# колонки выписки, которые берёт отчёт (остальные признаки в by_id не нужны)
+_BASE_COLUMNS = ("date", "ts", "debit_account", "debit_name", "debit_inn",
+                 "credit_account", "credit_name", "credit_inn", "ml_metric",
+                 "debit_susp_rate", "debit_cnt_suspicious", "debit_last_seen_days", "debit_watchlisted", "debit_p95",
+                 "credit_susp_rate", "credit_cnt_suspicious", "credit_last_seen_days", "credit_watchlisted", "credit_p95")
+
 def _build_by_id(df: pd.DataFrame):
-    # устойчивый маппинг id -> строка
-    df = df.copy().reset_index(drop=True)
+    # устойчивый маппинг id -> строка (только колонки отчёта, без копии всей выписки)
     n = len(df)
+    fallback = np.arange(1, n + 1, dtype=float)
     if "id" not in df.columns:
-        df["id"] = pd.Series(range(1, n + 1), index=df.index, dtype=int)
+        ids = fallback
     else:
-        ids = pd.to_numeric(df["id"], errors="coerce")
-        fallback = pd.Series(range(1, n + 1), index=df.index, dtype=float)
-        ids = ids.fillna(fallback)
-        # защитимся от нулей/отрицательных/inf
+        ids = pd.to_numeric(df["id"], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+        # NaN/нули/отрицательные/inf — порядковым номером строки
         bad = ~np.isfinite(ids) | (ids <= 0)
-        if bad.any():
-            repl = pd.Series(range(1, n + 1), index=df.index, dtype=float)
-            ids[bad] = repl[bad]
-        df["id"] = ids.astype(int)
-    return {int(r["id"]): r for _, r in df.iterrows()}
+        ids = np.where(bad, fallback, ids)
+    cols = [c for c in _BASE_COLUMNS if c in df.columns]
+    return dict(zip(ids.astype(int).tolist(), df[cols].to_dict("records")))
 
 def _fmt_bool(x):
     return int(bool(x)) if pd.notna(x) else 0
 
-def export_excel_report(df_scored: pd.DataFrame, llm_resp: dict, file_path: str) -> str:
+def export_excel_report(df_scored: pd.DataFrame, llm_resp: dict, file_path: str,
+                        llm_usage: tuple | None = None) -> str:
+    """
+    llm_usage — (сводка, разрез по размеру пакета) из llm_usage.summarize: лист llm_usage.
+    Колонка llm_status — если транзакции её несут (двухфазный прогон).
+    Колонка llm_shared_with — id строки, чей ответ LLM взят (dedupe.py), llm_cached_from — tx_id
+    строки прошлого прогона, чьё объяснение взято из кэша (purpose_lsh.py); если такие есть.
+    """
+    import openpyxl                         # только на экспорте: импорт pipeline — без openpyxl
+    from openpyxl.styles import Alignment, PatternFill
     by_id = _build_by_id(df_scored)
 
     # основной лист risk
@@ -78,6 +89,18 @@ def export_excel_report(df_scored: pd.DataFrame, llm_resp: dict, file_path: str)
 
     out = pd.DataFrame(rows)
 
+    # двухфазный прогон: pending — итог без LLM (ждёт ответа), updated — дополнен LLM
+    statuses = [t.get("llm_status", "") for t in llm_resp.get("transactions", [])]
+    if any(statuses):
+        out.insert(out.columns.get_loc("risk_label") + 1, "llm_status", statuses)
+    # схлопнутые строки: объяснение и p_llm — от представителя группы
+    shared = [t.get("llm_shared_with") for t in llm_resp.get("transactions", [])]
+    if any(x is not None for x in shared):
+        out.insert(out.columns.get_loc("p_llm") + 1, "llm_shared_with", pd.array(shared, dtype="Int64"))
+    if any("llm_cached_from" in t for t in llm_resp.get("transactions", [])):
+        out.insert(out.columns.get_loc("p_llm") + 1, "llm_cached_from",
+                   [t.get("llm_cached_from", "") for t in llm_resp.get("transactions", [])])
+
     with pd.ExcelWriter(file_path, engine="openpyxl") as wr:
         # ----- Лист risk
         out.to_excel(wr, index=False, sheet_name="risk")
@@ -155,24 +178,19 @@ def export_excel_report(df_scored: pd.DataFrame, llm_resp: dict, file_path: str)
 
         # ----- Лист memory_summary (топ по памяти, с мягкими LLM-флагами)
         try:
-            con = sqlite3.connect(DB_PATH); cur = con.cursor()
-            top_agg = cur.execute("""
-                SELECT inn, cnt_total, cnt_suspicious,
-                       ROUND(CASE WHEN cnt_total>0 THEN 100.0*cnt_suspicious/cnt_total ELSE 0 END, 1) AS susp_rate_pct,
-                       amt_total, amt_suspicious, last_seen_ts, watchlisted, p50, p75, p90, p95,
-                       llm_flags_total, llm_last_seen_ts
-                FROM agg_counterparty
-                ORDER BY cnt_suspicious DESC, susp_rate_pct DESC
-                LIMIT 200
-            """).fetchall()
-            con.close()
-            cols = ["inn","cnt_total","cnt_suspicious","susp_rate_pct","amt_total","amt_suspicious",
-                    "last_seen_ts","watchlisted","p50","p75","p90","p95","llm_flags_total","llm_last_seen_ts"]
-            pd.DataFrame(top_agg, columns=cols).to_excel(wr, index=False, sheet_name="memory_summary")
+            top_agg = get_store().top_counterparties(200)
+            pd.DataFrame(top_agg, columns=SUMMARY_COLUMNS).to_excel(wr, index=False, sheet_name="memory_summary")
         except Exception:
-            pd.DataFrame(columns=["inn","cnt_total","cnt_suspicious","susp_rate_pct",
-                                  "amt_total","amt_suspicious","last_seen_ts","watchlisted",
-                                  "p50","p75","p90","p95","llm_flags_total","llm_last_seen_ts"]
-                         ).to_excel(wr, index=False, sheet_name="memory_summary")
+            pd.DataFrame(columns=SUMMARY_COLUMNS).to_excel(wr, index=False, sheet_name="memory_summary")
+
+        # ----- Лист llm_usage (токены/задержка прогона; ниже — разрез по размеру пакета)
+        if llm_usage is not None:
+            usage, by_batch = llm_usage
+            head = pd.DataFrame(list(usage.items()), columns=["metric", "value"])
+            head.to_excel(wr, index=False, sheet_name="llm_usage")
+            by_batch.to_excel(wr, index=False, sheet_name="llm_usage", startrow=len(head) + 2)
+            ws3 = wr.sheets.get("llm_usage") or wr.book["llm_usage"]
+            for i in range(1, max(2, len(by_batch.columns)) + 1):
+                ws3.column_dimensions[openpyxl.utils.get_column_letter(i)].width = 22
 
     return file_path
@@ -1,6 +1,10 @@
 import pandas as pd
 import numpy as np
 
+from .frequency import add_frequency_features
+from .chains import add_chain_features
+from .amounts import add_amount_anomaly
+
 HIGH_RISK_WORDS = [
     "займ","договор займа","возврат займа","взаиморасчёт","перевод средств","без договора","перевод на карту",
     "личные нужды","крипто","биткоин","usdt","биржа","coin","crypto","swift","иностранный перевод",
@@ -37,8 +41,14 @@ def _purpose_group(text: str) -> str:
     if any(w in t for w in MEDIUM_RISK_WORDS): return "med_kw"
     return "low_kw"
 
-def build_base_features(df_raw: pd.DataFrame) -> pd.DataFrame:
-    df = df_raw.copy()
+def build_base_features(df_raw: pd.DataFrame, history: pd.DataFrame | None = None,
+                        profiles: tuple | None = None, inplace: bool = False) -> pd.DataFrame:
+    """
+    history  — операции из памяти для частотных окон и цепочек (frequency.load_frequency_history);
+    profiles — история сумм ИНН из памяти для as-of anomaly_amount (amounts.load_amount_profiles);
+    inplace  — признаки дописываются в сам df_raw (LEAN_FRAMES), без копии выписки.
+    """
+    df = df_raw if inplace else df_raw.copy()
 
     # гарантируем нужные столбцы
     need = ["id","date","debit_account","debit_name","debit_inn",
@@ -65,17 +75,20 @@ def build_base_features(df_raw: pd.DataFrame) -> pd.DataFrame:
     # ключевые слова
     df["purpose_kw_high"] = df["purpose"].apply(lambda x: has_any(x, HIGH_RISK_WORDS))
     df["purpose_kw_med"]  = df["purpose"].apply(lambda x: has_any(x, MEDIUM_RISK_WORDS))
-    df["is_regular_payment"] = 0
 
-    # заглушки по цепочкам (если нет вычисления цепочек)
+    # транзитные цепочки (chains.py); готовые chain_* из выгрузки не перетираем
+    if not {"chain_id", "chain_length", "chain_duration_hours"} & set(df.columns):
+        df = add_chain_features(df, history)
     if "chain_id" not in df.columns: df["chain_id"] = None
     if "chain_length" not in df.columns: df["chain_length"] = None
     if "chain_duration_hours" not in df.columns: df["chain_duration_hours"] = None
 
-    # базовые аномалии
-    df["anomaly_amount"]    = 0.0
+    # частотные окна 1/7/30/90 дн. (пара и ИНН) → is_regular_payment / anomaly_frequency
+    df = add_frequency_features(df, history)
+
+    # базовые аномалии (сумма — против профиля p50/p75 контрагента)
+    df = add_amount_anomaly(df, profiles)
     df["anomaly_purpose"]   = df["purpose_kw_high"].astype(float)
-    df["anomaly_frequency"] = 0.0
     df["anomaly_overall"]   = df[["anomaly_amount","anomaly_purpose","anomaly_frequency"]].max(axis=1)
 
     # ───────────────────────────────────────────────
@@ -0,0 +1,83 @@
+# src/agent_lc/frames.py
+"""
+Экономный по памяти вид выписки (LEAN_FRAMES).
+
+По умолчанию пайплайн держит несколько полных копий выписки (df_raw →
+df_prep → df_scored), а строковые колонки — object: на каждую ячейку
+отдельный объект str, хотя наименований, ИНН и счетов в выписке намного
+меньше, чем строк. С LEAN_FRAMES:
+
+  * наименования контрагентов читаются из CSV сразу в category (read_dtypes);
+    ИНН, счета и типы — category после чтения (значения остаются числами, как
+    их разобрал read_csv), если уникальных не больше половины строк;
+  * числовые колонки сужаются (int64 → int8/16/32, float64 → float32)
+    только без потерь: каждое значение переживает обратное приведение;
+  * признаки, ml_metric и id дописываются в тот же DataFrame, без copy().
+
+Значения ячеек не меняются — меняется лишь их хранение, поэтому итог прогона
+(метки, отчёт, tx_id, ключи кэшей) тот же, что без LEAN_FRAMES.
+"""
+import numpy as np
+import pandas as pd
+
+from .config import LEAN_FRAMES
+
+
+# колонки с повторяющимися значениями (контрагенты, их реквизиты, производные типы)
+CATEGORY_COLUMNS = ("debit_name", "credit_name", "debit_inn", "credit_inn",
+                    "debit_account", "credit_account", "debit_name_type", "credit_name_type",
+                    "purpose_group")
+# только текст: category прямо из read_csv (ИНН/счета read_csv разбирает как числа — их после)
+_READ_CATEGORY = ("debit_name", "credit_name")
+# идентичность строки — как есть (ключи памяти, сортировки, join по id)
+_KEEP = {"id", "tx_id"}
+
+
+def _as_category(s: pd.Series) -> pd.Series:
+    if isinstance(s.dtype, pd.CategoricalDtype) or not len(s):
+        return s
+    if s.nunique(dropna=True) > len(s) // 2:
+        return s                    # почти уникальные — словарь не окупится
+    return s.astype("category")
+
+
+def _downcast(s: pd.Series) -> pd.Series:
+    if pd.api.types.is_bool_dtype(s) or not pd.api.types.is_numeric_dtype(s):
+        return s
+    if pd.api.types.is_integer_dtype(s):
+        return pd.to_numeric(s, downcast="integer")
+    if s.dtype == np.float64:
+        v = s.to_numpy()
+        f32 = v.astype(np.float32)
+        with np.errstate(over="ignore", invalid="ignore"):
+            lossless = (f32.astype(np.float64) == v) | np.isnan(v)
+        if lossless.all():
+            return pd.Series(f32, index=s.index, name=s.name)
+    return s
+
+
+def read_dtypes():
+    """dtype для read_csv: с LEAN_FRAMES наименования — сразу category (без object-колонки на всю выписку)."""
+    return {c: "category" for c in _READ_CATEGORY} if LEAN_FRAMES else None
+
+
+def lean_frame(df: pd.DataFrame, columns=None) -> pd.DataFrame:
+    """
+    Сжимает колонки df на месте (columns — только эти; по умолчанию все) и возвращает его же.
+    Без LEAN_FRAMES — ничего не делает.
+    """
+    if not LEAN_FRAMES:
+        return df
+    for c in (df.columns if columns is None else [c for c in columns if c in df.columns]):
+        if c in _KEEP:
+            continue
+        s = df[c]
+        new = _as_category(s) if c in CATEGORY_COLUMNS else _downcast(s)
+        if new is not s:
+            df[c] = new
+    return df
+
+
+def frame_bytes(df: pd.DataFrame) -> int:
+    """Память DataFrame с учётом строк в object-колонках."""
+    return int(df.memory_usage(index=True, deep=True).sum())
@@ -0,0 +1,179 @@
+# src/agent_lc/frequency.py
+"""
+Частотные признаки по скользящим окнам (вместо заглушки anomaly_frequency = 0).
+
+Для каждой строки выписки — сколько и на какую сумму было операций ДО неё
+за 1/7/30/90 дней:
+  - по паре (debit_inn → credit_inn):  pair_cnt_{w}d, pair_sum_{w}d
+  - по каждому ИНН (в любой роли):    debit_cnt_{w}d, debit_sum_{w}d, credit_cnt_{w}d, credit_sum_{w}d
+и регулярность пары по интервалам между платежами (pair_interval_days / pair_interval_cv).
+
+Считается сортировкой по составному ключу (группа, ts) и searchsorted по границам
+окна — O(n log n) на всю выписку + историю из памяти, без циклов по строкам.
+"""
+from typing import Optional, Tuple
+import numpy as np
+import pandas as pd
+
+from .storage import get_store
+from .history import statement_ts, canon_inn_array, _TS_BITS, _TS_MAX
+
+WINDOWS_DAYS = (1, 7, 30, 90)
+_REG_LAST_INTERVALS = 6        # по скольким последним интервалам судим о регулярности
+_REG_MIN_INTERVALS = 3
+_REG_MAX_CV = 0.25
+
+
+def load_frequency_history(df: pd.DataFrame) -> Optional[pd.DataFrame]:
+    """История из памяти для окон: все операции ИНН выписки за max(окно) до её начала."""
+    if "debit_inn" not in df.columns or "credit_inn" not in df.columns:
+        return None
+    ts = statement_ts(df)
+    inns = np.unique(np.concatenate([canon_inn_array(df["debit_inn"]), canon_inn_array(df["credit_inn"])]))
+    inns = inns[inns != 0]
+    if not len(inns) or np.isnan(ts).all():
+        return None
+    since = int(np.nanmin(ts)) - max(WINDOWS_DAYS) * 86400
+    rows = get_store().read_tx_window(inns.tolist(), since)
+    if not rows:
+        return None
+    return pd.DataFrame(rows, columns=["tx_id", "ts", "debit_inn", "credit_inn", "amount"])
+
+
+class _GroupTimeIndex:
+    """События, отсортированные по (группа, ts), + кумулятивы сумм — для окон и интервалов."""
+
+    def __init__(self, group: np.ndarray, ts: np.ndarray, amount: np.ndarray):
+        self.tmin = int(ts.min()) if len(ts) else 0
+        key = (group.astype(np.int64) << _TS_BITS) | np.clip(ts - self.tmin, 0, _TS_MAX)
+        order = np.argsort(key, kind="stable")
+        self.key = key[order]
+        self.group = group[order]
+        self.ts = ts[order]
+        self.cum_amt = np.concatenate([[0.0], np.cumsum(amount[order])])
+        # интервалы между соседними событиями одной группы (на границе групп — 0)
+        d = np.diff(self.ts, prepend=self.ts[:1]).astype(float)
+        d[np.r_[True, self.group[1:] != self.group[:-1]]] = 0.0
+        self.cum_d = np.concatenate([[0.0], np.cumsum(d)])
+        self.cum_d2 = np.concatenate([[0.0], np.cumsum(d * d)])
+
+    def _qkey(self, group: np.ndarray, ts: np.ndarray) -> np.ndarray:
+        return (group.astype(np.int64) << _TS_BITS) | np.clip(ts - self.tmin, 0, _TS_MAX)
+
+    def order(self, group: np.ndarray, ts: np.ndarray) -> np.ndarray:
+        """
+        Порядок запросов по ключу. Сдвиг всех ts на константу (граница окна) его
+        не меняет, поэтому одна сортировка обслуживает все окна.
+        """
+        return np.argsort(self._qkey(group, ts))
+
+    def pos(self, group: np.ndarray, ts: np.ndarray, order: np.ndarray) -> np.ndarray:
+        """Индекс первого события группы с ts >= заданного (т.е. число событий «строго до»)."""
+        # отсортированные «иглы» ищутся в разы быстрее случайных (кэш), порядок возвращаем
+        out = np.empty(len(order), dtype=np.int64)
+        out[order] = np.searchsorted(self.key, self._qkey(group[order], ts[order]), side="left")
+        return out
+
+    def window(self, group, ts, days, order, hi=None) -> Tuple[np.ndarray, np.ndarray]:
+        hi = self.pos(group, ts, order) if hi is None else hi
+        lo = self.pos(group, ts - int(days * 86400), order)
+        return hi - lo, self.cum_amt[hi] - self.cum_amt[lo]
+
+
+def _build_events(df: pd.DataFrame, history: Optional[pd.DataFrame]):
+    """Выписка + история (без строк, которые уже есть в выписке) → массивы (d, c, ts, amount)."""
+    d = canon_inn_array(df["debit_inn"])
+    c = canon_inn_array(df["credit_inn"])
+    ts = statement_ts(df)
+    amt = pd.to_numeric(df.get("amount"), errors="coerce").fillna(0.0).to_numpy(dtype=float)
+    if history is not None and len(history):
+        own = df["tx_id"] if "tx_id" in df.columns else df["id"]
+        h = history[~history["tx_id"].astype(str).isin(own.astype(str))]
+        d = np.concatenate([d, h["debit_inn"].fillna(0).to_numpy(dtype=np.int64)])
+        c = np.concatenate([c, h["credit_inn"].fillna(0).to_numpy(dtype=np.int64)])
+        ts = np.concatenate([ts, h["ts"].to_numpy(dtype=float)])
+        amt = np.concatenate([amt, h["amount"].fillna(0.0).to_numpy(dtype=float)])
+    return d, c, ts, amt
+
+
+def add_frequency_features(df: pd.DataFrame, history: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    n = len(df)
+    d_all, c_all, ts_all, amt_all = _build_events(df, history)
+    known = ~np.isnan(ts_all)
+    ts_all = np.where(known, ts_all, 0).astype(np.int64)
+    q_d, q_c, q_ts = d_all[:n], c_all[:n], ts_all[:n]
+    q_known = known[:n]
+
+    # ── пары: события без даты в окна не попадают
+    d_code, d_uni = pd.factorize(d_all)
+    c_code, c_uni = pd.factorize(c_all)
+    pair = d_code.astype(np.int64) * max(1, len(c_uni)) + c_code
+    pair_ok = known & (d_all != 0) & (c_all != 0)
+    pidx = _GroupTimeIndex(pair[pair_ok], ts_all[pair_ok], amt_all[pair_ok])
+
+    # ── ИНН в любой роли (платёж «сам себе» — один раз)
+    self_tx = d_all == c_all
+    p_inn = np.concatenate([d_all, c_all[~self_tx]])
+    p_ts = np.concatenate([ts_all, ts_all[~self_tx]])
+    p_amt = np.concatenate([amt_all, amt_all[~self_tx]])
+    p_ok = np.concatenate([known, known[~self_tx]]) & (p_inn != 0)
+    i_code, i_uni = pd.factorize(p_inn[p_ok])
+    iidx = _GroupTimeIndex(i_code.astype(np.int64), p_ts[p_ok], p_amt[p_ok])
+    lookup = pd.Index(i_uni)
+    q_dcode = lookup.get_indexer(q_d)
+    q_ccode = lookup.get_indexer(q_c)
+
+    q_pair = pair[:n]
+    q_pair_ok = pair_ok[:n]
+    p_order = pidx.order(q_pair, q_ts)
+    hi = pidx.pos(q_pair, q_ts, p_order)
+    roles = []
+    for role, code in (("debit", q_dcode), ("credit", q_ccode)):
+        g = np.maximum(code, 0)
+        o = iidx.order(g, q_ts)
+        roles.append((role, g, q_known & (code >= 0), o, iidx.pos(g, q_ts, o)))
+    out = {}
+    for w in WINDOWS_DAYS:
+        cnt, sm = pidx.window(q_pair, q_ts, w, p_order, hi)
+        out[f"pair_cnt_{w}d"] = np.where(q_pair_ok, cnt, 0)
+        out[f"pair_sum_{w}d"] = np.where(q_pair_ok, sm, 0.0)
+        for role, g, ok, o, r_hi in roles:
+            cnt, sm = iidx.window(g, q_ts, w, o, r_hi)
+            out[f"{role}_cnt_{w}d"] = np.where(ok, cnt, 0)
+            out[f"{role}_sum_{w}d"] = np.where(ok, sm, 0.0)
+
+    # ── регулярность пары: последние K интервалов до строки + интервал до неё самой
+    start = pidx.pos(q_pair, np.full(n, pidx.tmin, dtype=np.int64), p_order)
+    prior = np.where(q_pair_ok, hi - start, 0)
+    a = np.maximum(start, hi - (_REG_LAST_INTERVALS + 1))
+    k_prev = np.maximum(0, hi - a - 1)                        # интервалов между прошлыми платежами
+    s1 = np.where(k_prev > 0, pidx.cum_d[hi] - pidx.cum_d[np.minimum(a + 1, hi)], 0.0)
+    s2 = np.where(k_prev > 0, pidx.cum_d2[hi] - pidx.cum_d2[np.minimum(a + 1, hi)], 0.0)
+    last_ts = np.where(prior > 0, pidx.ts[np.maximum(hi - 1, 0)], q_ts)
+    gap = np.where(prior > 0, (q_ts - last_ts).astype(float), 0.0)
+    k = k_prev + (prior > 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = np.where(k > 0, (s1 + gap) / np.maximum(k, 1), np.nan)
+        var = np.where(k > 0, (s2 + gap * gap) / np.maximum(k, 1) - mean ** 2, np.nan)
+        cv = np.where(mean > 0, np.sqrt(np.maximum(var, 0.0)) / mean, np.nan)
+    out["pair_interval_days"] = mean / 86400.0
+    out["pair_interval_cv"] = cv
+    is_regular = (k >= _REG_MIN_INTERVALS) & (mean >= 86400) & (cv <= _REG_MAX_CV)
+
+    # ── аномалия частоты: всплеск последних 7 дней (пара) / 1 дня (ИНН) против фона 90 дней
+    pair7, pair90 = out["pair_cnt_7d"], out["pair_cnt_90d"]
+    base7 = (pair90 - pair7) / 83.0 * 7.0
+    burst_pair = np.clip((pair7 + 1 - base7 - 2) / 6.0, 0.0, 1.0)
+    burst_inn = np.zeros(n)
+    for role in ("debit", "credit"):
+        c1, c90 = out[f"{role}_cnt_1d"], out[f"{role}_cnt_90d"]
+        base1 = (c90 - c1) / 89.0
+        burst_inn = np.maximum(burst_inn, np.clip((c1 + 1 - base1 - 3) / 10.0, 0.0, 1.0))
+    anomaly = np.where(is_regular, 0.0, np.maximum(burst_pair, burst_inn))
+
+    del pidx, iidx, p_inn, p_ts, p_amt, p_ok      # индексы окон — до переноса колонок в df
+    for k_ in list(out):
+        df[k_] = out.pop(k_)        # df держит свою копию массива — нашу отпускаем сразу
+    df["is_regular_payment"] = is_regular.astype(int)
+    df["anomaly_frequency"] = np.where(q_known, anomaly, 0.0)
+    return df
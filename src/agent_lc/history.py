@@ -0,0 +1,293 @@
+# src/agent_lc/history.py
+"""
+As-of история контрагентов (без «заглядывания в будущее»).
+
+mem_bulk_preload_statement кладёт в память всю выписку ДО скоринга, поэтому
+агрегаты agg_counterparty для январской операции уже видят мартовские.
+Здесь история по каждому ИНН хранится в отсортированных по времени массивах,
+и для каждой операции берётся срез «строго до её ts» бинарным поиском:
+вся выписка считается одним векторным проходом, без SQL на строку.
+
+С PRIOR_DECAY так же считаются затухающие счётчики (memory.decay_w): внутри
+ИНН — накопленные суммы весов exp(−λ·(T − t)) к последней операции T, срез
+доводится до ts операции одним множителем.
+"""
+from typing import Dict, Iterable, Optional
+import numpy as np
+import pandas as pd
+
+from .config import PRIOR_DECAY
+from .memory import (canon_inn, to_epoch, decay_w, DECAY_LAMBDA, DECAY_RATE_K, DECAY_HIST_KEYS,
+                     _hist_key, _hist_value)
+from .storage import get_store
+
+_TS_BITS = 34                       # смещение ts внутри составного ключа (~540 лет секунд)
+_TS_MAX = (1 << _TS_BITS) - 1
+NEVER_DAYS = 1e6                    # «не встречался» — как days_since(None)
+
+
+def epoch_series(s: pd.Series) -> np.ndarray:
+    """
+    Даты выписки → epoch-секунды (float, NaN если не распознано) ровно так же,
+    как их пишет память (to_epoch): быстрый путь для «YYYY-mm-dd HH:MM:SS»,
+    остальное — поэлементно.
+    """
+    if s is None:
+        return np.array([], dtype=float)
+    if pd.api.types.is_datetime64_any_dtype(s):
+        dt = pd.to_datetime(s, errors="coerce")
+        if getattr(dt.dt, "tz", None) is not None:
+            dt = dt.dt.tz_convert("UTC").dt.tz_localize(None)
+    else:
+        dt = pd.to_datetime(s.astype("string").str.slice(0, 19), errors="coerce", format="%Y-%m-%d %H:%M:%S")
+    out = (dt - pd.Timestamp("1970-01-01")).dt.total_seconds().to_numpy(dtype=float, na_value=np.nan)
+    miss = np.isnan(out) & s.notna().to_numpy()
+    if miss.any():
+        out[miss] = [np.nan if (e := to_epoch(x)) is None else float(e) for x in s[miss]]
+    return out
+
+
+def statement_ts(df: pd.DataFrame) -> np.ndarray:
+    """ts строки выписки: колонка ts, а где её нет/пусто — date (как в mem_bulk_preload_statement)."""
+    ts = epoch_series(df["ts"]) if "ts" in df.columns else np.full(len(df), np.nan)
+    if "date" in df.columns:
+        miss = np.isnan(ts)
+        if miss.any():
+            ts[miss] = epoch_series(df["date"])[miss]
+    return ts
+
+
+def canon_inn_array(s: pd.Series) -> np.ndarray:
+    """Колонка ИНН → int64 (0 = пусто/мусор), по уникальным значениям."""
+    codes, uniq = pd.factorize(s, use_na_sentinel=True)
+    keys = np.array([canon_inn(u) or 0 for u in uniq], dtype=np.int64)
+    out = np.zeros(len(s), dtype=np.int64)
+    ok = codes >= 0
+    out[ok] = keys[codes[ok]]
+    return out
+
+
+# квантили сумм архива (agg_archive) в кортеже mem_read_party_history: перцентиль → индекс;
+# гистограмма сумм архива — последним элементом
+_ARCHIVE_Q = {50: 8, 75: 9, 95: 4}
+_ARCHIVE_HIST = 10
+
+
+def _merged_prefix_quantiles(hist: Dict[str, int], amounts: np.ndarray, quantiles: tuple) -> np.ndarray:
+    """
+    Перцентили гистограммы архива вместе с каждым префиксом «живых» сумм amounts[:i+1]
+    (те же корзины и интерполяция, что memory._hist_quantiles) → массив (len(amounts), len(quantiles)).
+    На перцентиль держим корзину элемента с рангом floor(q·(n−1)) и число элементов до неё:
+    вставка сдвигает ранг не больше чем на одну позицию, поэтому указатель двигается локально.
+    """
+    keys = [_hist_key(float(a)) for a in amounts]
+    buckets = sorted(set(hist) | set(keys), key=_hist_value)
+    pos = {k: i for i, k in enumerate(buckets)}
+    values = [_hist_value(k) for k in buckets]
+    counts = [0] * len(buckets)
+    for k, c in hist.items():
+        counts[pos[k]] = c
+    n = sum(counts)
+    fracs = [q / 100.0 for q in quantiles]
+    state = [[0, 0] for _ in quantiles]        # (корзина, элементов в корзинах до неё)
+    out = []
+    for k in keys:
+        x = pos[k]
+        counts[x] += 1
+        n += 1
+        row = []
+        for f, st in zip(fracs, state):
+            b, below = st
+            if x < b:
+                below += 1
+            rank = f * (n - 1)
+            lo = int(rank)
+            while lo < below:
+                b -= 1
+                below -= counts[b]
+            while lo >= below + counts[b]:
+                below += counts[b]
+                b += 1
+            v = nxt = values[b]
+            if lo + 1 < n and lo + 1 >= below + counts[b]:     # следующий ранг — в следующей непустой корзине
+                nb = b + 1
+                while not counts[nb]:
+                    nb += 1
+                nxt = values[nb]
+            row.append(v + (nxt - v) * (rank - lo))
+            st[0], st[1] = b, below
+        out.append(row)
+    return np.array(out, dtype=float).reshape(len(keys), len(quantiles))
+
+
+class AsOfHistory:
+    """
+    События (inn, ts, amount, suspicious, llm_red) в компактных массивах,
+    отсортированные по составному ключу (код ИНН, ts).
+    quantiles — перцентили сумм префикса (lookup → p<q>); decay — затухающие счётчики.
+    """
+
+    def __init__(self, inn, ts, amount, susp, llm_red, archive: Optional[Dict] = None,
+                 quantiles: tuple = (95,), decay: bool = PRIOR_DECAY):
+        inn = np.asarray(inn, dtype=np.int64)
+        ts = np.asarray(ts, dtype=np.int64)
+        self._tmin = int(ts.min()) if len(ts) else 0
+        self._inns = np.unique(inn)
+        code = np.searchsorted(self._inns, inn)
+        key = (code.astype(np.int64) << _TS_BITS) | np.clip(ts - self._tmin, 0, _TS_MAX)
+        order = np.argsort(key, kind="stable")
+
+        self._key = key[order]
+        self._ts = ts[order]
+        self._amount = np.asarray(amount, dtype=float)[order]
+        self._cum_susp = np.concatenate([[0], np.cumsum(np.asarray(susp, dtype=np.int64)[order])])
+        self._cum_llm = np.concatenate([[0], np.cumsum(np.asarray(llm_red, dtype=np.int64)[order])])
+        code_sorted = self._key >> _TS_BITS
+        self._starts = np.searchsorted(code_sorted, np.arange(len(self._inns)), side="left")
+        # квантили каждого префикса [start, i] внутри ИНН (квантиль не складывается из кумулятивов,
+        # поэтому — grouped expanding-проход на перцентиль, O(n log n), а не срез на каждую строку)
+        self._prefix_q = {}
+        for pq in quantiles:
+            if len(self._key):
+                q = pd.Series(self._amount).groupby(code_sorted).expanding().quantile(pq / 100.0)
+                self._prefix_q[pq] = q.reset_index(level=0, drop=True).sort_index().to_numpy(copy=True)
+            else:
+                self._prefix_q[pq] = np.array([], dtype=float)
+        # ИНН со свёрнутым архивом (retention): перцентиль префикса — по гистограмме архива вместе с ним
+        self._archive = archive or {}
+        ends = np.append(self._starts[1:], len(self._key))
+        for k, a in (self._archive.items() if quantiles else ()):
+            code = int(np.searchsorted(self._inns, int(k)))
+            if code < len(self._inns) and self._inns[code] == int(k) and a[_ARCHIVE_HIST]:
+                lo, hi = self._starts[code], ends[code]
+                merged = _merged_prefix_quantiles(a[_ARCHIVE_HIST], self._amount[lo:hi], quantiles)
+                for j, pq in enumerate(quantiles):
+                    self._prefix_q[pq][lo:hi] = merged[:, j]
+        self._decay = decay
+        if decay:
+            # веса к последней операции ИНН (≤ 1, без переполнения); операции без даты не весят
+            ends = np.append(self._starts[1:], len(self._key)) - 1
+            self._anchor = self._ts[ends].astype(float)
+            w = np.where(self._ts > 0, np.exp(-DECAY_LAMBDA * (self._anchor[code_sorted] - self._ts)), 0.0)
+            by_inn = pd.Series(w).groupby(code_sorted)
+            self._cum_dw = by_inn.cumsum().to_numpy()
+            self._cum_ds = (pd.Series(w * np.asarray(susp, dtype=float)[order]).groupby(code_sorted)
+                            .cumsum().to_numpy())
+
+    @classmethod
+    def from_memory(cls, inns: Iterable) -> "AsOfHistory":
+        """Одна пакетная выборка из памяти по всем ИНН выписки."""
+        events, archive = get_store().read_party_history(inns)
+        if not events:
+            return cls([], [], [], [], [], archive)
+        inn, ts, amount, susp, p_llm, _ = zip(*events)
+        p_llm = np.array([float(x) if x is not None else 0.0 for x in p_llm])
+        return cls(inn, ts, [a or 0.0 for a in amount], [int(bool(x)) for x in susp],
+                   (p_llm >= 0.99).astype(np.int64), archive)
+
+    def lookup(self, inns: np.ndarray, ts: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        Для каждой пары (ИНН, ts) — состояние истории строго ДО ts:
+        cnt_total, cnt_suspicious, susp_rate, last_seen_days, p<q> по quantiles, llm_flags_total
+        (+ cnt_suspicious_decayed, susp_rate_decayed с decay).
+        ts = NaN → «сейчас» (видна вся история).
+        """
+        inns = np.asarray(inns, dtype=np.int64)
+        ts = np.asarray(ts, dtype=float)
+        n = len(inns)
+        now = float(pd.Timestamp.now(tz="UTC").timestamp())
+        q_ts = np.where(np.isnan(ts), now, ts)
+
+        cnt = np.zeros(n, dtype=np.int64)
+        susp = np.zeros(n, dtype=np.int64)
+        llm = np.zeros(n, dtype=np.int64)
+        last = np.full(n, np.nan)
+        pq = {q: np.full(n, np.nan) for q in self._prefix_q}
+        d_cnt = np.zeros(n)
+        d_susp = np.zeros(n)
+
+        if len(self._inns):
+            code = np.searchsorted(self._inns, inns)
+            code_c = np.minimum(code, len(self._inns) - 1)
+            found = (inns != 0) & (self._inns[code_c] == inns)
+            rel = np.clip(np.ceil(q_ts) - self._tmin, 0, _TS_MAX).astype(np.int64)
+            qkey = (code_c.astype(np.int64) << _TS_BITS) | rel
+            idx = np.searchsorted(self._key, qkey, side="left")
+            start = self._starts[code_c]
+            cnt = np.where(found, idx - start, 0)
+            susp = np.where(found, self._cum_susp[idx] - self._cum_susp[start], 0)
+            llm = np.where(found, self._cum_llm[idx] - self._cum_llm[start], 0)
+            has = cnt > 0
+            last[has] = self._ts[idx[has] - 1]
+            for q, prefix in self._prefix_q.items():
+                pq[q][has] = prefix[idx[has] - 1]
+            if self._decay:
+                # префикс весов (к последней операции ИНН) → на момент ts; в логарифмах, чтобы
+                # срез задолго до последней операции не переполнялся
+                prev = np.maximum(idx - 1, 0)
+                shift = DECAY_LAMBDA * (q_ts - self._anchor[code_c])
+                with np.errstate(divide="ignore"):
+                    d_cnt = np.where(has, np.exp(np.log(self._cum_dw[prev]) - shift), 0.0)
+                    d_susp = np.where(has, np.exp(np.log(self._cum_ds[prev]) - shift), 0.0)
+
+        cnt = cnt.astype(float)
+        susp = susp.astype(float)
+        llm = llm.astype(float)
+        if self._archive:
+            # архивный период целиком раньше горизонта retention — добавляем как базу
+            for i, k in enumerate(inns):
+                a = self._archive.get(int(k))
+                if not a:
+                    continue
+                cnt[i] += float(a[0] or 0)
+                susp[i] += float(a[1] or 0)
+                llm[i] += float(a[2] or 0)
+                if a[3] and a[3] < q_ts[i] and not (last[i] >= a[3]):
+                    last[i] = a[3]
+                for q, v in pq.items():            # «живых» до ts нет — квантили одного архива
+                    if np.isnan(v[i]) and a[_ARCHIVE_Q[q]] is not None:
+                        v[i] = a[_ARCHIVE_Q[q]]
+                if a[7]:
+                    w = decay_w(q_ts[i] - a[7])
+                    d_cnt[i] += float(a[5] or 0.0) * w
+                    d_susp[i] += float(a[6] or 0.0) * w
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rate = np.where(cnt > 0, susp / np.maximum(cnt, 1), 0.0)
+        last_days = np.where(np.isnan(last), NEVER_DAYS, np.maximum(0.0, (q_ts - last) / 86400.0))
+        out = dict(cnt_total=cnt, cnt_suspicious=susp, susp_rate=rate,
+                   last_seen_days=last_days, llm_flags_total=llm, **{f"p{q}": v for q, v in pq.items()})
+        if self._decay:
+            out.update(cnt_suspicious_decayed=d_susp, susp_rate_decayed=d_susp / (d_cnt + DECAY_RATE_K))
+        return out
+
+
+def add_asof_history(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Колонки debit_*/credit_* истории «на момент операции» для всей выписки сразу.
+    Их подхватывает build_llm_payload (tools.py) вместо combine_hist_for_row.
+    """
+    d_inn = canon_inn_array(df["debit_inn"])
+    c_inn = canon_inn_array(df["credit_inn"])
+    ts = statement_ts(df)
+    all_inns = np.unique(np.concatenate([d_inn, c_inn]))
+    all_inns = all_inns[all_inns != 0]
+
+    hist = AsOfHistory.from_memory(all_inns.tolist())
+    # watchlisted — ручной флаг, network_risk — текущее состояние графа: берём как есть
+    agg = get_store().read_counterparties(all_inns.tolist())
+
+    for role, inns in (("debit", d_inn), ("credit", c_inn)):
+        h = hist.lookup(inns, ts)
+        df[f"{role}_cnt_total"] = h["cnt_total"]
+        df[f"{role}_cnt_suspicious"] = h["cnt_suspicious"]
+        df[f"{role}_susp_rate"] = h["susp_rate"]
+        df[f"{role}_last_seen_days"] = h["last_seen_days"]
+        df[f"{role}_p95"] = h["p95"]
+        df[f"{role}_llm_flags_total"] = h["llm_flags_total"]
+        if PRIOR_DECAY:
+            for k in DECAY_HIST_KEYS:
+                df[f"{role}_{k}"] = h[k]
+        df[f"{role}_watchlisted"] = [int((agg.get(int(k)) or {}).get("watchlisted") or 0) for k in inns]
+        df[f"{role}_network_risk"] = [float((agg.get(int(k)) or {}).get("network_risk") or 0.0) for k in inns]
+    return df
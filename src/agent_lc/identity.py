@@ -0,0 +1,94 @@
+# src/agent_lc/identity.py
+"""
+Идентичность операций и решений.
+
+tx_id — хеш содержимого строки выписки (дата, счета, ИНН, суммы, назначение),
+а не её номер: номер id у разных выписок совпадает (_ensure_ids нумерует
+1..N), и INSERT OR IGNORE молча оставлял в памяти чужую операцию. Одна и та
+же операция в месячной и недельной выписке получает один tx_id; полные
+дубли внутри выписки различаются суффиксом «#k» (k-й повтор).
+
+decision_version() — подпись всего, от чего зависит итог по строке: файл
+ML-модели, промпт, веса смешивания и порог. Решение с той же подписью
+переиспользуется (pipeline), а не отправляется в LLM повторно.
+"""
+import hashlib, os
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from .config import MODEL_PATH, W_ML, W_PRIOR, W_LLM, THRESH, PRIOR_DECAY, DECAY_HALF_LIFE_DAYS
+from .history import statement_ts, canon_inn_array
+from .prompt_v3 import PROMPT_V3
+
+TX_ID_LEN = 20      # hex-символов sha1 (80 бит)
+TX_ID_CHUNK = 20_000     # строк за раз в tx_ids (строки-ключи не копятся на всю выписку)
+
+
+def _text(df: pd.DataFrame, col: str) -> pd.Series:
+    """Колонка → нормализованный текст: без артефакта «.0» и лишних пробелов; нет колонки/NaN → ''."""
+    if col not in df.columns:
+        return pd.Series("", index=df.index)
+    s = df[col].astype("string").fillna("").str.strip()
+    return s.str.replace(r"\.0$", "", regex=True).str.split().str.join(" ").fillna("")
+
+
+def _amount(df: pd.DataFrame, col: str) -> pd.Series:
+    if col not in df.columns:
+        return pd.Series("", index=df.index)
+    a = pd.to_numeric(df[col], errors="coerce").abs().round(2)
+    return a.map(lambda x: "" if pd.isna(x) else f"{x:.2f}")
+
+
+def _content_hashes(df: pd.DataFrame, ts: np.ndarray) -> list:
+    parts = [
+        pd.Series(np.where(np.isnan(ts), -1, ts).astype(np.int64), index=df.index).astype(str),
+        _text(df, "debit_account"), _text(df, "credit_account"),
+        *(pd.Series(canon_inn_array(df[c]) if c in df.columns else np.zeros(len(df), np.int64),
+                    index=df.index).astype(str) for c in ("debit_inn", "credit_inn")),
+        _amount(df, "debit_amount"), _amount(df, "credit_amount"),
+        _text(df, "purpose"),
+    ]
+    key = parts[0].str.cat(parts[1:], sep="|")
+    return [hashlib.sha1(k.encode("utf-8")).hexdigest()[:TX_ID_LEN] for k in key]
+
+
+def tx_ids(df: pd.DataFrame) -> pd.Series:
+    """
+    Стабильный tx_id каждой строки выписки (str), по содержимому.
+    Строки-ключи собираются по TX_ID_CHUNK строк, а не на всю выписку сразу (пик памяти).
+    """
+    ts = statement_ts(df)       # разбор дат — по всей колонке (формат один на выписку)
+    h = []
+    for i in range(0, len(df), TX_ID_CHUNK):
+        h += _content_hashes(df.iloc[i:i + TX_ID_CHUNK], ts[i:i + TX_ID_CHUNK])
+    h = pd.Series(h, index=df.index)
+    dup = h.groupby(h).cumcount()
+    return h.where(dup == 0, h + "#" + dup.astype(str))
+
+
+@lru_cache(maxsize=8)
+def _file_digest(path: str, size: int, mtime_ns: int) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def decision_version() -> str:
+    """Подпись версии решений: модель (содержимое файла) + промпт + веса/порог."""
+    try:
+        st = os.stat(MODEL_PATH)
+        model = _file_digest(MODEL_PATH, st.st_size, st.st_mtime_ns)
+    except OSError:
+        model = "no-model"
+    h = hashlib.sha1()
+    weights = f"{W_ML}|{W_PRIOR}|{W_LLM}|{THRESH}"
+    if PRIOR_DECAY:
+        weights += f"|decay={DECAY_HALF_LIFE_DAYS}"       # PRIOR по затухающим счётчикам
+    for part in (model, PROMPT_V3, weights):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()[:16]
@@ -0,0 +1,84 @@
+# src/agent_lc/json_stream.py
+"""
+Инкрементальный разбор ответа LLM по мере генерации.
+
+    parser = TransactionStream()
+    for chunk in llm.stream(messages):
+        for t in parser.feed(chunk.content):
+            ...   # t — очередной закрытый объект из "transactions": [...]
+
+Разбор посимвольный со стеком скобок и учётом строк/экранирования, поэтому
+«{», «}» и «transactions» внутри текстов (объяснения, назначение платежа)
+ничего не ломают. Преамбула вокруг JSON (```json, пояснения модели) до
+первой «{» пропускается. Весь текст копится в .text — для итогового
+_extract_json (overall_observation и сверка, что ничего не пропущено).
+"""
+import json
+from typing import Any, Dict, Iterator, List, Optional
+
+ARRAY_KEY = "transactions"
+
+
+class TransactionStream:
+    def __init__(self, key: str = ARRAY_KEY):
+        self.key = key
+        self.text = ""
+        self._pos = 0                     # сколько символов .text уже разобрано
+        self._stack: List[str] = []       # открытые «{» / «[»
+        self._in_str = False
+        self._esc = False
+        self._str_start = 0
+        self._last_str: Optional[str] = None
+        self._pending_key: Optional[str] = None   # ключ перед «:» в текущем объекте
+        self._arr_depth: Optional[int] = None     # глубина стека внутри массива transactions
+        self._obj_start: Optional[int] = None
+        self.done = False                 # массив закрыт
+
+    def feed(self, chunk: str) -> Iterator[Dict[str, Any]]:
+        """Дописать кусок ответа. → объекты массива, закрывшиеся в этом куске."""
+        self.text += chunk or ""
+        text, stack = self.text, self._stack
+        for i in range(self._pos, len(text)):
+            c = text[i]
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif c == "\\":
+                    self._esc = True
+                elif c == '"':
+                    self._in_str = False
+                    self._last_str = text[self._str_start + 1:i]
+                continue
+            if c == '"':
+                self._in_str, self._str_start = True, i
+            elif c == ":":
+                self._pending_key = self._last_str if stack and stack[-1] == "{" else None
+            elif c == ",":
+                self._pending_key = None
+            elif c in "{[":
+                if (c == "[" and len(stack) == 1 and self._pending_key == self.key
+                        and self._arr_depth is None and not self.done):
+                    self._arr_depth = len(stack) + 1
+                elif c == "{" and self._arr_depth is not None and len(stack) == self._arr_depth:
+                    self._obj_start = i
+                stack.append(c)
+                self._pending_key = None
+            elif c in "}]" and stack:
+                stack.pop()
+                if c == "}" and self._obj_start is not None and len(stack) == self._arr_depth:
+                    obj = _loads(text[self._obj_start:i + 1])
+                    self._obj_start = None
+                    if obj is not None:
+                        self._pos = i + 1
+                        yield obj
+                elif c == "]" and self._arr_depth is not None and len(stack) == self._arr_depth - 1:
+                    self._arr_depth, self.done = None, True
+        self._pos = len(text)
+
+
+def _loads(s: str) -> Optional[Dict[str, Any]]:
+    try:
+        obj = json.loads(s)
+    except ValueError:
+        return None
+    return obj if isinstance(obj, dict) else None
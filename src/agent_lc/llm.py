@@ -1,12 +1,17 @@
 # src/agent_lc/llm.py
 import os
 import json
-import requests
+import threading
+import time
+from contextlib import nullcontext
 from langchain_core.messages import SystemMessage, HumanMessage
-from langchain_gigachat import GigaChat
 
 from .prompt_v3 import PROMPT_V3
 from .logging_utils import log_llm_io
+from .telemetry import span
+from .config import LLM_RETRIES, LLM_RETRY_BACKOFF_S, LLM_CONCURRENCY
+from .json_stream import TransactionStream
+from . import llm_usage
 
 # -----------------------------
 # ИНИЦИАЛИЗАЦИЯ GigaChat (OAuth)
@@ -15,43 +20,67 @@ from .logging_utils import log_llm_io
 #   GIGACHAT_API_KEY   — base64(client_id:client_secret)
 #   GIGACHAT_SCOPE     — по умолчанию 'GIGACHAT_API_PERS'
 #   GIGACHAT_MODEL     — например 'GigaChat-2'
-GIGACHAT_API_KEY = os.environ.get("GIGACHAT_API_KEY")
-GIGACHAT_SCOPE   = os.environ.get("GIGACHAT_SCOPE", "GIGACHAT_API_PERS")
-GIGACHAT_MODEL   = os.environ.get("GIGACHAT_MODEL", "GigaChat-2")
+# Читаются при создании клиента, а не при импорте; requests и langchain_gigachat — там же.
+def _gigachat_env() -> tuple:
+    return (os.environ.get("GIGACHAT_API_KEY"), os.environ.get("GIGACHAT_SCOPE", "GIGACHAT_API_PERS"),
+            os.environ.get("GIGACHAT_MODEL", "GigaChat-2"))
+
+def _model_name() -> str:
+    return _gigachat_env()[2]
 
 def _get_access_token() -> str:
     """Запрашиваем access_token у NGW. verify=False — как в твоём примере (внутренняя среда)."""
+    import requests
+    api_key, scope, _ = _gigachat_env()
     url = "https://ngw.devices.sberbank.ru:9443/api/v2/oauth"
     headers = {
         "Content-Type": "application/x-www-form-urlencoded",
         "Accept": "application/json",
         "RqUID": "2aba969c-a22a-4816-a652-393a756a96c1",
-        "Authorization": f"Basic {GIGACHAT_API_KEY}",
+        "Authorization": f"Basic {api_key}",
     }
-    payload = {"scope": GIGACHAT_SCOPE}
+    payload = {"scope": scope}
     resp = requests.post(url, headers=headers, data=payload, verify=False, timeout=30)
     resp.raise_for_status()
     data = resp.json()
     return data["access_token"]
 
-# ленивый синглтон LLM
+# ленивый синглтон LLM (один клиент и одна авторизация на процесс, в т.ч. для потоков cli.py batch)
 _LLM = None
+_LLM_LOCK = threading.Lock()
 def _get_llm():
     global _LLM
-    if _LLM is None:
-        # Можно передать credentials=GIGACHAT_API_KEY (SDK сам получит токен),
-        # но раз у тебя уже настроен отдельный OAuth — возьмём явный токен.
-        access_token = _get_access_token()
-        _LLM = GigaChat(
-            credentials=GIGACHAT_API_KEY,          # access_token
-            model=GIGACHAT_MODEL,
-            top_p=0,
-            timeout=120,
-            verify_ssl_certs=False,
-            temperature=0.0,
-        )
+    with _LLM_LOCK:
+        if _LLM is None:
+            _LLM = _new_llm()
     return _LLM
 
+def _new_llm():
+    # Можно передать credentials=GIGACHAT_API_KEY (SDK сам получит токен),
+    # но раз у тебя уже настроен отдельный OAuth — возьмём явный токен.
+    from langchain_gigachat import GigaChat
+    access_token = _get_access_token()
+    api_key, _, model = _gigachat_env()
+    return GigaChat(
+        credentials=api_key,                   # access_token
+        model=model,
+        top_p=0,
+        timeout=120,
+        verify_ssl_certs=False,
+        temperature=0.0,
+    )
+
+# предел одновременных запросов (LLM_CONCURRENCY): общий для всех потоков процесса
+_SLOTS = threading.BoundedSemaphore(LLM_CONCURRENCY) if LLM_CONCURRENCY > 0 else None
+
+def set_concurrency(n: int | None) -> None:
+    """Новый предел одновременных запросов к LLM (0/None — без предела)."""
+    global _SLOTS
+    _SLOTS = threading.BoundedSemaphore(int(n)) if n and int(n) > 0 else None
+
+def _slot():
+    return _SLOTS if _SLOTS is not None else nullcontext()
+
 def _extract_json(text: str) -> dict:
     """Робастный парсинг JSON: пробуем целиком, затем вырезку от первого '{' до последней '}'."""
     text = (text or "").strip()
@@ -63,42 +92,153 @@ def _extract_json(text: str) -> dict:
             raise ValueError("LLM вернул не-JSON и подходящих скобок не найдено")
         return json.loads(text[s : e + 1])
 
+def _invoke_with_retries(llm, messages):
+    """invoke с повторами (LLM_RETRIES, пауза BACKOFF·2^k). → (ответ, число повторов)."""
+    for attempt in range(LLM_RETRIES + 1):
+        try:
+            return llm.invoke(messages), attempt
+        except Exception as e:
+            if attempt == LLM_RETRIES:
+                e.llm_retries = attempt
+                raise
+            time.sleep(LLM_RETRY_BACKOFF_S * 2 ** attempt)
+
 def call_llm(rows):
     """
-    Вызов GigaChat + логирование prompt/response.
+    Вызов GigaChat + логирование prompt/response + учёт (llm_usage: токены, задержка, повторы).
     rows: список словарей (INPUT_DATA из промпта).
     return: dict вида {"overall_observation": "...", "transactions": [...]}
     """
     # 1) собираем сообщения
+    user_text = json.dumps({"INPUT_DATA": rows}, ensure_ascii=False)
     messages = [
         SystemMessage(content=PROMPT_V3),
-        HumanMessage(content=json.dumps({"INPUT_DATA": rows}, ensure_ascii=False)),
+        HumanMessage(content=user_text),
     ]
+    prompt_log = {"system": PROMPT_V3[:2000] + "...", "input_rows_sample": rows[:3], "input_len": len(rows)}
 
-    # 2) вызов GigaChat
+    # 2) вызов GigaChat (задержка — по стене, вместе с повторами)
     llm = _get_llm()
-    resp = llm.invoke(messages)
+    t0 = time.perf_counter()
+    try:
+        with _slot():
+            resp, retries = _invoke_with_retries(llm, messages)
+    except Exception as e:
+        p_est, _, _ = llm_usage.token_usage(None, PROMPT_V3 + user_text, "")   # ответа нет — только оценка
+        llm_usage.record(_model_name(), len(rows), p_est, 0, (time.perf_counter() - t0) * 1000,
+                         getattr(e, "llm_retries", 0), "error", True)
+        raise
+    latency_ms = (time.perf_counter() - t0) * 1000
     text = getattr(resp, "content", "").strip()
+    p_tok, c_tok, estimated = llm_usage.token_usage(resp, PROMPT_V3 + user_text, text)
+    usage = dict(prompt_tokens=p_tok, completion_tokens=c_tok, latency_ms=round(latency_ms, 1), retries=retries)
 
     # 3) робастный JSON
     try:
-        data = _extract_json(text)
+        with span("json_parse"):
+            data = _extract_json(text)
     except Exception as e:
+        llm_usage.record(_model_name(), len(rows), p_tok, c_tok, latency_ms, retries, "parse_error", estimated)
         # логируем даже ошибочные ответы
         log_llm_io(
             endpoint="gigachat.chat",
-            prompt={"system": PROMPT_V3[:2000] + "...", "input_rows_sample": rows[:3], "input_len": len(rows)},
+            prompt=prompt_log,
             response={"raw_text": text, "error": str(e)},
-            meta={"model": GIGACHAT_MODEL, "ok": False},
+            meta={"model": _model_name(), "ok": False, **usage},
         )
         # отдаём пустую структуру — пайплайн сам подставит фолбэк
         return {"overall_observation": "", "transactions": []}
 
     # 4) логирование нормального ответа
+    llm_usage.record(_model_name(), len(rows), p_tok, c_tok, latency_ms, retries, "ok", estimated)
     log_llm_io(
         endpoint="gigachat.chat",
-        prompt={"system": PROMPT_V3[:2000] + "...", "input_rows_sample": rows[:3], "input_len": len(rows)},
+        prompt=prompt_log,
         response=data,
-        meta={"model": GIGACHAT_MODEL, "ok": True},
+        meta={"model": _model_name(), "ok": True, **usage},
     )
     return data
+
+def call_llm_stream(rows, meta: dict | None = None):
+    """
+    Потоковый вызов GigaChat (LLM_STREAM=1): генератор транзакций из "transactions" —
+    каждая отдаётся, как только её объект закрылся в потоке (json_stream), и смешивание/
+    запись в память по ней идут, пока модель дописывает остальные.
+    meta (если передан) после исчерпания: overall_observation.
+    Обрыв потока — исключение у потребителя; уже отданные транзакции остаются за ним.
+    Повтор (LLM_RETRIES) — только если поток оборвался до первого куска ответа.
+    """
+    user_text = json.dumps({"INPUT_DATA": rows}, ensure_ascii=False)
+    messages = [
+        SystemMessage(content=PROMPT_V3),
+        HumanMessage(content=user_text),
+    ]
+    prompt_log = {"system": PROMPT_V3[:2000] + "...", "input_rows_sample": rows[:3], "input_len": len(rows)}
+
+    llm = _get_llm()
+    t0 = time.perf_counter()
+    parser, acc, retries, first_tx_ms, seen = TransactionStream(), None, 0, None, set()
+    try:
+        with _slot():       # слот занят, пока открыт поток ответа
+            for attempt in range(LLM_RETRIES + 1):
+                try:
+                    for chunk in llm.stream(messages):
+                        acc = chunk if acc is None else acc + chunk
+                        for t in parser.feed(getattr(chunk, "content", "") or ""):
+                            if first_tx_ms is None:
+                                first_tx_ms = round((time.perf_counter() - t0) * 1000, 1)
+                            seen.add(t.get("id"))
+                            yield t
+                    break
+                except Exception:
+                    if acc is not None or attempt == LLM_RETRIES:
+                        raise
+                    retries += 1
+                    time.sleep(LLM_RETRY_BACKOFF_S * 2 ** attempt)
+    except Exception as e:
+        latency_ms = (time.perf_counter() - t0) * 1000
+        p_tok, c_tok, estimated = llm_usage.token_usage(acc, PROMPT_V3 + user_text, parser.text)
+        llm_usage.record(_model_name(), len(rows), p_tok, c_tok, latency_ms, retries, "error", estimated)
+        log_llm_io(
+            endpoint="gigachat.chat.stream",
+            prompt=prompt_log,
+            response={"raw_text": parser.text, "error": str(e), "streamed_tx": len(seen)},
+            meta={"model": _model_name(), "ok": False, "latency_ms": round(latency_ms, 1),
+                  "first_tx_ms": first_tx_ms, "retries": retries},
+        )
+        raise
+
+    latency_ms = (time.perf_counter() - t0) * 1000
+    text = parser.text.strip()
+    p_tok, c_tok, estimated = llm_usage.token_usage(acc, PROMPT_V3 + user_text, text)
+    usage = dict(prompt_tokens=p_tok, completion_tokens=c_tok, latency_ms=round(latency_ms, 1),
+                 retries=retries, first_tx_ms=first_tx_ms)
+
+    # сверка по целому ответу: overall_observation и транзакции, которые потоковый
+    # разбор не увидел (нестандартная обёртка JSON)
+    try:
+        with span("json_parse"):
+            data = _extract_json(text)
+    except Exception as e:
+        llm_usage.record(_model_name(), len(rows), p_tok, c_tok, latency_ms, retries,
+                         "ok" if seen else "parse_error", estimated)
+        log_llm_io(
+            endpoint="gigachat.chat.stream",
+            prompt=prompt_log,
+            response={"raw_text": text, "error": str(e), "streamed_tx": len(seen)},
+            meta={"model": _model_name(), "ok": bool(seen), **usage},
+        )
+        return
+    for t in data.get("transactions", []) or []:
+        if isinstance(t, dict) and t.get("id") not in seen:
+            yield t
+    if meta is not None:
+        meta["overall_observation"] = data.get("overall_observation", "")
+
+    llm_usage.record(_model_name(), len(rows), p_tok, c_tok, latency_ms, retries, "ok", estimated)
+    log_llm_io(
+        endpoint="gigachat.chat.stream",
+        prompt=prompt_log,
+        response=data,
+        meta={"model": _model_name(), "ok": True, **usage},
+    )
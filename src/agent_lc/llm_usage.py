@@ -0,0 +1,112 @@
+# src/agent_lc/llm_usage.py
+"""
+Учёт вызовов LLM: токены, задержка, повторы, успех разбора ответа.
+
+Каждый вызов GigaChat (llm.call_llm) — одна запись в память (llm_usage) с
+run_id текущего прогона. Токены — из ответа API (usage_metadata /
+response_metadata.token_usage); если API их не вернул — оценка по длине
+текста (estimated=1, в отчёте видно, что это оценка).
+
+По записям прогона summarize() строит распределения (p50/p90/p99) задержки
+и токенов — на вызов и на транзакцию — и разрез по размеру пакета: сколько
+токенов стоит одна операция при batch=5 против batch=20. Это лист llm_usage
+в Excel-отчёте и поле llm_usage в результате run_pipeline.
+"""
+import threading, time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .storage import get_store
+
+CHARS_PER_TOKEN = 4.0       # грубая оценка, если API не вернул usage
+QUANTILES = (50, 90, 99)
+
+_TLS = threading.local()                    # run_id — свой у каждого потока (выписки cli.py batch, LLM-фаза)
+_SPENT: Dict[Optional[str], int] = {}      # run_id → токенов, записанных этим процессом (бюджет scheduler.py)
+
+
+def set_run(run_id: Optional[str]) -> None:
+    """Прогон, к которому относятся следующие вызовы этого потока (ставит run_llm_batches, в т.ч. в воркере шарда)."""
+    _TLS.run_id = run_id
+
+
+def token_usage(resp, prompt_text: str, response_text: str) -> Tuple[int, int, bool]:
+    """→ (prompt_tokens, completion_tokens, estimated) по ответу langchain-модели."""
+    um = getattr(resp, "usage_metadata", None) or {}
+    if um.get("input_tokens") is not None:
+        return int(um["input_tokens"]), int(um.get("output_tokens") or 0), False
+    tu = (getattr(resp, "response_metadata", None) or {}).get("token_usage") or {}
+    if not isinstance(tu, dict):        # у части SDK — pydantic-объект
+        tu = getattr(tu, "__dict__", {})
+    if tu.get("prompt_tokens") is not None:
+        return int(tu["prompt_tokens"]), int(tu.get("completion_tokens") or 0), False
+    return (int(np.ceil(len(prompt_text) / CHARS_PER_TOKEN)),
+            int(np.ceil(len(response_text or "") / CHARS_PER_TOKEN)), True)
+
+
+def record(model: str, batch_rows: int, prompt_tokens: int, completion_tokens: int,
+           latency_ms: float, retries: int, status: str, estimated: bool) -> Dict[str, Any]:
+    """Записать один вызов. status: ok / parse_error / error (исключение после всех повторов)."""
+    run_id = getattr(_TLS, "run_id", None)
+    rec = dict(run_id=run_id, ts=int(time.time()), model=model, batch_rows=int(batch_rows),
+               prompt_tokens=int(prompt_tokens), completion_tokens=int(completion_tokens),
+               latency_ms=round(float(latency_ms), 1), retries=int(retries), status=status,
+               estimated=int(bool(estimated)))
+    get_store().log_llm_usage(rec)
+    _SPENT[run_id] = _SPENT.get(run_id, 0) + rec["prompt_tokens"] + rec["completion_tokens"]
+    return rec
+
+
+def tokens_spent(run_id: Optional[str]) -> int:
+    """Токенов по прогону, потраченных в этом процессе (без воркеров шардов)."""
+    return _SPENT.get(run_id, 0)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Сводка по прогону
+# ─────────────────────────────────────────────────────────────────────────────
+def _q(values, prefix: str) -> Dict[str, float]:
+    v = np.asarray(values, dtype=float)
+    if not len(v):
+        return {f"{prefix}_p{q}": None for q in QUANTILES}
+    return {f"{prefix}_p{q}": round(float(np.percentile(v, q)), 1) for q in QUANTILES}
+
+
+def summarize(records: List[Dict[str, Any]]) -> Tuple[Dict[str, Any], pd.DataFrame]:
+    """
+    Записи прогона → (сводка, разрез по размеру пакета).
+    Токены на транзакцию — (prompt + completion) / batch_rows вызова.
+    """
+    df = pd.DataFrame(records, columns=["batch_rows", "prompt_tokens", "completion_tokens",
+                                        "latency_ms", "retries", "status", "estimated"])
+    df["total_tokens"] = df["prompt_tokens"] + df["completion_tokens"]
+    df["tokens_per_tx"] = df["total_tokens"] / df["batch_rows"].clip(lower=1)
+
+    summary = {
+        "calls": int(len(df)),
+        "transactions": int(df["batch_rows"].sum()),
+        "prompt_tokens": int(df["prompt_tokens"].sum()),
+        "completion_tokens": int(df["completion_tokens"].sum()),
+        "retries": int(df["retries"].sum()),
+        "parse_errors": int((df["status"] == "parse_error").sum()),
+        "errors": int((df["status"] == "error").sum()),
+        "estimated_calls": int(df["estimated"].sum()),
+        **_q(df["latency_ms"], "latency_ms"),
+        **_q(df["total_tokens"], "tokens_per_call"),
+        **_q(df["tokens_per_tx"], "tokens_per_tx"),
+    }
+
+    rows = []
+    for size, g in df.groupby("batch_rows", sort=True):
+        rows.append({
+            "batch_rows": int(size), "calls": int(len(g)),
+            "prompt_tokens_mean": round(float(g["prompt_tokens"].mean()), 1),
+            "completion_tokens_mean": round(float(g["completion_tokens"].mean()), 1),
+            "tokens_per_tx_mean": round(float(g["tokens_per_tx"].mean()), 1),
+            **_q(g["latency_ms"], "latency_ms"),
+            "retries": int(g["retries"].sum()),
+            "parse_errors": int((g["status"] == "parse_error").sum()),
+        })
+    return summary, pd.DataFrame(rows)
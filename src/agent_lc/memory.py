@@ -1,26 +1,42 @@
 # src/agent_lc/memory.py
-import os, sqlite3, json, time
-from typing import Dict, Any, Iterable
-from .config import DB_PATH
+import bisect, os, sqlite3, json, time, math, numbers, calendar, threading, uuid
+import datetime as _dt
+from typing import Dict, Any, Iterable, Optional
+from .config import DB_PATH, DECAY_HALF_LIFE_DAYS, PRIOR_DECAY
+from .telemetry import count_sql
 
-# ─────────────────────────────────────────────────────────────────────────────
-# INIT: создаём БД/таблицы и добавляем недостающие колонки (если схема обновилась)
-# ─────────────────────────────────────────────────────────────────────────────
-def mem_init():
-    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    con = sqlite3.connect(DB_PATH)
-    cur = con.cursor()
-    cur.executescript("""
-    PRAGMA journal_mode=WAL;
+# Версия схемы памяти (PRAGMA user_version):
+#   0/1 — исходная: ИНН и ts как TEXT, purpose целиком в каждой строке tx
+#   2   — компактная: ИНН — int64, ts — epoch (UTC), purpose — через словарь,
+#         WITHOUT ROWID у таблиц с текстовым/составным ключом
+#   3   — граф контрагентов: graph_edge + agg_counterparty.network_risk (network.py)
+#   4   — журнал прогонов: runs + run_journal (возобновление LLM-пакетов, --resume)
+#   5   — tx_id — хеш содержимого (identity.py); decisions.version + result_json
+#         для переиспользования решений между прогонами
+#   6   — llm_usage: токены/задержка/повторы каждого вызова LLM (llm_usage.py)
+#   7   — decisions.llm_status: done — окончательное; pending (фаза 1 двухфазного
+#         прогона), skipped (не хватило бюджета LLM) и error (сбой LLM) — без LLM,
+#         не переиспользуются
+#   8   — ml_cache: ml_metric по (отпечаток файла модели, хеш входных признаков строки)
+#   9   — затухающие счётчики ИНН (agg_counterparty/agg_archive: d_cnt, d_susp, d_amt, decay_ts),
+#         ведутся триггерами на tx/decisions; mem_meta — период полураспада, с которым они посчитаны
+#   10  — agg_archive.amt_hist: гистограмма сумм архива (retention.py), квантили сливаются без смещения
+SCHEMA_VERSION = 10
+
+_SCHEMA_V2 = """
+    CREATE TABLE IF NOT EXISTS purpose_dict (
+      purpose_id INTEGER PRIMARY KEY,
+      text TEXT NOT NULL UNIQUE
+    );
 
     CREATE TABLE IF NOT EXISTS tx (
       tx_id TEXT PRIMARY KEY,
-      ts TEXT,
-      debit_inn TEXT,
-      credit_inn TEXT,
+      ts INTEGER,                  -- epoch, UTC
+      debit_inn INTEGER,
+      credit_inn INTEGER,
       amount REAL,
-      purpose TEXT
-    );
+      purpose_id INTEGER           -- → purpose_dict
+    ) WITHOUT ROWID;
 
     CREATE TABLE IF NOT EXISTS decisions (
       tx_id TEXT PRIMARY KEY,
@@ -32,124 +48,785 @@ def mem_init():
       is_suspicious INTEGER,
       rule_hits TEXT,
       reasons_llm TEXT,
-      inserted_at TEXT
-    );
+      inserted_at INTEGER
+    ) WITHOUT ROWID;
 
     CREATE TABLE IF NOT EXISTS agg_counterparty (
-      inn TEXT PRIMARY KEY,
+      inn INTEGER PRIMARY KEY,
       cnt_total REAL,
       cnt_suspicious REAL,
       susp_rate REAL,
       amt_total REAL,
       amt_suspicious REAL,
-      last_seen_ts TEXT,
+      last_seen_ts INTEGER,
       watchlisted INTEGER DEFAULT 0,
-      p50 REAL, p75 REAL, p90 REAL, p95 REAL
+      p50 REAL, p75 REAL, p90 REAL, p95 REAL,
+      llm_flags_total REAL DEFAULT 0,
+      llm_last_seen_ts INTEGER
+    );
+
+    -- нормализованный «индекс участников»: одна строка на (ИНН, роль) каждой tx.
+    -- WITHOUT ROWID + PK (inn, ts, ...) = покрывающий индекс по (inn, ts):
+    -- история ИНН читается одним range-scan без OR и без возврата в tx
+    CREATE TABLE IF NOT EXISTS tx_party (
+      inn INTEGER NOT NULL,
+      ts INTEGER NOT NULL,
+      tx_id TEXT NOT NULL,
+      role TEXT NOT NULL,          -- 'D' дебет / 'C' кредит
+      amount REAL,
+      PRIMARY KEY (inn, ts, tx_id, role)
+    ) WITHOUT ROWID;
+
+    -- сводка по заархивированному периоду (см. retention.py): нужна, чтобы
+    -- агрегаты/PRIOR не «забывали» историю, вынесенную из tx/decisions
+    CREATE TABLE IF NOT EXISTS agg_archive (
+      inn INTEGER PRIMARY KEY,
+      cnt_total REAL,
+      cnt_suspicious REAL,
+      amt_total REAL,
+      amt_suspicious REAL,
+      llm_flags_total REAL,
+      last_seen_ts INTEGER,
+      p50 REAL, p75 REAL, p90 REAL, p95 REAL,
+      archived_until INTEGER
     );
 
     CREATE TABLE IF NOT EXISTS llm_log (
       id INTEGER PRIMARY KEY AUTOINCREMENT,
-      ts TEXT,
+      ts INTEGER,
       endpoint TEXT,
       prompt TEXT,
       response TEXT,
       meta TEXT
     );
-    """)
-    # — добавляем мягкие поля для LLM-флагов, если их ещё нет
-    try:
-        cur.execute("ALTER TABLE agg_counterparty ADD COLUMN llm_flags_total REAL DEFAULT 0;")
-    except sqlite3.OperationalError:
-        pass
-    try:
-        cur.execute("ALTER TABLE agg_counterparty ADD COLUMN llm_last_seen_ts TEXT;")
-    except sqlite3.OperationalError:
-        pass
 
-    # индексы для скорости (idempotent)
-    try:
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_tx_ts ON tx(ts);")
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_tx_debit ON tx(debit_inn);")
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_tx_credit ON tx(credit_inn);")
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_decisions_label ON decisions(label_pred);")
-    except sqlite3.OperationalError:
-        pass
+    CREATE INDEX IF NOT EXISTS idx_tx_ts ON tx(ts);
+    CREATE INDEX IF NOT EXISTS idx_decisions_label ON decisions(label_pred);
+    CREATE INDEX IF NOT EXISTS idx_llm_log_ts ON llm_log(ts);
+"""
+
+# v3: рёбра графа «кто кому платил» (src = дебет, dst = кредит) с числом и суммой
+# платежей. Ведутся триггером на вставку в tx: INSERT OR IGNORE повторной
+# выписки триггер не вызывает, поэтому счётчики не задваиваются. Удаление из tx
+# (retention) рёбра не трогает — как и agg_archive, граф помнит архивный период.
+_GRAPH_EDGE_DDL = """
+    CREATE TABLE IF NOT EXISTS graph_edge (
+      src INTEGER NOT NULL,
+      dst INTEGER NOT NULL,
+      cnt REAL NOT NULL,
+      amt REAL NOT NULL,
+      PRIMARY KEY (src, dst)
+    ) WITHOUT ROWID
+"""
+
+_SCHEMA_V3 = _GRAPH_EDGE_DDL + """;
+    CREATE TRIGGER IF NOT EXISTS trg_tx_graph_edge AFTER INSERT ON tx
+    WHEN NEW.debit_inn IS NOT NULL AND NEW.credit_inn IS NOT NULL AND NEW.debit_inn <> NEW.credit_inn
+    BEGIN
+      INSERT INTO graph_edge(src, dst, cnt, amt) VALUES (NEW.debit_inn, NEW.credit_inn, 1, COALESCE(NEW.amount, 0))
+      ON CONFLICT(src, dst) DO UPDATE SET cnt = cnt + 1, amt = amt + excluded.amt;
+    END;
+"""
+
+# v4: журнал прогонов. Пакет LLM фиксируется после того, как его решения
+# записаны в decisions; при --resume готовые пакеты берутся отсюда, а не из LLM.
+_SCHEMA_V4 = """
+    CREATE TABLE IF NOT EXISTS runs (
+      run_id TEXT PRIMARY KEY,
+      input_hash TEXT NOT NULL,    -- sha1 выписки + параметров, от которых зависят пакеты
+      started_at INTEGER,
+      finished_at INTEGER,
+      status TEXT,                 -- running / done
+      params TEXT
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS run_journal (
+      run_id TEXT NOT NULL,
+      batch_key TEXT NOT NULL,
+      tx_ids TEXT,                 -- JSON: id строк пакета (сверка при возобновлении)
+      result TEXT,                 -- JSON: итоговые транзакции пакета
+      done_at INTEGER,
+      PRIMARY KEY (run_id, batch_key)
+    ) WITHOUT ROWID;
+
+    CREATE INDEX IF NOT EXISTS idx_runs_input ON runs(input_hash, started_at);
+"""
+
+# v6: учёт вызовов LLM — строка на вызов, сводка по run_id (лист llm_usage в отчёте)
+_SCHEMA_V6 = """
+    CREATE TABLE IF NOT EXISTS llm_usage (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      run_id TEXT,
+      ts INTEGER,
+      model TEXT,
+      batch_rows INTEGER,
+      prompt_tokens INTEGER,
+      completion_tokens INTEGER,
+      latency_ms REAL,             -- стена вызова вместе с повторами
+      retries INTEGER,
+      status TEXT,                 -- ok / parse_error / error
+      estimated INTEGER            -- 1: токены оценены по длине текста
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_llm_usage_run ON llm_usage(run_id);
+    CREATE INDEX IF NOT EXISTS idx_llm_usage_ts ON llm_usage(ts);
+"""
+
+# v8: кэш предсказаний модели (model.predict_with_pipeline) — другой файл модели, другой ключ
+_SCHEMA_V8 = """
+    CREATE TABLE IF NOT EXISTS ml_cache (
+      model TEXT NOT NULL,         -- отпечаток файла модели (sha1 содержимого)
+      h1 INTEGER NOT NULL,         -- 128-битный хеш входных признаков строки
+      h2 INTEGER NOT NULL,
+      ml_metric REAL NOT NULL,
+      ts INTEGER,
+      PRIMARY KEY (model, h1, h2)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS ml_model (
+      model TEXT PRIMARY KEY,
+      columns TEXT NOT NULL,       -- JSON: входные признаки модели (feature_names_in_)
+      seen_at INTEGER
+    ) WITHOUT ROWID;
+
+    CREATE INDEX IF NOT EXISTS idx_ml_cache_ts ON ml_cache(ts);
+"""
+
+# v9: затухающие счётчики ИНН — число операций, число подозрительных и сумма, где вес операции
+# 2^(−возраст / DECAY_HALF_LIFE_DAYS). Хранятся «на момент» decay_ts (последняя операция ИНН);
+# вставка операции — O(1): старое значение доводится до нового момента одним множителем.
+# Читаются с досчётом затухания до нужного времени (decayed). Как и graph_edge, ведутся
+# триггерами: повторная выписка (INSERT OR IGNORE) их не вызывает, retention не вычитает.
+# Решение по tx_id заменяется (INSERT OR REPLACE) — BEFORE-триггер снимает вклад прежнего.
+_DECAY_COLUMNS = ("d_cnt", "d_susp", "d_amt")
+_DECAY_UPSERT = ",\n".join(
+    f"{c} = COALESCE({c}, 0) * decay_w(excluded.decay_ts - COALESCE(decay_ts, excluded.decay_ts))"
+    f" + excluded.{c} * decay_w(COALESCE(decay_ts, excluded.decay_ts) - excluded.decay_ts)"
+    for c in _DECAY_COLUMNS) + ",\ndecay_ts = max(COALESCE(decay_ts, excluded.decay_ts), excluded.decay_ts)"
+# ИНН сторон датированной операции (платёж «сам себе» — один раз)
+_DECAY_TX_INNS = """(SELECT debit_inn FROM tx WHERE tx_id = NEW.tx_id AND ts > 0
+                UNION SELECT credit_inn FROM tx WHERE tx_id = NEW.tx_id AND ts > 0)"""
+_DECAY_TX_AGE = "decay_w(decay_ts - (SELECT ts FROM tx WHERE tx_id = NEW.tx_id))"
+
+_SCHEMA_V9 = f"""
+    CREATE TABLE IF NOT EXISTS mem_meta (
+      key TEXT PRIMARY KEY,
+      value TEXT
+    ) WITHOUT ROWID;
+
+    CREATE TRIGGER IF NOT EXISTS trg_tx_decay AFTER INSERT ON tx
+    WHEN NEW.ts > 0
+    BEGIN
+      INSERT INTO agg_counterparty(inn, d_cnt, d_susp, d_amt, decay_ts)
+      SELECT inn, 1, 0, COALESCE(NEW.amount, 0), NEW.ts
+        FROM (SELECT NEW.debit_inn AS inn UNION SELECT NEW.credit_inn) WHERE inn IS NOT NULL
+      ON CONFLICT(inn) DO UPDATE SET {_DECAY_UPSERT};
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_decisions_decay_replace BEFORE INSERT ON decisions
+    WHEN EXISTS (SELECT 1 FROM decisions WHERE tx_id = NEW.tx_id AND is_suspicious = 1)
+    BEGIN
+      UPDATE agg_counterparty SET d_susp = max(0, COALESCE(d_susp, 0) - {_DECAY_TX_AGE})
+       WHERE inn IN {_DECAY_TX_INNS};
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_decisions_decay AFTER INSERT ON decisions
+    WHEN NEW.is_suspicious = 1
+    BEGIN
+      UPDATE agg_counterparty SET d_susp = COALESCE(d_susp, 0) + {_DECAY_TX_AGE}
+       WHERE inn IN {_DECAY_TX_INNS};
+    END;
+"""
+
+# ─────────────────────────────────────────────────────────────────────────────
+# INIT: создаём БД/таблицы; старую (v1) схему мигрируем на месте
+# ─────────────────────────────────────────────────────────────────────────────
+_INIT_LOCK = threading.Lock()     # миграции схемы — по одной на процесс (потоки cli.py batch)
+
+
+def mem_init():
+    with _INIT_LOCK:
+        _mem_init()
+
+
+def _mem_init():
+    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+    con = _connect()
+    cur = con.cursor()
+    cur.execute("PRAGMA auto_vacuum=INCREMENTAL;")   # действует только для новой БД
+    cur.execute("PRAGMA journal_mode=WAL;")
+
+    version = cur.execute("PRAGMA user_version").fetchone()[0]
+    has_tx = cur.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='tx'").fetchone()
+    if has_tx and version < 2:
+        _migrate_v1_to_v2(con)
+
+    cur.executescript(_SCHEMA_V2)
+    if version < 3:
+        _migrate_v2_to_v3(cur)
+    cur.executescript(_SCHEMA_V3)
+    cur.executescript(_SCHEMA_V4)
+    if version < 5:
+        _migrate_v4_to_v5(cur)
+    cur.executescript(_SCHEMA_V6)
+    if version < 7:
+        _migrate_v6_to_v7(cur)
+    cur.executescript(_SCHEMA_V8)
+    if version < 9:
+        _migrate_v8_to_v9(cur)
+    cur.executescript(_SCHEMA_V9)
+    if version < 10:
+        _migrate_v9_to_v10(cur)
+    cur.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+
+    # tx_party появилась позже tx — один раз достраиваем из уже накопленной истории
+    has_party = cur.execute("SELECT EXISTS(SELECT 1 FROM tx_party)").fetchone()[0]
+    has_rows = cur.execute("SELECT EXISTS(SELECT 1 FROM tx)").fetchone()[0]
+    if has_rows and not has_party:
+        cur.execute(_PARTY_FROM_TX.format(where=""))
+
+    # затухающие счётчики ещё не считались (миграция) или посчитаны с другим периодом — заново из фактов
+    half_life = cur.execute("SELECT value FROM mem_meta WHERE key='decay_half_life_days'").fetchone()
+    if half_life is None or float(half_life[0]) != DECAY_HALF_LIFE_DAYS:
+        _rebuild_decay(cur, reset_archive=half_life is not None)
+        cur.execute("INSERT OR REPLACE INTO mem_meta(key, value) VALUES('decay_half_life_days', ?)",
+                    (repr(DECAY_HALF_LIFE_DAYS),))
 
     con.commit()
     con.close()
 
 
+def _migrate_v1_to_v2(con: sqlite3.Connection):
+    """
+    Миграция «на месте»: старые таблицы → *_v1, создаём v2, переливаем одним
+    INSERT…SELECT через python-UDF (canon_inn / to_epoch), пересчитываем агрегаты,
+    удаляем *_v1 и делаем VACUUM (иначе файл не уменьшится).
+    """
+    con.create_function("canon_inn", 1, canon_inn, deterministic=True)
+    con.create_function("to_epoch", 1, to_epoch, deterministic=True)
+    cur = con.cursor()
+    tables = {r[0] for r in cur.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    old = [t for t in ("tx", "decisions", "agg_counterparty", "tx_party", "agg_archive", "llm_log") if t in tables]
+
+    cur.execute("BEGIN IMMEDIATE")
+    # индексы переезжают вместе с таблицей и заняли бы имена новых — убираем
+    for (idx,) in cur.execute("""SELECT name FROM sqlite_master
+                                  WHERE type='index' AND sql IS NOT NULL""").fetchall():
+        cur.execute(f"DROP INDEX IF EXISTS {idx}")
+    for t in old:
+        cur.execute(f"ALTER TABLE {t} RENAME TO {t}_v1")
+    for stmt in _SCHEMA_V2.split(";"):
+        if stmt.strip():
+            cur.execute(stmt)
+
+    if "tx" in old:
+        cur.execute("""INSERT OR IGNORE INTO purpose_dict(text)
+                       SELECT DISTINCT purpose FROM tx_v1 WHERE purpose IS NOT NULL""")
+        cur.execute("""
+            INSERT OR IGNORE INTO tx(tx_id, ts, debit_inn, credit_inn, amount, purpose_id)
+            SELECT t.tx_id, to_epoch(t.ts), canon_inn(t.debit_inn), canon_inn(t.credit_inn),
+                   t.amount, p.purpose_id
+              FROM tx_v1 t LEFT JOIN purpose_dict p ON p.text = t.purpose""")
+        cur.execute(_PARTY_FROM_TX.format(where=""))
+    if "decisions" in old:
+        cur.execute("""
+            INSERT OR IGNORE INTO decisions
+            SELECT tx_id, p_ml, p_prior, p_llm, p_final, label_pred, is_suspicious,
+                   rule_hits, reasons_llm, to_epoch(inserted_at)
+              FROM decisions_v1""")
+    if "agg_archive" in old:
+        # «7701234567» и «7701234567.0» сливаются в один ключ
+        cur.execute("""
+            INSERT INTO agg_archive
+            SELECT canon_inn(inn), SUM(cnt_total), SUM(cnt_suspicious), SUM(amt_total),
+                   SUM(amt_suspicious), SUM(llm_flags_total), MAX(to_epoch(last_seen_ts)),
+                   MAX(p50), MAX(p75), MAX(p90), MAX(p95), MAX(to_epoch(archived_until))
+              FROM agg_archive_v1 WHERE canon_inn(inn) IS NOT NULL GROUP BY 1""")
+    if "agg_counterparty" in old:
+        # ручные отметки watchlisted переносим, остальное пересчитаем из фактов
+        cur.execute("""
+            INSERT INTO agg_counterparty(inn, watchlisted)
+            SELECT canon_inn(inn), MAX(COALESCE(watchlisted, 0))
+              FROM agg_counterparty_v1 WHERE canon_inn(inn) IS NOT NULL GROUP BY 1""")
+    if "llm_log" in old:
+        cur.execute("""INSERT INTO llm_log(id, ts, endpoint, prompt, response, meta)
+                       SELECT id, to_epoch(ts), endpoint, prompt, response, meta FROM llm_log_v1""")
+
+    inns = [r[0] for r in cur.execute("""
+        SELECT DISTINCT inn FROM tx_party UNION SELECT inn FROM agg_archive
+        UNION SELECT inn FROM agg_counterparty""").fetchall()]
+    for inn in inns:
+        _recalc_for_inn(cur, inn)
+
+    for t in old:
+        cur.execute(f"DROP TABLE {t}_v1")
+    cur.execute("PRAGMA user_version=2")
+    con.commit()
+
+    cur.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    cur.execute("VACUUM")
+
+
+def _migrate_v2_to_v3(cur: sqlite3.Cursor):
+    """network_risk в agg_counterparty + рёбра графа из уже накопленных tx (до создания триггера)."""
+    cols = {r[1] for r in cur.execute("PRAGMA table_info(agg_counterparty)")}
+    if "network_risk" not in cols:
+        cur.execute("ALTER TABLE agg_counterparty ADD COLUMN network_risk REAL DEFAULT 0")
+    cur.execute(_GRAPH_EDGE_DDL)
+    cur.execute("DELETE FROM graph_edge")
+    cur.execute("""
+        INSERT INTO graph_edge(src, dst, cnt, amt)
+        SELECT debit_inn, credit_inn, COUNT(*), SUM(COALESCE(amount, 0)) FROM tx
+         WHERE debit_inn IS NOT NULL AND credit_inn IS NOT NULL AND debit_inn <> credit_inn
+         GROUP BY debit_inn, credit_inn""")
+
+
+def _migrate_v4_to_v5(cur: sqlite3.Cursor):
+    """
+    Подпись версии и итог решения. Старые tx_id (номер строки) не пересчитываем: счетов
+    в tx нет, а хеш без них не совпадёт с новым — такие решения просто не переиспользуются.
+    """
+    cols = {r[1] for r in cur.execute("PRAGMA table_info(decisions)")}
+    if "version" not in cols:
+        cur.execute("ALTER TABLE decisions ADD COLUMN version TEXT")
+    if "result_json" not in cols:
+        cur.execute("ALTER TABLE decisions ADD COLUMN result_json TEXT")
+
+
+def _migrate_v6_to_v7(cur: sqlite3.Cursor):
+    """Статус решения; всё, что записано до v7, — окончательное (NULL читается как done)."""
+    cols = {r[1] for r in cur.execute("PRAGMA table_info(decisions)")}
+    if "llm_status" not in cols:
+        cur.execute("ALTER TABLE decisions ADD COLUMN llm_status TEXT")
+
+
+def _migrate_v8_to_v9(cur: sqlite3.Cursor):
+    """
+    Колонки затухающих счётчиков. Сами значения считает mem_init (_rebuild_decay) по tx/decisions;
+    архивный период (операций уже нет) — приближённо, будто все его операции были в last_seen_ts.
+    """
+    for table in ("agg_counterparty", "agg_archive"):
+        cols = {r[1] for r in cur.execute(f"PRAGMA table_info({table})")}
+        for c in _DECAY_COLUMNS:
+            if c not in cols:
+                cur.execute(f"ALTER TABLE {table} ADD COLUMN {c} REAL DEFAULT 0")
+        if "decay_ts" not in cols:
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN decay_ts INTEGER")
+    _reset_archive_decay(cur)
+
+
+def _migrate_v9_to_v10(cur: sqlite3.Cursor):
+    """Гистограмма сумм архива; у уже свёрнутых ИНН её нет — retention восстановит по квантилям."""
+    cols = {r[1] for r in cur.execute("PRAGMA table_info(agg_archive)")}
+    if "amt_hist" not in cols:
+        cur.execute("ALTER TABLE agg_archive ADD COLUMN amt_hist TEXT")
+
+
+def _reset_archive_decay(cur: sqlite3.Cursor):
+    cur.execute("""UPDATE agg_archive SET d_cnt = COALESCE(cnt_total, 0), d_susp = COALESCE(cnt_suspicious, 0),
+                          d_amt = COALESCE(amt_total, 0), decay_ts = last_seen_ts""")
+
+
 # ─────────────────────────────────────────────────────────────────────────────
 # UTILS
 # ─────────────────────────────────────────────────────────────────────────────
+def _connect() -> sqlite3.Connection:
+    """
+    Единая точка открытия БД: ждём занятую БД (обслуживание/параллельная запись), а не падаем.
+    Каждое выражение считается в телеметрии (sql у спанов).
+    """
+    con = sqlite3.connect(DB_PATH, timeout=30)
+    con.set_trace_callback(count_sql)
+    con.create_function("decay_w", 1, decay_w, deterministic=True)    # триггеры v9
+    return con
+
+
+# tx → tx_party (обе роли; пустые ИНН не индексируем)
+_PARTY_FROM_TX = """
+    INSERT OR IGNORE INTO tx_party(inn, ts, tx_id, role, amount)
+    SELECT debit_inn, COALESCE(ts, 0), tx_id, 'D', amount FROM tx
+     WHERE debit_inn IS NOT NULL {where}
+    UNION ALL
+    SELECT credit_inn, COALESCE(ts, 0), tx_id, 'C', amount FROM tx
+     WHERE credit_inn IS NOT NULL {where}
+"""
+
+
+def _sync_party(cur: sqlite3.Cursor, tx_ids: Iterable[str]):
+    """Поддерживаем tx_party теми же вставками, что и tx (берём то, что реально лежит в tx)."""
+    cur.executemany(_PARTY_FROM_TX.format(where="AND tx_id = ?1"), [(t,) for t in tx_ids])
+
+
+def _intern_purposes(cur: sqlite3.Cursor, texts: Iterable[str]):
+    """Словарь назначений: каждый уникальный текст хранится один раз."""
+    cur.executemany("INSERT OR IGNORE INTO purpose_dict(text) VALUES(?)",
+                    [(t,) for t in set(texts) if t])
+
+
+# tx с purpose_id из словаря (назначение передаём текстом последним параметром)
+_INSERT_TX = """INSERT OR IGNORE INTO tx(tx_id,ts,debit_inn,credit_inn,amount,purpose_id)
+                VALUES(?,?,?,?,?,(SELECT purpose_id FROM purpose_dict WHERE text=?))"""
+
+
+def _is_missing(x) -> bool:
+    """NaN / NaT / pd.NA без импорта pandas."""
+    try:
+        return bool(x != x)
+    except (TypeError, ValueError):
+        return True
+
+
+def canon_inn(x) -> Optional[int]:
+    """
+    Канонический ключ ИНН: int64. Снимает артефакты pandas («7701234567.0», 7701234567.0,
+    пробелы). Пусто/NaN/мусор → None.
+    """
+    if x is None or isinstance(x, bool):
+        return None
+    if isinstance(x, numbers.Integral):
+        return int(x) if x > 0 else None
+    if isinstance(x, numbers.Real):
+        return int(x) if math.isfinite(x) and x > 0 and float(x).is_integer() else None
+    s = str(x).strip().replace(" ", "")
+    if s.endswith(".0"):
+        s = s[:-2]
+    return int(s) if s.isdigit() and int(s) > 0 else None
+
+
+def inn_str(key) -> str:
+    """Обратно в строку для отчёта/LLM: ведущие нули ИНН (10 или 12 знаков) восстанавливаем."""
+    if key is None:
+        return ""
+    s = str(int(key))
+    return s.zfill(10) if len(s) <= 10 else s.zfill(12)
+
+
+_TS_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d",
+               "%d.%m.%Y %H:%M:%S", "%d.%m.%Y %H:%M", "%d.%m.%Y")
+
+
+def to_epoch(x) -> Optional[int]:
+    """Любое представление времени → epoch-секунды (наивное время считаем UTC). Пусто → None."""
+    if x is None or isinstance(x, bool) or _is_missing(x):
+        return None
+    if isinstance(x, numbers.Real):
+        return int(x) if math.isfinite(x) else None
+    if isinstance(x, _dt.datetime):
+        if x.tzinfo is None:
+            return calendar.timegm(x.timetuple())
+        return int(x.timestamp())
+    if isinstance(x, _dt.date):
+        return calendar.timegm(x.timetuple())
+    s = str(x).strip()
+    if not s or s.lower() in ("nan", "nat", "none"):
+        return None
+    for fmt in _TS_FORMATS:
+        try:
+            return calendar.timegm(_dt.datetime.strptime(s[:19], fmt).timetuple())
+        except ValueError:
+            continue
+    # ISO с таймзоной / прочие — доверимся pandas при наличии
+    try:
+        from pandas import to_datetime
+        t = to_datetime(s, errors="coerce")
+        if t is None or t != t:   # NaT
+            return None
+        return to_epoch(t.to_pydatetime())
+    except Exception:
+        return None
+
+
+def epoch_to_str(ts: Optional[int]) -> Optional[str]:
+    if ts is None:
+        return None
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(int(ts)))
+
+
 def _safe_select(query: str, params=()):
-    con = sqlite3.connect(DB_PATH)
+    con = _connect()
     cur = con.cursor()
     try:
         r = cur.execute(query, params).fetchone()
     except sqlite3.OperationalError:
         con.close()
         mem_init()
-        con = sqlite3.connect(DB_PATH); cur = con.cursor()
+        con = _connect(); cur = con.cursor()
         r = cur.execute(query, params).fetchone()
     finally:
         con.close()
     return r
 
 
-def days_since(ts_str: str, now_ts: float = None) -> float:
-    if not ts_str:
+def days_since(ts, now_ts: float = None) -> float:
+    """Сколько суток прошло с ts (epoch или строка). Нет ts → 1e6 («никогда»)."""
+    ep = to_epoch(ts)
+    if ep is None:
         return 1e6
     if now_ts is None:
         now_ts = time.time()
-    # принимаем форматы "YYYY-mm-dd HH:MM:SS" или ISO
-    try:
-        # короткий формат
-        import datetime as _dt
-        try:
-            dt = _dt.datetime.strptime(ts_str[:19], "%Y-%m-%d %H:%M:%S")
-        except Exception:
-            # ISO / прочие — доверимся pandas при наличии
-            from pandas import to_datetime
-            dt = to_datetime(ts_str, errors="coerce").to_pydatetime()
-            if dt is None:
-                return 30.0
-        delta = now_ts - dt.timestamp()
-        return max(0.0, delta / 86400.0)
-    except Exception:
-        return 30.0
+    return max(0.0, (now_ts - ep) / 86400.0)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# ЗАТУХАНИЕ: вес операции 2^(−возраст / DECAY_HALF_LIFE_DAYS)
+# ─────────────────────────────────────────────────────────────────────────────
+DECAY_LAMBDA = math.log(2) / (DECAY_HALF_LIFE_DAYS * 86400.0)     # 1/сек
+DECAY_RATE_K = 1.0        # псевдосчёт в доле подозрительных: одна свежая операция — не 100%
+# ключи затухающей истории в hist (с префиксом стороны): combine_hist_for_row, history.py, tools.py
+DECAY_HIST_KEYS = ("cnt_suspicious_decayed", "susp_rate_decayed")
+
+
+def decay_w(dt) -> float:
+    """Множитель затухания за dt секунд (dt ≤ 0 — 1: назад во времени не досчитываем)."""
+    return math.exp(-DECAY_LAMBDA * dt) if dt and dt > 0 else 1.0
+
+
+def decay_merge(a: tuple, b: tuple) -> tuple:
+    """Сложить два затухающих состояния (d_cnt, d_susp, d_amt, decay_ts) — к более позднему моменту."""
+    if a[3] is None:
+        return b
+    if b[3] is None:
+        return a
+    ts = max(a[3], b[3])
+    wa, wb = decay_w(ts - a[3]), decay_w(ts - b[3])
+    return (a[0] * wa + b[0] * wb, a[1] * wa + b[1] * wb, a[2] * wa + b[2] * wb, ts)
+
+
+def decayed(agg: Dict[str, Any], at_ts: float = None) -> Dict[str, float]:
+    """Затухающие счётчики агрегата, доведённые до at_ts (None — сейчас)."""
+    ts = agg.get("decay_ts")
+    if not ts:
+        return dict(cnt_decayed=0.0, cnt_suspicious_decayed=0.0, amt_decayed=0.0, susp_rate_decayed=0.0)
+    w = decay_w((time.time() if at_ts is None else at_ts) - ts)
+    cnt, susp = float(agg.get("d_cnt") or 0.0) * w, float(agg.get("d_susp") or 0.0) * w
+    return dict(cnt_decayed=cnt, cnt_suspicious_decayed=susp, amt_decayed=float(agg.get("d_amt") or 0.0) * w,
+                susp_rate_decayed=susp / (cnt + DECAY_RATE_K))
+
+
+def _rebuild_decay(cur: sqlite3.Cursor, inns: Optional[Iterable] = None, reset_archive: bool = False):
+    """
+    Затухающие счётчики из фактов (tx_party + decisions) и архива: по набору ИНН или (None) по всем.
+    reset_archive — архив посчитан с прежним периодом полураспада: берём его заново из счётчиков.
+    """
+    if reset_archive:
+        _reset_archive_decay(cur)
+    if inns is None:
+        scope = ""
+        cur.execute("UPDATE agg_counterparty SET d_cnt=0, d_susp=0, d_amt=0, decay_ts=NULL")
+    else:
+        _load_inn_keys(cur, inns)
+        scope = "AND inn IN (SELECT inn FROM _q_inn)"
+        cur.execute(f"UPDATE agg_counterparty SET d_cnt=0, d_susp=0, d_amt=0, decay_ts=NULL WHERE 1 {scope}")
+    live = cur.execute(f"""
+        SELECT inn, SUM(w), SUM(w * s), SUM(w * a), MAX(anchor) FROM (
+            SELECT e.inn, COALESCE(e.amount, 0) AS a, COALESCE(d.is_suspicious, 0) AS s,
+                   MAX(e.ts) OVER (PARTITION BY e.inn) AS anchor,
+                   decay_w(MAX(e.ts) OVER (PARTITION BY e.inn) - e.ts) AS w
+              FROM (SELECT DISTINCT inn, ts, tx_id, amount FROM tx_party WHERE ts > 0 {scope}) e
+              LEFT JOIN decisions d ON d.tx_id = e.tx_id)
+         GROUP BY inn""").fetchall()
+    state = {r[0]: tuple(r[1:]) for r in live}
+    for inn, *arch in cur.execute(f"""
+            SELECT inn, d_cnt, d_susp, d_amt, decay_ts FROM agg_archive
+             WHERE decay_ts IS NOT NULL {scope}""").fetchall():
+        state[inn] = decay_merge(state.get(inn, (0.0, 0.0, 0.0, None)), tuple(arch))
+    cur.executemany("""
+        INSERT INTO agg_counterparty(inn, d_cnt, d_susp, d_amt, decay_ts) VALUES(?,?,?,?,?)
+        ON CONFLICT(inn) DO UPDATE SET d_cnt=excluded.d_cnt, d_susp=excluded.d_susp,
+                                       d_amt=excluded.d_amt, decay_ts=excluded.decay_ts""",
+                    [(inn, *st) for inn, st in state.items()])
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# ГИСТОГРАММА СУММ: архив (agg_archive.amt_hist) + «живые» суммы → квантили
+# ─────────────────────────────────────────────────────────────────────────────
+# суммы — в логарифмических корзинах ширины γ: гистограммы архива и «живых» операций складываются точно,
+# квантиль восстанавливается с относительной ошибкой ≤ (γ−1)/(γ+1) ≈ 1%
+_HIST_GAMMA = 1.02
+_QUANTILES = (50, 75, 90, 95)
+
+
+def _hist_key(a: float) -> str:
+    """Корзина суммы: "z" — ноль/отрицательные, иначе floor(log_γ a)."""
+    return "z" if a <= 0 else str(math.floor(math.log(a) / math.log(_HIST_GAMMA)))
+
+
+def _hist_value(key: str) -> float:
+    """Представитель корзины [γ^i, γ^(i+1)) — равноудалён от краёв в относительной мере."""
+    return 0.0 if key == "z" else 2.0 * _HIST_GAMMA ** (int(key) + 1) / (_HIST_GAMMA + 1.0)
+
+
+def _hist_add(hist: Dict[str, int], amounts) -> Dict[str, int]:
+    for a in amounts:
+        k = _hist_key(float(a))
+        hist[k] = hist.get(k, 0) + 1
+    return hist
+
+
+def _hist_quantiles(hist: Dict[str, int], quantiles: tuple = _QUANTILES):
+    """Перцентили гистограммы (по умолчанию p50/p75/p90/p95) — линейная интерполяция по рангу, как np.percentile."""
+    n = sum(hist.values())
+    if not n:
+        return (None,) * len(quantiles)
+    values = sorted((_hist_value(k), c) for k, c in hist.items())
+    bounds, acc = [], 0
+    for v, c in values:
+        acc += c
+        bounds.append(acc)                  # позиции [acc − c, acc) — в этой корзине
+
+    def at(pos: int) -> float:
+        return values[bisect.bisect_right(bounds, pos)][0]
+
+    out = []
+    for q in quantiles:
+        rank = q / 100.0 * (n - 1)
+        lo = math.floor(rank)
+        out.append(at(lo) + (at(min(lo + 1, n - 1)) - at(lo)) * (rank - lo))
+    return tuple(out)
+
+
+def _legacy_hist(cnt_total, quantiles) -> Dict[str, int]:
+    """
+    Архив до v10 хранил только квантили: раскладываем его число операций по долям
+    между ними (50/25/15/10%) — приближённо; первое слияние retention сохранит её в amt_hist.
+    """
+    cnt = int(cnt_total or 0)
+    if not cnt or all(q is None for q in quantiles):
+        return {}
+    cum = [0] + [round(cnt * share) for share in (0.50, 0.75, 0.90)] + [cnt]
+    hist: Dict[str, int] = {}
+    for lo, hi, q in zip(cum, cum[1:], quantiles):
+        if q is not None and hi > lo:
+            k = _hist_key(float(q))
+            hist[k] = hist.get(k, 0) + hi - lo
+    return hist
+
+
+def _archive_hist(amt_hist: Optional[str], cnt_total, quantiles) -> Dict[str, int]:
+    """Гистограмма архива ИНН: сохранённая (v10) или, у свёрнутого раньше, восстановленная по квантилям."""
+    return json.loads(amt_hist) if amt_hist else _legacy_hist(cnt_total, quantiles)
 
 
 # ─────────────────────────────────────────────────────────────────────────────
 # READ: агрегаты по контрагенту (в т.ч. мягкие LLM-счётчики)
 # ─────────────────────────────────────────────────────────────────────────────
-def mem_read_counterparty(inn: str) -> Dict[str, Any]:
-    r = _safe_select("""
-      SELECT cnt_total,cnt_suspicious,susp_rate,amt_total,amt_suspicious,
-             last_seen_ts,watchlisted,p50,p75,p90,p95,
-             llm_flags_total,llm_last_seen_ts
-      FROM agg_counterparty WHERE inn=?""", (inn,))
+_AGG_KEYS = [
+    "cnt_total","cnt_suspicious","susp_rate","amt_total","amt_suspicious",
+    "last_seen_ts","watchlisted","p50","p75","p90","p95",
+    "llm_flags_total","llm_last_seen_ts","network_risk",
+    "d_cnt","d_susp","d_amt","decay_ts"
+]
+
+
+def _empty_counterparty() -> Dict[str, Any]:
+    return dict(
+        cnt_total=0, cnt_suspicious=0, susp_rate=0.0,
+        amt_total=0.0, amt_suspicious=0.0,
+        last_seen_ts=None, watchlisted=0,
+        p50=None, p75=None, p90=None, p95=None,
+        llm_flags_total=0.0, llm_last_seen_ts=None, network_risk=0.0,
+        d_cnt=0.0, d_susp=0.0, d_amt=0.0, decay_ts=None
+    )
+
+
+def mem_read_counterparty(inn) -> Dict[str, Any]:
+    key = canon_inn(inn)
+    r = None if key is None else _safe_select(f"""
+      SELECT {",".join(_AGG_KEYS)}
+      FROM agg_counterparty WHERE inn=?""", (key,))
     if not r:
-        return dict(
-            cnt_total=0, cnt_suspicious=0, susp_rate=0.0,
-            amt_total=0.0, amt_suspicious=0.0,
-            last_seen_ts=None, watchlisted=0,
-            p50=None, p75=None, p90=None, p95=None,
-            llm_flags_total=0.0, llm_last_seen_ts=None
-        )
-    keys = [
-        "cnt_total","cnt_suspicious","susp_rate","amt_total","amt_suspicious",
-        "last_seen_ts","watchlisted","p50","p75","p90","p95",
-        "llm_flags_total","llm_last_seen_ts"
-    ]
-    return dict(zip(keys, r))
-
-
-def combine_hist_for_row(row: Dict[str, Any]) -> Dict[str, Any]:
-    """🔶 ОБРАЩЕНИЕ К ПАМЯТИ: объединённые агрегаты по дебету/кредиту."""
-    h_d = mem_read_counterparty(row.get("debit_inn") or "")
-    h_c = mem_read_counterparty(row.get("credit_inn") or "")
-    return {
+        return _empty_counterparty()
+    return dict(zip(_AGG_KEYS, r))
+
+
+def _load_inn_keys(cur: sqlite3.Cursor, inns: Iterable) -> int:
+    """Набор ИНН для пакетного чтения → TEMP-таблица (без лимита на число '?' в IN)."""
+    keys = {k for k in (canon_inn(x) for x in inns) if k}
+    cur.execute("CREATE TEMP TABLE IF NOT EXISTS _q_inn (inn INTEGER PRIMARY KEY)")
+    cur.execute("DELETE FROM _q_inn")
+    cur.executemany("INSERT INTO _q_inn VALUES(?)", [(k,) for k in keys])
+    return len(keys)
+
+
+def mem_read_counterparties(inns: Iterable) -> Dict[int, Dict[str, Any]]:
+    """Пакетная версия mem_read_counterparty: один запрос на всю выписку. Ключ — canon_inn."""
+    con = _connect(); cur = con.cursor()
+    try:
+        _load_inn_keys(cur, inns)
+        rows = cur.execute(f"""
+            SELECT a.inn, {",".join("a." + k for k in _AGG_KEYS)}
+              FROM _q_inn q JOIN agg_counterparty a ON a.inn = q.inn""").fetchall()
+    finally:
+        con.close()
+    return {r[0]: dict(zip(_AGG_KEYS, r[1:])) for r in rows}
+
+
+def mem_read_party_history(inns: Iterable):
+    """
+    Сырые события по набору ИНН одним запросом (tx_party + решения) для as-of движка.
+    Возвращает (events, archive):
+      events  — [(inn, ts, amount, is_suspicious, p_llm, tx_id), ...]  (платёж «сам себе» — один раз)
+      archive — {inn: (cnt_total, cnt_suspicious, llm_flags_total, last_seen_ts, p95, d_cnt, d_susp, decay_ts,
+                       p50, p75, гистограмма сумм {корзина: число})}
+    """
+    con = _connect(); cur = con.cursor()
+    try:
+        _load_inn_keys(cur, inns)
+        events = cur.execute("""
+            SELECT DISTINCT p.inn, p.ts, p.tx_id, p.amount, d.is_suspicious, d.p_llm
+              FROM _q_inn q
+              JOIN tx_party p ON p.inn = q.inn
+              LEFT JOIN decisions d ON d.tx_id = p.tx_id""").fetchall()
+        archive = {r[0]: r[1:11] + (_archive_hist(r[11], r[1], (r[9], r[10], r[12], r[5])),) for r in cur.execute("""
+            SELECT a.inn, a.cnt_total, a.cnt_suspicious, a.llm_flags_total, a.last_seen_ts, a.p95,
+                   a.d_cnt, a.d_susp, a.decay_ts, a.p50, a.p75, a.amt_hist, a.p90
+              FROM _q_inn q JOIN agg_archive a ON a.inn = q.inn""").fetchall()}
+    finally:
+        con.close()
+    return [(e[0], e[1], e[3], e[4], e[5], e[2]) for e in events], archive
+
+
+def mem_read_tx_window(inns: Iterable, since_ts: Optional[int] = None):
+    """
+    Операции с участием любого из ИНН, начиная с since_ts (range по PK tx_party),
+    с обеими сторонами платежа: [(tx_id, ts, debit_inn, credit_inn, amount), ...].
+    """
+    con = _connect(); cur = con.cursor()
+    try:
+        _load_inn_keys(cur, inns)
+        rows = cur.execute("""
+            SELECT DISTINCT t.tx_id, t.ts, t.debit_inn, t.credit_inn, t.amount
+              FROM _q_inn q
+              JOIN tx_party p ON p.inn = q.inn AND p.ts >= ?
+              JOIN tx t ON t.tx_id = p.tx_id""", (int(since_ts or 0),)).fetchall()
+    finally:
+        con.close()
+    return rows
+
+
+def mem_read_decided(tx_ids: Iterable, version: str) -> Dict[str, tuple]:
+    """Окончательные решения этой же версии по набору tx_id: {tx_id: (p_ml, итоговая транзакция)}."""
+    con = _connect(); cur = con.cursor()
+    try:
+        cur.execute("CREATE TEMP TABLE IF NOT EXISTS _q_tx (tx_id TEXT PRIMARY KEY) WITHOUT ROWID")
+        cur.execute("DELETE FROM _q_tx")
+        cur.executemany("INSERT OR IGNORE INTO _q_tx VALUES(?)", [(str(t),) for t in tx_ids])
+        rows = cur.execute("""
+            SELECT d.tx_id, d.p_ml, d.result_json
+              FROM _q_tx q JOIN decisions d ON d.tx_id = q.tx_id
+             WHERE d.version = ? AND d.result_json IS NOT NULL
+               AND COALESCE(d.llm_status, 'done') = 'done'""", (version,)).fetchall()
+    finally:
+        con.close()
+    return {t: (p_ml, json.loads(res)) for t, p_ml, res in rows}
+
+
+def combine_hist_for_row(row: Dict[str, Any], read=None) -> Dict[str, Any]:
+    """🔶 ОБРАЩЕНИЕ К ПАМЯТИ: объединённые агрегаты по дебету/кредиту (read — чтение одного ИНН)."""
+    read = read or mem_read_counterparty
+    h_d = read(row.get("debit_inn"))
+    h_c = read(row.get("credit_inn"))
+    hist = {
         # дебет
         "debit_cnt_total": h_d["cnt_total"],
         "debit_cnt_suspicious": h_d["cnt_suspicious"],
@@ -159,6 +836,7 @@ def combine_hist_for_row(row: Dict[str, Any]) -> Dict[str, Any]:
         "debit_p95": h_d["p95"],
         "debit_llm_flags_total": h_d.get("llm_flags_total", 0.0),
         "debit_llm_last_seen_days": days_since(h_d.get("llm_last_seen_ts")) if h_d.get("llm_last_seen_ts") else 1e6,
+        "debit_network_risk": h_d.get("network_risk") or 0.0,
 
         # кредит
         "credit_cnt_total": h_c["cnt_total"],
@@ -169,7 +847,60 @@ def combine_hist_for_row(row: Dict[str, Any]) -> Dict[str, Any]:
         "credit_p95": h_c["p95"],
         "credit_llm_flags_total": h_c.get("llm_flags_total", 0.0),
         "credit_llm_last_seen_days": days_since(h_c.get("llm_last_seen_ts")) if h_c.get("llm_last_seen_ts") else 1e6,
+        "credit_network_risk": h_c.get("network_risk") or 0.0,
     }
+    if PRIOR_DECAY:
+        # затухающие счётчики — на текущий момент (as-of — history.py)
+        for role, h in (("debit", h_d), ("credit", h_c)):
+            dec = decayed(h)
+            hist.update({f"{role}_{k}": dec[k] for k in DECAY_HIST_KEYS})
+    return hist
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# ГРАФ КОНТРАГЕНТОВ (network.py): рёбра и network_risk
+# ─────────────────────────────────────────────────────────────────────────────
+def _fetch_columns(cur: sqlite3.Cursor, query: str, dtypes, chunk: int = 500_000):
+    """Результат запроса → по numpy-массиву на колонку, пачками (без списка кортежей на всю таблицу)."""
+    import numpy as _np
+    parts = [[] for _ in dtypes]
+    cur.execute(query)
+    while True:
+        rows = cur.fetchmany(chunk)
+        if not rows:
+            break
+        for i, col in enumerate(zip(*rows)):
+            parts[i].append(_np.array(col, dtype=dtypes[i]))
+    return [_np.concatenate(p) if p else _np.array([], dtype=dt) for p, dt in zip(parts, dtypes)]
+
+
+def mem_read_graph():
+    """
+    Весь граф для пересчёта network_risk:
+      edges — (src, dst, cnt, amt) массивами
+      nodes — (inn, cnt_total, cnt_suspicious, watchlisted, network_risk) массивами
+    """
+    con = _connect(); cur = con.cursor()
+    try:
+        edges = _fetch_columns(cur, "SELECT src, dst, cnt, amt FROM graph_edge",
+                               ("int64", "int64", "float64", "float64"))
+        nodes = _fetch_columns(cur, """
+            SELECT inn, COALESCE(cnt_total, 0), COALESCE(cnt_suspicious, 0),
+                   COALESCE(watchlisted, 0), COALESCE(network_risk, 0)
+              FROM agg_counterparty""", ("int64", "float64", "float64", "int64", "float64"))
+    finally:
+        con.close()
+    return edges, nodes
+
+
+def mem_write_network_risk(updates: Iterable) -> int:
+    """updates — [(inn, network_risk), ...]; пишем только изменившиеся значения."""
+    con = _connect(); cur = con.cursor()
+    cur.executemany("UPDATE agg_counterparty SET network_risk=? WHERE inn=?",
+                    [(float(r), int(inn)) for inn, r in updates])
+    n = cur.rowcount
+    con.commit(); con.close()
+    return n
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -180,44 +911,124 @@ def mem_upsert_after_decision(row: Dict[str, Any], decision: Dict[str, Any]):
     ЛОГ + ИДЕМПОТЕНТНЫЕ АГРЕГАТЫ:
       - decisions: upsert по tx_id
       - agg_counterparty: пересчёт из факта (tx/decisions), без ручного инкремента
+    В воркерах шардированного прогона запись уходит в приёмник (см. mem_set_decision_sink).
     """
-    con = sqlite3.connect(DB_PATH)
+    if _DECISION_SINK is not None:
+        _DECISION_SINK(("decision", dict(row), dict(decision)))
+        return
+
+    con = _connect()
     cur = con.cursor()
-    now = time.strftime("%Y-%m-%d %H:%M:%S")
-
-    # ---------- 0) стабильный tx_id ----------
-    tx_id = str(row.get("id"))
-    ts    = str(row.get("ts") or now)
-    debit = row.get("debit_inn")
-    credit= row.get("credit_inn")
-    amount= float(row.get("amount") or 0.0)
+
+    # обновим агрегаты по затронутым ИНН
+    for inn in _write_decision(cur, row, decision, int(time.time())):
+        _recalc_for_inn(cur, inn)
+
+    con.commit()
+    con.close()
+
+
+def _tx_id(row: Dict[str, Any]) -> str:
+    """tx_id строки: хеш содержимого (identity.tx_ids), для старых вызовов — номер строки."""
+    t = row.get("tx_id")
+    return str(row.get("id")) if t is None or _is_missing(t) or t == "" else str(t)
+
+
+def _decision_tx_values(row: Dict[str, Any], now: int):
+    """Строка решения → (tx_id, ts, debit, credit, amount, purpose) для tx."""
     purpose = row.get("purpose")
+    return (_tx_id(row),
+            to_epoch(row.get("ts")) or now,
+            canon_inn(row.get("debit_inn")),
+            canon_inn(row.get("credit_inn")),
+            float(row.get("amount") or 0.0),
+            "" if purpose is None or _is_missing(purpose) else str(purpose))
+
+
+DECISION_COLUMNS = ["p_ml", "p_prior", "p_llm", "p_final", "label_pred", "is_suspicious",
+                    "rule_hits", "reasons_llm", "inserted_at", "version", "result_json", "llm_status"]
+
+
+def _decision_values(decision: Dict[str, Any], now: int):
+    """decision → значения колонок decisions (в порядке DECISION_COLUMNS)."""
+    return (float(decision.get("p_ml", 0.0)),
+            float(decision.get("p_prior", 0.0)),
+            float(decision.get("p_llm", 0.0)),
+            float(decision.get("p_final", 0.0)),
+            str(decision.get("label_pred", "")),
+            int(bool(decision.get("is_suspicious", False))),
+            json.dumps(decision.get("rule_hits", []), ensure_ascii=False),
+            json.dumps(decision.get("reasons_llm", []), ensure_ascii=False),
+            now,
+            decision.get("version"),
+            None if decision.get("result") is None
+            else json.dumps(decision["result"], ensure_ascii=False, default=str),
+            decision.get("llm_status", "done"))
+
+
+def _write_decision(cur: sqlite3.Cursor, row: Dict[str, Any], decision: Dict[str, Any], now: int):
+    """
+    tx + tx_party + decisions для одного решения; → {debit, credit} для пересчёта агрегатов.
+    Операция из уже заархивированного периода не пишется (она учтена в agg_archive) → пустое множество.
+    """
+    tx = _decision_tx_values(row, now)
+    if not _drop_archived(cur, [tx]):
+        return set()
 
     # ---------- 1) сырые транзакции ----------
-    cur.execute("""INSERT OR IGNORE INTO tx(tx_id,ts,debit_inn,credit_inn,amount,purpose)
-                   VALUES(?,?,?,?,?,?)""", (tx_id, ts, debit, credit, amount, purpose))
+    _intern_purposes(cur, [tx[5]])
+    cur.execute(_INSERT_TX, tx)
+    _sync_party(cur, [tx[0]])
 
     # ---------- 2) решения ----------
-    cur.execute("""INSERT OR REPLACE INTO decisions
-                   (tx_id,p_ml,p_prior,p_llm,p_final,label_pred,is_suspicious,rule_hits,reasons_llm,inserted_at)
-                   VALUES(?,?,?,?,?,?,?,?,?,?)""",
-                (tx_id,
-                 float(decision.get("p_ml", 0.0)),
-                 float(decision.get("p_prior", 0.0)),
-                 float(decision.get("p_llm", 0.0)),
-                 float(decision.get("p_final", 0.0)),
-                 str(decision.get("label_pred", "")),
-                 int(bool(decision.get("is_suspicious", False))),
-                 json.dumps(decision.get("rule_hits", []), ensure_ascii=False),
-                 json.dumps(decision.get("reasons_llm", []), ensure_ascii=False),
-                 now))
+    cur.execute(f"""INSERT OR REPLACE INTO decisions (tx_id,{",".join(DECISION_COLUMNS)})
+                    VALUES({",".join("?" * (len(DECISION_COLUMNS) + 1))})""", (tx[0],) + _decision_values(decision, now))
+    return {tx[2], tx[3]}
 
-    # обновим агрегаты по затронутым ИНН
-    for role in ("debit", "credit"):
-        _recalc_for_inn(cur, row.get(f"{role}_inn"))
 
-    con.commit()
+# ─────────────────────────────────────────────────────────────────────────────
+# ЕДИНСТВЕННЫЙ ПИСАТЕЛЬ (шардированный прогон, sharding.py)
+# ─────────────────────────────────────────────────────────────────────────────
+_DECISION_SINK = None
+
+
+def mem_set_decision_sink(sink) -> None:
+    """
+    sink(("decision", row, decision) | ("journal", run_id, ...)) вместо прямой записи в SQLite
+    (None — вернуть прямую запись).
+    Воркеры отдают решения в очередь, пишет их один процесс — без конкуренции за блокировку БД.
+    """
+    global _DECISION_SINK
+    _DECISION_SINK = sink
+
+
+def mem_decision_writer(queue, batch_size: int = 500) -> int:
+    """
+    Цикл процесса-писателя: решения и отметки журнала из очереди → пачками в одной транзакции
+    (в порядке очереди), агрегаты — один пересчёт на ИНН за пачку. None — конец. → число решений.
+    """
+    con = _connect(); cur = con.cursor()
+    total, done = 0, False
+    while not done:
+        batch = [queue.get()]
+        while len(batch) < batch_size and not queue.empty():
+            batch.append(queue.get())
+        if None in batch:
+            done = True
+            batch = batch[:batch.index(None)]
+        now = int(time.time())
+        inns = set()
+        for kind, *item in batch:
+            if kind == "decision":
+                inns |= _write_decision(cur, *item, now)
+                total += 1
+            else:
+                _write_journal(cur, *item, now)
+        for inn in inns:
+            _recalc_for_inn(cur, inn)
+        con.commit()
     con.close()
+    return total
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -229,29 +1040,18 @@ def mem_bulk_preload_statement(df_like) -> None:
     и пересчитывает agg_counterparty по всем встреченным ИНН.
     Используется ДО LLM, чтобы PRIOR/квантили/last_seen учитывали всю таблицу.
     """
-    con = sqlite3.connect(DB_PATH)
+    con = _connect()
     cur = con.cursor()
 
-    # Собираем строки для вставки
-    inns = set()
-    rows_to_insert = []
-    for _, r in getattr(df_like, "iterrows", lambda: [])():
-        tx_id = str(r.get("id"))
-        ts = str(r.get("ts") or r.get("date") or "")
-        debit = r.get("debit_inn") or ""
-        credit = r.get("credit_inn") or ""
-        amount = float(r.get("amount") or r.get("credit_amount") or r.get("debit_amount") or 0.0)
-        purpose = r.get("purpose") or ""
-
-        rows_to_insert.append((tx_id, ts, debit, credit, amount, purpose))
-        if debit:
-            inns.add(str(debit))
-        if credit:
-            inns.add(str(credit))
+    # Собираем строки для вставки (уже свёрнутые в архив — не заводим повторно)
+    rows_to_insert = _drop_archived(cur, _statement_tx_values(df_like))
+    inns = {k for r in rows_to_insert for k in (r[2], r[3]) if k}
 
     # Вставим пачкой (idempotent)
-    cur.executemany("""INSERT OR IGNORE INTO tx(tx_id,ts,debit_inn,credit_inn,amount,purpose)
-                       VALUES(?,?,?,?,?,?)""", rows_to_insert)
+    _intern_purposes(cur, (r[5] for r in rows_to_insert))
+    _adopt_legacy_ids(cur, rows_to_insert)
+    cur.executemany(_INSERT_TX, rows_to_insert)
+    _sync_party(cur, [r[0] for r in rows_to_insert])
 
     # Пересчёт агрегатов по всем встреченным ИНН
     for inn in inns:
@@ -261,20 +1061,254 @@ def mem_bulk_preload_statement(df_like) -> None:
     con.close()
 
 
+def _statement_tx_values(df_like):
+    """Строки выписки → [(tx_id, ts, debit, credit, amount, purpose), ...] для tx."""
+    if not hasattr(df_like, "to_dict"):
+        return []
+    cols = [c for c in ("id", "tx_id", "ts", "date", "debit_inn", "credit_inn", "amount", "credit_amount",
+                        "debit_amount", "purpose") if c in df_like.columns]
+    out = []
+    for r in df_like[cols].to_dict("records"):    # только нужные колонки, без Series на строку
+        purpose = r.get("purpose")
+        out.append((_tx_id(r),
+                    to_epoch(r.get("ts")) or to_epoch(r.get("date")),
+                    canon_inn(r.get("debit_inn")),
+                    canon_inn(r.get("credit_inn")),
+                    float(r.get("amount") or r.get("credit_amount") or r.get("debit_amount") or 0.0),
+                    "" if purpose is None or _is_missing(purpose) else str(purpose)))
+    return out
+
+
+# tx_id до v5 — номер строки выписки; хеш содержимого (identity.py) — не короче TX_ID_LEN
+_LEGACY_TX = "length(tx_id) < 20"
+
+
+def _drop_archived(cur: sqlite3.Cursor, rows) -> list:
+    """
+    Без операций, период которых retention уже свернул в agg_archive (ts раньше archived_until
+    ИНН любой из сторон): иначе повторно загруженная старая выписка считалась бы дважды —
+    в «живой» истории и в архиве. Пока архива нет — один дешёвый запрос.
+    """
+    if not rows or not cur.execute("SELECT EXISTS(SELECT 1 FROM agg_archive)").fetchone()[0]:
+        return rows
+    _load_inn_keys(cur, (k for r in rows for k in (r[2], r[3]) if k))
+    until = dict(cur.execute("""
+        SELECT a.inn, a.archived_until FROM _q_inn q JOIN agg_archive a ON a.inn = q.inn""").fetchall())
+    return [r for r in rows
+            if not (r[1] and r[1] < max(until.get(r[2]) or 0, until.get(r[3]) or 0))]
+
+
+def _adopt_legacy_ids(cur: sqlite3.Cursor, rows) -> int:
+    """
+    Операции, записанные до v5 под номером строки, переименовываем в tx_id по содержимому
+    (совпали ts, ИНН, сумма и назначение) — иначе после миграции одна операция жила бы
+    в памяти дважды. Пока старых ключей нет — один дешёвый запрос.
+    """
+    if not cur.execute(f"SELECT EXISTS(SELECT 1 FROM tx WHERE {_LEGACY_TX})").fetchone()[0]:
+        return 0
+    n = 0
+    for tx_id, ts, debit, credit, amount, purpose in rows:
+        if len(tx_id) < 20 or cur.execute("SELECT 1 FROM tx WHERE tx_id=?", (tx_id,)).fetchone():
+            continue
+        old = cur.execute(f"""
+            SELECT tx_id FROM tx
+             WHERE ts IS ? AND debit_inn IS ? AND credit_inn IS ? AND amount = ? AND {_LEGACY_TX}
+               AND purpose_id IS (SELECT purpose_id FROM purpose_dict WHERE text = ?)
+             LIMIT 1""", (ts, debit, credit, amount, purpose)).fetchone()
+        if old:
+            for table in ("tx", "tx_party", "decisions"):
+                cur.execute(f"UPDATE {table} SET tx_id=? WHERE tx_id=?", (tx_id, old[0]))
+            n += 1
+    return n
+
+
+def mem_rebuild_aggregates(inns: Optional[Iterable] = None) -> int:
+    """Пересчитать agg_counterparty из фактов: по списку ИНН или (None) по всей памяти. → число ИНН."""
+    con = _connect(); cur = con.cursor()
+    if inns is None:
+        inns = [r[0] for r in cur.execute("""
+            SELECT DISTINCT inn FROM tx_party UNION SELECT inn FROM agg_archive
+            UNION SELECT inn FROM agg_counterparty""").fetchall()]
+    keys = {k for k in (canon_inn(x) for x in inns) if k}
+    for inn in keys:
+        _recalc_for_inn(cur, inn)
+    _rebuild_decay(cur, keys)
+    con.commit(); con.close()
+    return len(keys)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# СВОДКА ДЛЯ ОТЧЁТА И ЖУРНАЛ LLM
+# ─────────────────────────────────────────────────────────────────────────────
+SUMMARY_COLUMNS = ["inn", "cnt_total", "cnt_suspicious", "susp_rate_pct", "amt_total", "amt_suspicious",
+                   "last_seen_ts", "watchlisted", "p50", "p75", "p90", "p95",
+                   "llm_flags_total", "llm_last_seen_ts", "network_risk"]
+
+
+def mem_top_counterparties(n: int = 200):
+    """Топ-N контрагентов по числу подозрительных операций (лист memory_summary), строки в порядке SUMMARY_COLUMNS."""
+    con = _connect()
+    try:
+        return con.execute("""
+            SELECT printf(CASE WHEN inn < 10000000000 THEN '%010d' ELSE '%012d' END, inn) AS inn,
+                   cnt_total, cnt_suspicious,
+                   ROUND(CASE WHEN cnt_total>0 THEN 100.0*cnt_suspicious/cnt_total ELSE 0 END, 1) AS susp_rate_pct,
+                   amt_total, amt_suspicious, datetime(last_seen_ts, 'unixepoch'), watchlisted,
+                   p50, p75, p90, p95,
+                   llm_flags_total, datetime(llm_last_seen_ts, 'unixepoch'), ROUND(network_risk, 3)
+            FROM agg_counterparty
+            ORDER BY cnt_suspicious DESC, susp_rate_pct DESC
+            LIMIT ?""", (int(n),)).fetchall()
+    finally:
+        con.close()
+
+
+def mem_log_llm(ts: int, endpoint: str, prompt: str, response: str, meta: str) -> None:
+    """Запрос/ответ LLM в llm_log (тексты — уже JSON)."""
+    con = _connect()   # пишут и воркеры, и процесс-писатель
+    con.execute("INSERT INTO llm_log(ts, endpoint, prompt, response, meta) VALUES(?,?,?,?,?)",
+                (ts, endpoint, prompt, response, meta))
+    con.commit(); con.close()
+
+
+LLM_USAGE_COLUMNS = ("run_id", "ts", "model", "batch_rows", "prompt_tokens", "completion_tokens",
+                     "latency_ms", "retries", "status", "estimated")
+
+
+def mem_log_llm_usage(rec: Dict[str, Any]) -> None:
+    """Один вызов LLM в llm_usage (пишут и воркеры шардов)."""
+    con = _connect()
+    con.execute(f"INSERT INTO llm_usage({', '.join(LLM_USAGE_COLUMNS)}) VALUES({', '.join('?' * len(LLM_USAGE_COLUMNS))})",
+                tuple(rec.get(c) for c in LLM_USAGE_COLUMNS))
+    con.commit(); con.close()
+
+
+def mem_read_llm_usage(run_id: str) -> list:
+    """Вызовы LLM прогона (с возобновлениями — все попытки под тем же run_id)."""
+    con = _connect()
+    try:
+        cur = con.execute(f"SELECT {', '.join(LLM_USAGE_COLUMNS)} FROM llm_usage WHERE run_id=? ORDER BY id",
+                          (run_id,))
+        return [dict(zip(LLM_USAGE_COLUMNS, r)) for r in cur.fetchall()]
+    finally:
+        con.close()
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# КЭШ ПРЕДСКАЗАНИЙ МОДЕЛИ
+# ─────────────────────────────────────────────────────────────────────────────
+def mem_read_ml_cache(model: str, keys: Iterable[tuple]) -> Dict[tuple, float]:
+    """(h1, h2) → ml_metric для ключей, уже посчитанных этой моделью."""
+    by_h1: Dict[int, set] = {}
+    for h1, h2 in keys:
+        by_h1.setdefault(int(h1), set()).add(int(h2))
+    h1s, out = list(by_h1), {}
+    con = _connect()
+    try:
+        for i in range(0, len(h1s), 900):
+            chunk = h1s[i:i + 900]
+            cur = con.execute(f"SELECT h1, h2, ml_metric FROM ml_cache WHERE model=? AND h1 IN ({','.join('?' * len(chunk))})",
+                              (model, *chunk))
+            out.update(((h1, h2), m) for h1, h2, m in cur.fetchall() if h2 in by_h1[h1])
+    finally:
+        con.close()
+    return out
+
+
+def mem_write_ml_cache(model: str, rows: Iterable[tuple]) -> None:
+    """rows — (h1, h2, ml_metric)."""
+    now = int(time.time())
+    con = _connect()
+    con.executemany("INSERT OR REPLACE INTO ml_cache(model, h1, h2, ml_metric, ts) VALUES(?,?,?,?,?)",
+                    [(model, int(h1), int(h2), float(m), now) for h1, h2, m in rows])
+    con.commit(); con.close()
+
+
+def mem_read_ml_columns(model: str) -> Optional[list]:
+    """Входные признаки модели с этим отпечатком (None — модель ещё не встречалась)."""
+    con = _connect()
+    try:
+        row = con.execute("SELECT columns FROM ml_model WHERE model=?", (model,)).fetchone()
+    finally:
+        con.close()
+    return json.loads(row[0]) if row else None
+
+
+def mem_write_ml_columns(model: str, columns: list) -> None:
+    con = _connect()
+    con.execute("INSERT OR REPLACE INTO ml_model(model, columns, seen_at) VALUES(?,?,?)",
+                (model, json.dumps(list(columns), ensure_ascii=False), int(time.time())))
+    con.commit(); con.close()
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# ЖУРНАЛ ПРОГОНОВ (возобновление после падения)
+# ─────────────────────────────────────────────────────────────────────────────
+def mem_run_open(input_hash: str, params: Dict[str, Any], resume: bool = False):
+    """
+    Начать прогон или (resume) продолжить последний незавершённый с тем же input_hash.
+    → (run_id, {batch_key: (tx_ids, transactions)} уже готовых пакетов).
+    """
+    con = _connect(); cur = con.cursor()
+    try:
+        r = cur.execute("""SELECT run_id FROM runs WHERE input_hash=? AND status<>'done'
+                           ORDER BY started_at DESC LIMIT 1""", (input_hash,)).fetchone() if resume else None
+        if r:
+            run_id = r[0]
+            done = {k: (json.loads(ids), json.loads(res)) for k, ids, res in cur.execute(
+                "SELECT batch_key, tx_ids, result FROM run_journal WHERE run_id=?", (run_id,))}
+            return run_id, done
+        run_id = uuid.uuid4().hex[:16]
+        cur.execute("INSERT INTO runs(run_id, input_hash, started_at, status, params) VALUES(?,?,?,?,?)",
+                    (run_id, input_hash, int(time.time()), "running", json.dumps(params, ensure_ascii=False)))
+        con.commit()
+        return run_id, {}
+    finally:
+        con.close()
+
+
+def mem_run_batch_done(run_id: str, batch_key: str, tx_ids, transactions) -> None:
+    """
+    Пакет готов: его решения уже записаны. В воркерах шардированного прогона запись идёт
+    через тот же приёмник, что и решения, — писатель фиксирует её не раньше них.
+    """
+    if _DECISION_SINK is not None:
+        _DECISION_SINK(("journal", run_id, batch_key, list(tx_ids), transactions))
+        return
+    con = _connect(); cur = con.cursor()
+    _write_journal(cur, run_id, batch_key, tx_ids, transactions, int(time.time()))
+    con.commit(); con.close()
+
+
+def _write_journal(cur: sqlite3.Cursor, run_id: str, batch_key: str, tx_ids, transactions, now: int):
+    cur.execute("INSERT OR REPLACE INTO run_journal(run_id, batch_key, tx_ids, result, done_at) VALUES(?,?,?,?,?)",
+                (run_id, batch_key, json.dumps(list(tx_ids)),
+                 json.dumps(transactions, ensure_ascii=False, default=str), now))
+
+
+def mem_run_finish(run_id: str, status: str = "done") -> None:
+    con = _connect()
+    con.execute("UPDATE runs SET status=?, finished_at=? WHERE run_id=?", (status, int(time.time()), run_id))
+    con.commit(); con.close()
+
+
 # ─────────────────────────────────────────────────────────────────────────────
 # Внутренний пересчёт агрегатов по ИНН (используется и в upsert, и в bulk)
 # ─────────────────────────────────────────────────────────────────────────────
-def _recalc_for_inn(cur: sqlite3.Cursor, inn: str):
+def _recalc_for_inn(cur: sqlite3.Cursor, inn):
+    inn = canon_inn(inn)
     if not inn:
         return
 
-    # все транзакции по ИНН (как дебит, так и кредит)
+    # все транзакции по ИНН (как дебит, так и кредит) — через tx_party,
+    # решения подтягиваем по PK decisions; платёж «сам себе» считаем один раз
     cur.execute("""
-        SELECT t.tx_id, t.amount, t.ts
-          FROM tx t
-         WHERE t.debit_inn = ? OR t.credit_inn = ?
-    """, (inn, inn))
-    rows = cur.fetchall()
+        SELECT p.tx_id, p.amount, p.ts, d.is_suspicious, d.p_llm
+          FROM tx_party p
+          LEFT JOIN decisions d ON d.tx_id = p.tx_id
+         WHERE p.inn = ?
+    """, (inn,))
+    rows = list({r[0]: r for r in cur.fetchall()}.values())
 
     cnt_total = len(rows)
     amt_total = sum((r[1] or 0.0) for r in rows)
@@ -282,32 +1316,19 @@ def _recalc_for_inn(cur: sqlite3.Cursor, inn: str):
     if rows:
         last_seen_ts = max((r[2] for r in rows if r[2]), default=None)
 
-    # присоединим решения (могут быть не для всех tx_id — это нормально до LLM)
-    tx_ids = [r[0] for r in rows]
+    # решения могут быть не для всех tx_id — это нормально до LLM
     cnt_suspicious = 0
     amt_suspicious = 0.0
     llm_flags_total = 0
-
-    if tx_ids:
-        q_marks = ",".join(["?"] * len(tx_ids))
-        cur.execute(f"""
-            SELECT d.tx_id, d.is_suspicious, d.p_llm
-              FROM decisions d
-             WHERE d.tx_id IN ({q_marks})
-        """, tx_ids)
-        for d_tx_id, is_susp, p_llm in cur.fetchall():
-            is_susp = int(bool(is_susp))
-            if is_susp:
-                amt = next((r[1] for r in rows if r[0] == d_tx_id), 0.0)
-                amt_suspicious += float(amt or 0.0)
-                cnt_suspicious += 1
-            try:
-                if float(p_llm or 0.0) >= 0.99:
-                    llm_flags_total += 1
-            except Exception:
-                pass
-
-    susp_rate = (cnt_suspicious / cnt_total) if cnt_total > 0 else 0.0
+    for _, amt, _, is_susp, p_llm in rows:
+        if is_susp:
+            amt_suspicious += float(amt or 0.0)
+            cnt_suspicious += 1
+        try:
+            if float(p_llm or 0.0) >= 0.99:
+                llm_flags_total += 1
+        except Exception:
+            pass
 
     # Квантили p50/p75/p90/p95 (по всем суммам этого ИНН)
     p50 = p75 = p90 = p95 = None
@@ -322,6 +1343,27 @@ def _recalc_for_inn(cur: sqlite3.Cursor, inn: str):
         except Exception:
             pass
 
+    # + сводка по заархивированному периоду (retention.py): счётчики складываем,
+    #   квантили — по гистограмме архива вместе с «живыми» суммами
+    cur.execute("""
+        SELECT cnt_total, cnt_suspicious, amt_total, amt_suspicious, llm_flags_total,
+               last_seen_ts, p50, p75, p90, p95, amt_hist
+          FROM agg_archive WHERE inn=?""", (inn,))
+    arch = cur.fetchone()
+    if arch:
+        cnt_total      += int(arch[0] or 0)
+        cnt_suspicious += int(arch[1] or 0)
+        amt_total      += float(arch[2] or 0.0)
+        amt_suspicious += float(arch[3] or 0.0)
+        llm_flags_total += int(arch[4] or 0)
+        if arch[5] and (last_seen_ts is None or arch[5] > last_seen_ts):
+            last_seen_ts = arch[5]
+        hist = _archive_hist(arch[10], arch[0], arch[6:10])
+        if hist:
+            p50, p75, p90, p95 = _hist_quantiles(_hist_add(hist, amounts))
+
+    susp_rate = (cnt_suspicious / cnt_total) if cnt_total > 0 else 0.0
+
     # watchlisted: сохраняем текущее значение (если есть), не затираем
     cur.execute("SELECT watchlisted FROM agg_counterparty WHERE inn=?", (inn,))
     r_watch = cur.fetchone()
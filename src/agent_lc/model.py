@@ -1,19 +1,67 @@
-import os, glob, joblib
+import os, glob, threading
 import pandas as pd
 import numpy as np
-from .config import MODEL_PATH, LE_PATH
-
-def load_artifacts():
-    model_path = MODEL_PATH
-    if not os.path.exists(model_path):
-        cands = sorted(glob.glob("models/best_pipeline_*.joblib")) or sorted(glob.glob("best_pipeline_*.joblib"))
-        assert cands, "Не найден сохранённый Pipeline (*.joblib)."
-        model_path = cands[0]
-    pipe = joblib.load(model_path)
-    le = joblib.load(LE_PATH) if os.path.exists(LE_PATH) else None
-    return pipe, le
+from .config import MODEL_PATH, LE_PATH, ML_CACHE, LEAN_FRAMES
+from .telemetry import span
 
-def predict_with_pipeline(pipe, df_prep: pd.DataFrame) -> pd.DataFrame:
+_NON_FEATURES = {"id", "tx_id"}          # идентичность строки, не признаки
+_HASH_KEYS = ("agent-lc-ml-key1", "agent-lc-ml-key2")   # 2 × 64 бита хеша признаков
+
+
+def _model_path() -> str:
+    if os.path.exists(MODEL_PATH):
+        return MODEL_PATH
+    cands = sorted(glob.glob("models/best_pipeline_*.joblib")) or sorted(glob.glob("best_pipeline_*.joblib"))
+    assert cands, "Не найден сохранённый Pipeline (*.joblib)."
+    return cands[0]
+
+_ARTIFACTS = {}                          # (путь, mtime, mmap_mode) → (pipe, le): одна загрузка на процесс
+_ARTIFACTS_LOCK = threading.Lock()
+
+def load_artifacts(mmap_mode=None):
+    """
+    mmap_mode="r" — numpy-массивы модели отображаются из файла (общие страницы между процессами).
+    Загруженное кэшируется в процессе, пока файл модели не сменился (выписки cli.py batch, повторные прогоны).
+    """
+    path = _model_path()
+    key = (path, os.stat(path).st_mtime_ns, mmap_mode)
+    with _ARTIFACTS_LOCK:
+        if key not in _ARTIFACTS:
+            import joblib               # с попаданиями кэша ml_metric модель (и joblib/sklearn) не нужна
+            pipe = joblib.load(path, mmap_mode=mmap_mode)
+            le = joblib.load(LE_PATH) if os.path.exists(LE_PATH) else None
+            _ARTIFACTS.clear()
+            _ARTIFACTS[key] = (pipe, le)
+        return _ARTIFACTS[key]
+
+def model_fingerprint() -> str:
+    """Отпечаток файла модели (sha1 содержимого; пересчёт — только при смене размера/mtime)."""
+    from .identity import _file_digest
+    path = _model_path()
+    st = os.stat(path)
+    return _file_digest(path, st.st_size, st.st_mtime_ns)[:16]
+
+def _input_columns(pipe, df: pd.DataFrame) -> list:
+    cols = getattr(pipe, "feature_names_in_", None)
+    return [str(c) for c in cols] if cols is not None else sorted(c for c in df.columns if c not in _NON_FEATURES)
+
+def feature_hash(df: pd.DataFrame, columns: list):
+    """
+    128-битный хеш входных признаков каждой строки → (h1, h2) int64.
+    Числа приводятся к float64 (int/float одного значения — один хеш), прочее — к строке;
+    нет колонки — как пропуск.
+    """
+    X = pd.DataFrame(index=df.index)
+    for c in columns:
+        s = df[c] if c in df.columns else pd.Series(np.nan, index=df.index)
+        if pd.api.types.is_bool_dtype(s) or pd.api.types.is_numeric_dtype(s):
+            X[c] = pd.to_numeric(s, errors="coerce").astype("float64")
+        else:
+            X[c] = s.astype(str).where(s.notna(), None)
+    return tuple(pd.util.hash_pandas_object(X, index=False, hash_key=k).to_numpy().view(np.int64)
+                 for k in _HASH_KEYS)
+
+def _score(pipe, df_prep: pd.DataFrame) -> np.ndarray:
     if hasattr(pipe, "predict_proba"):
         try:
             proba = pipe.predict_proba(df_prep)
@@ -22,6 +70,46 @@ def predict_with_pipeline(pipe, df_prep: pd.DataFrame) -> pd.DataFrame:
             ml_metric = np.clip(pipe.predict(df_prep).astype(float), 0, 1)
     else:
         ml_metric = np.clip(pipe.predict(df_prep).astype(float), 0, 1)
-    df_out = df_prep.copy()
+    return ml_metric
+
+def predict_with_pipeline(pipe, df_prep: pd.DataFrame) -> pd.DataFrame:
+    """
+    ml_metric каждой строки. С ML_CACHE — из кэша памяти по (отпечаток файла модели, хеш входных
+    признаков строки); модель считает только промахи. pipe=None — модель грузится лишь при промахах.
+    С LEAN_FRAMES ml_metric дописывается в сам df_prep (без копии).
+    """
+    df_out = df_prep if LEAN_FRAMES else df_prep.copy()
+    if not ML_CACHE or not len(df_prep):
+        if pipe is None:
+            with span("model_load"):
+                pipe, _ = load_artifacts()
+        df_out["ml_metric"] = _score(pipe, df_prep)
+        return df_out
+
+    from .storage import get_store     # storage → memory → config; модель грузят и воркеры шардов
+    store = get_store()
+    fp = model_fingerprint()
+    with span("ml_cache", rows=len(df_prep)) as sp:
+        columns = store.read_ml_columns(fp)
+        if columns is None:
+            if pipe is None:
+                with span("model_load"):
+                    pipe, _ = load_artifacts()
+            columns = _input_columns(pipe, df_prep)
+            store.write_ml_columns(fp, columns)
+        h1, h2 = feature_hash(df_prep, columns)
+        keys = list(zip(h1.tolist(), h2.tolist()))
+        cached = store.read_ml_cache(fp, set(keys))
+        ml_metric = np.array([cached.get(k, np.nan) for k in keys], dtype=float)
+        miss = np.isnan(ml_metric)
+        sp["hits"] = int((~miss).sum())
+
+    if miss.any():
+        if pipe is None:
+            with span("model_load"):
+                pipe, _ = load_artifacts()
+        with span("ml_predict", rows=int(miss.sum())):
+            ml_metric[miss] = _score(pipe, df_prep[miss])
+        store.write_ml_cache(fp, [(*keys[i], ml_metric[i]) for i in np.flatnonzero(miss)])
     df_out["ml_metric"] = ml_metric
     return df_out
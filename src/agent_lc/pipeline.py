@@ -1,14 +1,32 @@
 # src/agent_lc/pipeline.py
+import hashlib
 import json
+import os
+import threading
 import time
+from concurrent.futures import Future
+import numpy as np
 import pandas as pd
-from langchain_core.runnables import RunnableSequence
 
-from .memory import mem_init, mem_bulk_preload_statement
+from .config import (ASOF_HISTORY, NETWORK_REFRESH, PIPELINE_WORKERS, TWO_PHASE,
+                     LLM_DEADLINE_S, LLM_TOKEN_BUDGET, LLM_DEDUPE, PURPOSE_LSH, LEAN_FRAMES, LLM_ENABLED)
+from .storage import get_store
+from .identity import tx_ids, decision_version
+from .history import add_asof_history
 from .features import build_base_features
-from .model import load_artifacts, predict_with_pipeline
-from .tools import build_llm_payload_tool, llm_assess_risk_tool
+from .frames import lean_frame, read_dtypes
+from .frequency import load_frequency_history
+from .amounts import load_amount_profiles
+from .network import refresh_network_risk
+from .model import predict_with_pipeline
+from .tools import assess_without_llm
 from .export import export_excel_report
+from .sharding import run_sharded
+from .scheduler import LLMBudget, run_llm_scheduled
+from .dedupe import run_deduplicated
+from . import llm_usage
+from . import telemetry
+from .telemetry import span
 
 # ─────────────────────────────────────────────────────────────
 # try/except для красивого прогресса
@@ -20,16 +38,16 @@ except Exception:
     _HAS_TQDM = False
 
 
-def _read_csv_robust(path: str) -> pd.DataFrame:
+def _read_csv_robust(path: str, dtype: dict | None = None) -> pd.DataFrame:
     tried = []
     for enc in ("utf-8", "utf-8-sig", "cp1251", "latin1"):
         for sep in (",", ";", "\t", "|"):
             try:
-                return pd.read_csv(path, encoding=enc, sep=sep)
+                return pd.read_csv(path, encoding=enc, sep=sep, dtype=dtype)
             except Exception as e:
                 tried.append(f"{enc}/{repr(sep)} -> {e.__class__.__name__}")
                 continue
-    return pd.read_csv(path, engine="python", encoding_errors="replace", sep=None)
+    return pd.read_csv(path, engine="python", encoding_errors="replace", sep=None, dtype=dtype)
 
 
 def _ensure_ids(df: pd.DataFrame) -> pd.DataFrame:
@@ -46,35 +64,42 @@ def _ensure_ids(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
-def run_pipeline(csv_path: str, out_xlsx: str, llm_batch_size: int = 10, verbose: bool = True) -> dict:
-    # 1) Память/БД
-    mem_init()
+def _input_hash(csv_path: str, llm_batch_size: int) -> str:
+    """Ключ прогона для журнала: содержимое выписки + размер пакета (от него зависит нарезка)."""
+    h = hashlib.sha1()
+    with open(csv_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    h.update(f"|batch={int(llm_batch_size)}".encode())
+    return h.hexdigest()
 
-    # 2) Данные
-    df_raw = _read_csv_robust(csv_path)
-
-    # 3) Признаки
-    df_prep = build_base_features(df_raw)
 
-    # 4) Модель
-    pipe, _ = load_artifacts()
-    df_scored = predict_with_pipeline(pipe, df_prep)
-    df_scored = _ensure_ids(df_scored)
+def run_llm_batches(df_scored: pd.DataFrame, llm_batch_size: int = 10, verbose: bool = True,
+                    run_id: str | None = None, done: dict | None = None, key_prefix: str = "",
+                    dedupe: bool | None = None) -> list:
+    """
+    Шаг 5: payload → LLM → смешивание по пакетам. → список итоговых транзакций.
+    run_id — каждый готовый пакет отмечается в журнале прогона; done — уже готовые пакеты
+    ({ключ: (id строк, транзакции)}): если состав пакета совпал, LLM не вызывается.
+    dedupe (по умолчанию LLM_DEDUPE / PURPOSE_LSH) — в пакеты идут только представители групп
+    равнозначных строк без объяснения в кэше (dedupe.py), остальным достаётся готовый ответ LLM.
+    """
+    if ((LLM_DEDUPE or PURPOSE_LSH) if dedupe is None else dedupe) and len(df_scored):
+        return run_deduplicated(df_scored, lambda reps: run_llm_batches(
+            reps, llm_batch_size, verbose, run_id, done, key_prefix, dedupe=False))
 
-    # 4.5) 🔶 ПРЕДЗАГРУЗКА ВСЕЙ ВЫПИСКИ В ПАМЯТЬ (tx + agg_counterparty)
-    # Это нужно, чтобы PRIOR/квантили/last_seen уже учитывали всю таблицу до LLM.
-    mem_bulk_preload_statement(df_scored)
-
-    # 5) Оркестрация LLM ПО БАТЧАМ (как было)
+    # langchain — только здесь: прогон без LLM (LLM_ENABLED=0) и cli.py --help его не импортируют
+    from langchain_core.runnables import RunnableSequence
+    from .tools import build_llm_payload_tool, llm_assess_risk_tool
     chain = RunnableSequence(first=build_llm_payload_tool, last=llm_assess_risk_tool)
+    llm_usage.set_run(run_id)       # учёт вызовов LLM — под этим прогоном (и в воркере шарда)
 
-    all_records = json.loads(df_scored.to_json(orient="records", force_ascii=False))
     merged_tx = []
 
-    if not all_records:
+    if not len(df_scored):
         raise RuntimeError("Нет данных после подготовки признаков.")
 
-    total = len(all_records)
+    total = len(df_scored)
     total_batches = (total + llm_batch_size - 1) // llm_batch_size
 
     # ── Индикатор прогресса ───────────────────────────────────
@@ -88,8 +113,19 @@ def run_pipeline(csv_path: str, out_xlsx: str, llm_batch_size: int = 10, verbose
 
     processed = 0
     for bi in range(0, total, llm_batch_size):
-        batch_records = all_records[bi:bi + llm_batch_size]
+        # записи — по пакету, а не списком dict'ов на всю выписку
+        batch_records = json.loads(df_scored.iloc[bi:bi + llm_batch_size].to_json(orient="records", force_ascii=False))
         batch_idx = bi // llm_batch_size + 1
+        batch_key = f"{key_prefix}{batch_idx}"
+        batch_ids = [r.get("id") for r in batch_records]
+
+        # пакет уже обработан в прерванном прогоне — решения в памяти, итог в журнале
+        if done and batch_key in done and done[batch_key][0] == batch_ids:
+            merged_tx.extend(done[batch_key][1])
+            processed += len(batch_records)
+            if verbose and _HAS_TQDM:
+                pbar.update(len(batch_records))
+            continue
 
         # Индикатор (plain)
         if verbose and not _HAS_TQDM:
@@ -100,11 +136,18 @@ def run_pipeline(csv_path: str, out_xlsx: str, llm_batch_size: int = 10, verbose
                   f"готово {processed}/{total} | {rate:.1f} tx/s")
 
         # Передаём в первый tool именно подмножество
-        enriched_json = chain.invoke(json.dumps(batch_records, ensure_ascii=False))
+        with span("batch", rows=len(batch_records), key=batch_key):
+            enriched_json = chain.invoke(json.dumps(batch_records, ensure_ascii=False))
         # Надёжный парс (оба варианта принимаем)
         part = json.loads(enriched_json) if isinstance(enriched_json, str) else enriched_json
-        got = len(part.get("transactions", []))
-        merged_tx.extend(part.get("transactions", []))
+        part_tx = part.get("transactions", [])
+        got = len(part_tx)
+        merged_tx.extend(part_tx)
+        # готов — только пакет, где у каждой строки есть ответ LLM; сбой (фолбэк, llm_status=error)
+        # или недостающие строки (ответ не разобран, модель их пропустила) — --resume отправит снова
+        answered = {str(t.get("id")) for t in part_tx if t.get("llm_status") != "error"}
+        if run_id and all(str(i) in answered for i in batch_ids):
+            get_store().run_batch_done(run_id, batch_key, batch_ids, part_tx)
 
         # обновим прогресс
         processed += len(batch_records)
@@ -119,10 +162,198 @@ def run_pipeline(csv_path: str, out_xlsx: str, llm_batch_size: int = 10, verbose
         rate = processed / elapsed if elapsed > 0 else 0.0
         print(f"[LLM] Готово: {processed}/{total} за {elapsed:.1f}s ({rate:.1f} tx/s)")
 
+    return merged_tx
+
+
+def _split_decided(df: pd.DataFrame, store, verbose: bool = True):
+    """
+    Строки, уже решённые этой же версией (модель/промпт/веса) в прошлых прогонах, по tx_id.
+    → (маска, их итоговые транзакции с id текущей выписки, их p_ml)
+    """
+    decided = store.read_decided(df["tx_id"].tolist(), decision_version())
+    mask = df["tx_id"].isin(list(decided)).to_numpy()
+    old = df.loc[mask, ["id", "tx_id"]]
+    reused = [dict(decided[t][1], id=int(i)) for i, t in zip(old["id"], old["tx_id"])]
+    p_ml = pd.Series([decided[t][0] for t in old["tx_id"]], index=old.index, dtype=float)
+    if verbose and mask.any():
+        print(f"[pipeline] уже решено в памяти: {int(mask.sum())}/{len(df)} строк — без LLM")
+    return mask, reused, p_ml
+
+
+def _undecided(df: pd.DataFrame, mask) -> pd.DataFrame:
+    """Строки, ещё не решённые этой версией; если решённых нет — сам df, без копии."""
+    return df[~mask] if mask.any() else df
+
+
+def _in_input_order(df: pd.DataFrame, tx: list) -> list:
+    order = {int(x): i for i, x in enumerate(df["id"])}
+    return sorted(tx, key=lambda t: order.get(int(t.get("id", -1)), len(order)))
+
+
+def run_pipeline(csv_path: str, out_xlsx: str, llm_batch_size: int = 10, verbose: bool = True,
+                 workers: int | None = None, resume: bool = False, two_phase: bool | None = None,
+                 deadline_s: float | None = None, token_budget: int | None = None,
+                 llm: bool | None = None) -> dict:
+    """
+    Полный прогон выписки. → {"xlsx", "summary", "llm_usage", "telemetry"}; llm_usage — токены
+    и задержки вызовов LLM (llm_usage.py), telemetry — сводка спанов по этапам (telemetry.py),
+    трасса пишется и при падении прогона.
+
+    two_phase (TWO_PHASE) — отчёт сразу по ML + prior + правилам, LLM-фаза — в фоновом потоке:
+    в результате ещё "llm_phase" — Future итогового результата (тот же xlsx, перезаписанный
+    с ответами LLM; колонка llm_status: pending → updated).
+
+    deadline_s (LLM_DEADLINE_S) — срок LLM-этапа в секундах от начала прогона, token_budget
+    (LLM_TOKEN_BUDGET) — предел токенов: строки идут в LLM по приоритету (scheduler.py), на что
+    не хватило — решаются без LLM (llm_status=skipped); в результате "llm_schedule".
+
+    llm=False (LLM_ENABLED=0) — прогон только по ML + prior + правилам, все новые строки —
+    llm_status=skipped; стек LLM (langchain, GigaChat) не импортируется, двухфазность и бюджет не нужны.
+    """
+    llm = LLM_ENABLED if llm is None else bool(llm)
+    two_phase = (TWO_PHASE if two_phase is None else bool(two_phase)) and llm
+    budget = (LLMBudget(LLM_DEADLINE_S if deadline_s is None else deadline_s,
+                        LLM_TOKEN_BUDGET if token_budget is None else token_budget) if llm else LLMBudget())
+    telemetry.reset()
+    root = {}
+    try:
+        with span("run_pipeline") as root:
+            res = _run_pipeline(csv_path, out_xlsx, llm_batch_size, verbose, workers, resume, two_phase,
+                                budget, llm, root)
+    finally:
+        tel = telemetry.write_trace(root.get("run_id") or time.strftime("failed_%Y%m%d_%H%M%S"))
+    if verbose:
+        top = sorted(tel["stages"].items(), key=lambda kv: -kv[1]["wall_s"])[1:6]
+        print("[telemetry] " + ", ".join(f"{k} {v['wall_s']:.1f}s" for k, v in top) + f"  → {tel['trace']}")
+    return {**res, "telemetry": tel}
+
+
+def _run_pipeline(csv_path, out_xlsx, llm_batch_size, verbose, workers, resume, two_phase, budget, llm,
+                  root) -> dict:
+    workers = max(1, PIPELINE_WORKERS if workers is None else int(workers))
+    if not llm:
+        workers = 1                      # шарды распараллеливают LLM-этап; без него — последовательно
+
+    # 1) Память/БД (движок — MEMORY_BACKEND, storage.py)
+    store = get_store()
+    with span("memory_init"):
+        store.init()
+    if workers > 1 and not store.shared:
+        if verbose:
+            print(f"[pipeline] память {type(store).__name__} не видна воркерам — прогон последовательный")
+        workers = 1
+
+    # 1.5) Журнал прогона: с resume — продолжаем незавершённый прогон той же выписки
+    run_id, done = store.run_open(_input_hash(csv_path, llm_batch_size),
+                                  dict(csv=csv_path, out=out_xlsx, llm_batch_size=llm_batch_size,
+                                       workers=workers), resume)
+    root["run_id"] = run_id
+    if verbose and done:
+        print(f"[pipeline] возобновление прогона {run_id}: готово пакетов — {len(done)}")
+
+    # 2) Данные
+    with span("csv_read") as sp:
+        df_raw = _read_csv_robust(csv_path, dtype=read_dtypes())
+        if "tx_id" not in df_raw.columns:
+            df_raw["tx_id"] = tx_ids(df_raw)     # ключ памяти по содержимому (identity.py)
+        lean_frame(df_raw)                       # LEAN_FRAMES: category/сужение чисел (frames.py)
+        sp["rows"] = root["rows"] = len(df_raw)
+
+    # 3) Признаки (частотные окна и профили сумм — из памяти, до предзагрузки выписки)
+    with span("features", rows=len(df_raw)):
+        with span("history_read"):
+            history, profiles = load_frequency_history(df_raw), load_amount_profiles(df_raw)
+        df_prep = lean_frame(build_base_features(df_raw, history=history, profiles=profiles,
+                                                 inplace=LEAN_FRAMES))
+
+    if workers > 1 and budget.active and not two_phase:
+        if verbose:
+            print("[pipeline] бюджет LLM: приоритет строк общий для выписки — прогон последовательный")
+        workers = 1
+
+    if workers > 1 and not two_phase:
+        # 4–5) ШАРДИРОВАННО (sharding.py): память и as-of — здесь, по всей выписке;
+        # модель + LLM + смешивание — в воркерах по хешу пары, запись решений — один писатель
+        df_prep = _ensure_ids(df_prep)
+        with span("preload", rows=len(df_prep)):
+            store.bulk_preload(df_prep)
+        if ASOF_HISTORY:
+            with span("asof_history", rows=len(df_prep)):
+                df_prep = add_asof_history(df_prep)
+        mask, reused, p_ml = _split_decided(df_prep, store, verbose)
+        with span("sharded", rows=int((~mask).sum()), workers=workers):
+            df_new, new_tx = (run_sharded(_undecided(df_prep, mask), workers, llm_batch_size, verbose, run_id, done)
+                              if (~mask).any() else (df_prep.iloc[:0].assign(ml_metric=np.nan), []))
+        df_scored = pd.concat([df_new, df_prep[mask].assign(ml_metric=p_ml)]).loc[df_prep.index]
+        merged_tx = _in_input_order(df_scored, reused + new_tx)
+    else:
+        # 4) Модель (грузится только при промахах кэша ml_metric)
+        with span("predict", rows=len(df_prep)):
+            df_scored = predict_with_pipeline(None, df_prep)
+        df_scored = _ensure_ids(df_scored)
+
+        # 4.5) 🔶 ПРЕДЗАГРУЗКА ВСЕЙ ВЫПИСКИ В ПАМЯТЬ (tx + agg_counterparty)
+        # Это нужно, чтобы PRIOR/квантили/last_seen уже учитывали всю таблицу до LLM.
+        with span("preload", rows=len(df_scored)):
+            store.bulk_preload(df_scored)
+
+        # 4.6) 🔶 AS-OF ИСТОРИЯ: для каждой строки — память строго до её ts (одним проходом).
+        # Иначе январская операция «видит» мартовские из той же выписки.
+        if ASOF_HISTORY:
+            with span("asof_history", rows=len(df_scored)):
+                df_scored = add_asof_history(df_scored)
+
+        # 5) Оркестрация LLM ПО БАТЧАМ; строки, решённые этой версией раньше, — из памяти
+        mask, reused, _ = _split_decided(df_scored, store, verbose)
+        if two_phase:
+            return _two_phase(df_scored, mask, reused, out_xlsx, llm_batch_size, verbose, workers,
+                              run_id, done, store, budget)
+        with span("llm_batches", rows=int((~mask).sum())):
+            new_tx = (_run_llm(_undecided(df_scored, mask), llm_batch_size, verbose, run_id, done, budget, llm)
+                      if (~mask).any() else [])
+        merged_tx = _in_input_order(df_scored, reused + new_tx)
+
+    return _finish(df_scored, merged_tx, out_xlsx, run_id, store, verbose, budget=budget)
+
+
+def _run_llm(df, llm_batch_size, verbose, run_id, done, budget, llm: bool = True) -> list:
+    """
+    Шаг 5 в одном процессе: с бюджетом — по приоритету (scheduler.py), иначе — по порядку выписки;
+    llm=False — все строки без LLM (llm_status=skipped).
+    """
+    if not llm:
+        with span("without_llm", rows=len(df)):
+            return assess_without_llm(df.to_json(orient="records", force_ascii=False), llm_status="skipped")
+    if budget.active:
+        return run_llm_scheduled(df, llm_batch_size, budget, verbose, run_id, done)
+    return run_llm_batches(df, llm_batch_size, verbose, run_id, done)
+
+
+def _finish(df_scored, merged_tx, out_xlsx, run_id, store, verbose, final: bool = True, budget=None) -> dict:
+    """Шаги 5.5–7: сетевой риск, отчёт, закрытие прогона, сводка. final=False — предварительный отчёт."""
     llm_resp = {"overall_observation": "", "transactions": merged_tx}
 
-    # 6) Excel
-    xlsx = export_excel_report(df_scored, llm_resp, out_xlsx)
+    # 5.5) 🔶 ГРАФ КОНТРАГЕНТОВ: решения выписки уже в памяти → обновляем network_risk
+    # (тёплый старт с прошлого состояния, пишутся только изменившиеся ИНН)
+    if NETWORK_REFRESH and final:
+        with span("network"):
+            refresh_network_risk(verbose=verbose)
+
+    # 6) Excel (+ учёт вызовов LLM прогона, с возобновлениями — все попытки)
+    usage = llm_usage.summarize(store.read_llm_usage(run_id))
+    # строки отчёта без своего вызова LLM — ответ взят у представителя группы (dedupe.py)
+    usage[0]["rows_shared"] = sum(1 for t in merged_tx if t.get("llm_shared_with") is not None)
+    # ... и объяснение из кэша по профилю × кластеру назначения (purpose_lsh.py)
+    usage[0]["rows_cached"] = sum(1 for t in merged_tx if "llm_cached_from" in t)
+    with span("export", rows=len(merged_tx)):
+        try:
+            xlsx = export_excel_report(df_scored, llm_resp, out_xlsx, llm_usage=usage)
+        except PermissionError:
+            # отчёт открыт в Excel (Windows держит файл) — итог кладём рядом, а не теряем
+            xlsx = export_excel_report(df_scored, llm_resp, f"{os.path.splitext(out_xlsx)[0]}_final.xlsx",
+                                       llm_usage=usage)
+    if final:
+        store.run_finish(run_id)
 
     # 7) Сводка
     lbls = [t.get("risk_label") for t in llm_resp.get("transactions", [])]
@@ -132,4 +363,95 @@ def run_pipeline(csv_path: str, out_xlsx: str, llm_batch_size: int = 10, verbose
         "green":  sum(1 for x in lbls if x in ("зеленый", "зелёный")),
         "total":  len(lbls),
     }
-    return {"xlsx": xlsx, "summary": summary}
+    if verbose and usage[0]["calls"]:
+        u = usage[0]
+        print(f"[llm_usage] вызовов {u['calls']}, токенов {u['prompt_tokens']}+{u['completion_tokens']}, "
+              f"на операцию p50 {u['tokens_per_tx_p50']}, задержка p50/p90/p99 "
+              f"{u['latency_ms_p50']}/{u['latency_ms_p90']}/{u['latency_ms_p99']} мс")
+    if verbose and (usage[0]["rows_shared"] or usage[0]["rows_cached"]):
+        print(f"[dedupe] без своего вызова LLM: ответ представителя группы — {usage[0]['rows_shared']}, "
+              f"объяснение из кэша — {usage[0]['rows_cached']}, из {len(merged_tx)}")
+    res = {"xlsx": xlsx, "summary": summary, "llm_usage": usage[0]}
+    if budget is not None and budget.active and final:
+        res["llm_schedule"] = budget.stats
+    return res
+
+
+# ─────────────────────────────────────────────────────────────
+# Двухфазный прогон: отчёт без LLM сразу, LLM — в фоне
+# ─────────────────────────────────────────────────────────────
+_LLM_PHASE_LOCK = threading.Lock()     # LLM-фазы разных прогонов — по очереди
+
+
+def _in_background(fn, *args) -> Future:
+    """
+    fn(*args) в отдельном не-daemon потоке (интерпретатор дождётся его при выходе) → Future.
+    Не ThreadPoolExecutor: процессы шардов, форкнутые из его потока, падают на выходе —
+    atexit-хук concurrent.futures пытается присоединить поток, который в дочернем процессе текущий.
+    """
+    fut: Future = Future()
+
+    def run():
+        with _LLM_PHASE_LOCK:
+            if not fut.set_running_or_notify_cancel():
+                return
+            try:
+                fut.set_result(fn(*args))
+            except BaseException as e:
+                fut.set_exception(e)
+
+    threading.Thread(target=run, name="agent-lc-llm-phase").start()
+    return fut
+
+
+def _two_phase(df_scored, mask, reused, out_xlsx, llm_batch_size, verbose, workers, run_id, done, store,
+               budget) -> dict:
+    """
+    Фаза 1: строки без окончательного решения — по ML + prior + правилам (assess_without_llm,
+    в память со статусом pending), отчёт пишется сразу. Фаза 2 ставится в фоновый поток.
+    """
+    todo = _undecided(df_scored, mask)
+    with span("preliminary", rows=len(todo)):
+        prelim = assess_without_llm(todo.to_json(orient="records", force_ascii=False)) if len(todo) else []
+    for t in reused:
+        t["llm_status"] = "reused"
+    res = _finish(df_scored, _in_input_order(df_scored, reused + prelim), out_xlsx, run_id, store, verbose,
+                  final=False)
+    if verbose:
+        print(f"[pipeline] предварительный отчёт: {res['xlsx']} (ждут LLM: {len(prelim)})")
+    res["llm_phase"] = _in_background(_llm_phase, df_scored, mask, reused, prelim, out_xlsx, llm_batch_size,
+                                      verbose, workers, run_id, done, store, budget)
+    return res
+
+
+def _llm_phase(df_scored, mask, reused, prelim, out_xlsx, llm_batch_size, verbose, workers, run_id, done,
+               store, budget) -> dict:
+    """
+    Фаза 2 (фоновый поток): LLM по строкам фазы 1 — решения перезаписываются окончательными,
+    отчёт пересобирается целиком; строки, которые LLM пропустил, остаются с итогом фазы 1
+    (pending). Своя трасса run_<id>_llm.json; пакеты — в журнале прогона, так что оборванную
+    фазу продолжает --resume.
+    """
+    telemetry.reset()
+    try:
+        with span("llm_phase", rows=int((~mask).sum())):
+            todo = _undecided(df_scored, mask)
+            if not len(todo):
+                new_tx = []
+            elif workers > 1 and not budget.active:
+                with span("sharded", rows=len(todo), workers=workers):
+                    _, new_tx = run_sharded(todo, workers, llm_batch_size, verbose, run_id, done)
+            else:
+                with span("llm_batches", rows=len(todo)):
+                    new_tx = _run_llm(todo, llm_batch_size, verbose, run_id, done, budget)
+            for t in new_tx:
+                t.setdefault("llm_status", "updated")
+            got = {int(t.get("id", -1)) for t in new_tx}
+            left = [t for t in prelim if int(t["id"]) not in got]
+            res = _finish(df_scored, _in_input_order(df_scored, reused + new_tx + left), out_xlsx, run_id,
+                          store, verbose, budget=budget)
+    finally:
+        tel = telemetry.write_trace(f"{run_id}_llm")
+    if verbose:
+        print(f"[pipeline] LLM-фаза завершена: {res['xlsx']}")
+    return {**res, "telemetry": tel}
@@ -23,7 +23,8 @@ INPUT_DATA: [{
   debit_amount:float|null, credit_amount:float|null, amount:float|null,
   debit_inn:str, credit_inn:str, chain_match:str|null, chain_length:int|null, chain_duration_hours:float|null,
   debit_susp_rate:float, debit_cnt_suspicious:int, debit_last_seen_days:float|null, debit_watchlisted:int, debit_p95:float|null,
-  credit_susp_rate:float, credit_cnt_suspicious:int, credit_last_seen_days:float|null, credit_watchlisted:int, credit_p95:float|null
+  credit_susp_rate:float, credit_cnt_suspicious:int, credit_last_seen_days:float|null, credit_watchlisted:int, credit_p95:float|null,
+  debit_network_risk:float(0..1), credit_network_risk:float(0..1)
 }]
 
 ---
@@ -35,6 +36,7 @@ INPUT_DATA: [{
 - debit_watchlisted или credit_watchlisted = 1 → контрагент в списке наблюдения.  
 - debit_last_seen_days или credit_last_seen_days < 30 → контрагент недавно был активен.  
 - если amount > p95 контрагента — сумма выше типичных значений, упомяни это как аномалию.  
+- debit_network_risk или credit_network_risk ≥ 0.3 → подозрительные контрагенты в 1–2 шагах по графу платежей (связи с рискованной сетью).  
 
 ---
 
@@ -0,0 +1,282 @@
+# src/agent_lc/purpose_lsh.py
+"""
+Кластеры назначений платежа (MinHash + LSH) и переиспользование объяснений LLM.
+
+Назначения одного смысла различаются номерами и датами («оплата по счету №123
+от 01.02» / «…№124 от 08.02»), поэтому точный ключ их не ловит. Здесь:
+
+  * нормализация — normalize_purpose: регистр, ё→е, числа/даты/номера → «#»;
+  * одинаковый нормализованный текст — сразу тот же кластер (purpose_norm);
+  * новый текст — MinHash-подпись по символьным шинглам значимых слов (N_PERM перестановок),
+    кандидаты — по LSH-корзинам (N_BANDS полос × ROWS строк, индекс
+    (band, bucket)), кластер — лучший кандидат с оценкой Жаккара ≥
+    PURPOSE_LSH_THRESHOLD, иначе новый. В индексе только подпись первого
+    текста кластера, поиск — несколько индексных выборок, без перебора истории.
+
+Объяснения: (профиль контрагентов, кластер назначения, версия решений) →
+p_llm, объяснение и рекомендация последнего ответа LLM. Профиль — пара ИНН,
+корзина суммы и набор флагов, как у dedupe.py. Строка выписки с известной
+тройкой в LLM не уходит: LLM-часть берётся из кэша (tools.assess_like), смесь
+и метка — по своей строке; в отчёте — llm_cached_from (tx_id источника).
+Смена модели/промпта/весов меняет версию (identity.decision_version) —
+старые объяснения не используются.
+
+Индекс лежит рядом с памятью: PURPOSE_LSH_PATH (по умолчанию
+<каталог DB_PATH>/purpose_lsh.sqlite); при MEMORY_BACKEND=memory — в памяти процесса.
+
+    python -m src.agent_lc.purpose_lsh --rebuild      # кластеры по всем назначениям памяти
+    python -m src.agent_lc.purpose_lsh --stats
+"""
+import argparse, hashlib, json, os, re, sqlite3, time, zlib
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+from .config import DB_PATH, MEMORY_BACKEND, PURPOSE_LSH_PATH, PURPOSE_LSH_THRESHOLD
+from .telemetry import count_sql, span
+
+N_PERM  = 120
+N_BANDS = 20
+ROWS    = N_PERM // N_BANDS        # порог кандидата ≈ (1/N_BANDS)^(1/ROWS) ≈ 0.6; при J=0.7 — кандидат в 92%, 0.8 — 99.8%
+SHINGLE = 4
+_PRIME  = 4294967311               # простое > 2^32: (a·h + b) mod p без переполнения uint64
+
+_rng = np.random.RandomState(20240301)          # фиксировано: подписи сравнимы между прогонами
+_A = _rng.randint(1, 2**32 - 1, size=N_PERM, dtype=np.uint64)
+_B = _rng.randint(0, 2**32 - 1, size=N_PERM, dtype=np.uint64)
+
+# служебные слова назначений: номера/даты (уже «#»), НДС, предлоги
+_SERVICE = frozenset("# n по от в во на за к с со и т ч г гг ндс руб коп сумма том числе без".split())
+
+_NUM = re.compile(r"\d+([.,/-]\d+)*")
+_PUNCT = re.compile(r"[^\w#]+")
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS purpose_cluster (
+        cluster_id INTEGER PRIMARY KEY,
+        norm       TEXT NOT NULL,              -- первый текст кластера
+        sig        BLOB NOT NULL,              -- MinHash-подпись norm (uint64 × N_PERM)
+        n_norms    INTEGER NOT NULL DEFAULT 1
+    );
+    CREATE TABLE IF NOT EXISTS purpose_norm (
+        norm       TEXT PRIMARY KEY,
+        cluster_id INTEGER NOT NULL
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS purpose_band (
+        band       INTEGER NOT NULL,
+        bucket     INTEGER NOT NULL,
+        cluster_id INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_purpose_band ON purpose_band(band, bucket);
+    CREATE TABLE IF NOT EXISTS llm_explanation (
+        profile          TEXT NOT NULL,
+        cluster_id       INTEGER NOT NULL,
+        version          TEXT NOT NULL,
+        p_llm            REAL,
+        risk_explanation TEXT,
+        recommendation   TEXT,
+        source_tx        TEXT,
+        ts               INTEGER,
+        PRIMARY KEY (profile, cluster_id, version)
+    ) WITHOUT ROWID;
+"""
+
+_MEM_CON: Dict[int, sqlite3.Connection] = {}     # pid → БД индекса при MEMORY_BACKEND=memory
+
+
+def normalize_purpose(text) -> str:
+    s = str(text or "").lower().replace("ё", "е")
+    s = _NUM.sub("#", s)
+    return " ".join(_PUNCT.sub(" ", s).split())
+
+
+def _connect() -> sqlite3.Connection:
+    if MEMORY_BACKEND == "memory":
+        con = _MEM_CON.get(os.getpid())
+        if con is None:
+            con = _MEM_CON[os.getpid()] = sqlite3.connect(":memory:", check_same_thread=False)
+            con.executescript(_SCHEMA)
+        return con
+    path = PURPOSE_LSH_PATH or os.path.join(os.path.dirname(DB_PATH), "purpose_lsh.sqlite")
+    fresh = not os.path.exists(path)
+    con = sqlite3.connect(path, timeout=30)
+    con.set_trace_callback(count_sql)
+    if fresh:
+        con.execute("PRAGMA journal_mode=WAL")
+    con.executescript(_SCHEMA)
+    return con
+
+
+def _close(con: sqlite3.Connection) -> None:
+    if MEMORY_BACKEND != "memory":
+        con.close()
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# MinHash / LSH
+# ─────────────────────────────────────────────────────────────────────────────
+def signature(norm: str) -> np.ndarray:
+    """
+    MinHash-подпись нормализованного текста: символьные шинглы длины SHINGLE по словам без
+    служебных (_SERVICE) — шаблон «по счету # от #, в т.ч. ндс #» иначе роднит любые назначения.
+    """
+    s = " ".join(w for w in norm.split() if w not in _SERVICE) or norm
+    s = f" {s} "
+    grams = {s[i:i + SHINGLE] for i in range(max(1, len(s) - SHINGLE + 1))}
+    h = np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams))
+    return ((np.outer(h, _A) + _B) % _PRIME).min(axis=0)
+
+
+def _buckets(sig: np.ndarray) -> List[int]:
+    """Корзина каждой полосы — 63-битный хэш её ROWS значений (стабилен между процессами)."""
+    return [int.from_bytes(hashlib.blake2b(sig[b * ROWS:(b + 1) * ROWS].tobytes(), digest_size=8).digest(),
+                           "big", signed=True) for b in range(N_BANDS)]
+
+
+def _cluster_for(cur: sqlite3.Cursor, norm: str) -> int:
+    sig = signature(norm)
+    buckets = _buckets(sig)
+    cur.execute("SELECT cluster_id, sig FROM purpose_cluster WHERE cluster_id IN ("
+                "SELECT b.cluster_id FROM (VALUES " + ",".join(["(?,?)"] * N_BANDS) + ") v "
+                "JOIN purpose_band b ON b.band = v.column1 AND b.bucket = v.column2)",
+                [x for band, bucket in enumerate(buckets) for x in (band, bucket)])
+    cand = cur.fetchall()
+    best = None
+    if cand:
+        j = (np.frombuffer(b"".join(blob for _, blob in cand), dtype=np.uint64).reshape(-1, N_PERM) == sig).mean(axis=1)
+        if j.max() >= PURPOSE_LSH_THRESHOLD:
+            best = cand[int(j.argmax())][0]
+    if best is None:
+        cur.execute("INSERT INTO purpose_cluster(norm, sig) VALUES(?,?)", (norm, sig.tobytes()))
+        best = cur.lastrowid
+        cur.executemany("INSERT INTO purpose_band(band, bucket, cluster_id) VALUES(?,?,?)",
+                        [(band, bucket, best) for band, bucket in enumerate(buckets)])
+    else:
+        cur.execute("UPDATE purpose_cluster SET n_norms = n_norms + 1 WHERE cluster_id=?", (best,))
+    cur.execute("INSERT OR IGNORE INTO purpose_norm(norm, cluster_id) VALUES(?,?)", (norm, best))
+    return best
+
+
+def _known(cur: sqlite3.Cursor, norms: Iterable[str]) -> Dict[str, int]:
+    norms, out = list(norms), {}
+    for i in range(0, len(norms), 500):
+        chunk = norms[i:i + 500]
+        cur.execute(f"SELECT norm, cluster_id FROM purpose_norm WHERE norm IN ({','.join('?' * len(chunk))})", chunk)
+        out.update(cur.fetchall())
+    return out
+
+
+def assign_clusters(texts: Iterable[str]) -> Dict[str, int]:
+    """Назначения (как есть) → кластер; новые нормализованные тексты добавляются в индекс."""
+    texts = list(texts)
+    norm_of = {t: normalize_purpose(t) for t in set(texts)}
+    con = _connect()
+    try:
+        cur = con.cursor()
+        known = _known(cur, set(norm_of.values()))
+        for norm in sorted(set(norm_of.values()) - set(known)):
+            known[norm] = _cluster_for(cur, norm)
+        con.commit()
+    finally:
+        _close(con)
+    return {t: known[n] for t, n in norm_of.items()}
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Кэш объяснений LLM
+# ─────────────────────────────────────────────────────────────────────────────
+def lookup_explanations(keys: Dict[int, tuple], version: str) -> Dict[int, Dict]:
+    """
+    keys — id строки → (профиль, назначение). → id строки → LLM-часть для tools.assess_like
+    (evidence.p_llm, тексты, llm_cached_from) у строк с известной тройкой профиль × кластер × версия.
+    """
+    if not keys:
+        return {}
+    cluster = assign_clusters(p for _, p in keys.values())
+    con = _connect()
+    try:
+        cur, out = con.cursor(), {}
+        for rid, (profile, purpose) in keys.items():
+            cur.execute("SELECT p_llm, risk_explanation, recommendation, source_tx FROM llm_explanation "
+                        "WHERE profile=? AND cluster_id=? AND version=?", (profile, cluster[purpose], version))
+            row = cur.fetchone()
+            if row:
+                out[rid] = {"evidence": {"p_llm": row[0]}, "risk_explanation": row[1],
+                            "recommendation": row[2], "llm_cached_from": row[3]}
+    finally:
+        _close(con)
+    return out
+
+
+def remember_explanations(items: List[tuple], version: str) -> int:
+    """items — (профиль, назначение, tx_id, итог строки с ответом LLM). → записано."""
+    if not items:
+        return 0
+    cluster = assign_clusters(p for _, p, _, _ in items)
+    now = int(time.time())
+    con = _connect()
+    try:
+        con.executemany(
+            "INSERT OR REPLACE INTO llm_explanation(profile, cluster_id, version, p_llm, risk_explanation, "
+            "recommendation, source_tx, ts) VALUES(?,?,?,?,?,?,?,?)",
+            [(profile, cluster[purpose], version, (t.get("evidence") or {}).get("p_llm"),
+              t.get("risk_explanation", ""), t.get("recommendation", ""), tx_id, now)
+             for profile, purpose, tx_id, t in items])
+        con.commit()
+    finally:
+        _close(con)
+    return len(items)
+
+
+def prune_explanations(before_ts: int) -> int:
+    """Объяснения, записанные раньше before_ts (retention.py, горизонт памяти). → удалено."""
+    con = _connect()
+    try:
+        n = con.execute("DELETE FROM llm_explanation WHERE ts < ?", (int(before_ts),)).rowcount
+        con.commit()
+    finally:
+        _close(con)
+    return n
+
+
+def stats() -> Dict[str, int]:
+    con = _connect()
+    try:
+        q = lambda sql: con.execute(sql).fetchone()[0]
+        return dict(clusters=q("SELECT COUNT(*) FROM purpose_cluster"),
+                    norms=q("SELECT COUNT(*) FROM purpose_norm"),
+                    explanations=q("SELECT COUNT(*) FROM llm_explanation"))
+    finally:
+        _close(con)
+
+
+def rebuild(chunk: int = 50_000) -> Dict[str, int]:
+    """Кластеры для всех назначений памяти (purpose_dict), порциями."""
+    from .memory import mem_init, _connect as _mem_connect
+    mem_init()
+    src = _mem_connect()
+    try:
+        last = 0
+        while True:
+            rows = src.execute("SELECT purpose_id, text FROM purpose_dict WHERE purpose_id > ? "
+                               "ORDER BY purpose_id LIMIT ?", (last, chunk)).fetchall()
+            if not rows:
+                break
+            with span("purpose_lsh", rows=len(rows), merge=True):
+                assign_clusters(t for _, t in rows)
+            last = rows[-1][0]
+    finally:
+        src.close()
+    return stats()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Кластеры назначений платежа (MinHash/LSH)")
+    ap.add_argument("--rebuild", action="store_true", help="проиндексировать все назначения памяти")
+    ap.add_argument("--stats", action="store_true", help="размер индекса")
+    args = ap.parse_args()
+    t0 = time.time()
+    if args.rebuild:
+        print(json.dumps(rebuild(), ensure_ascii=False), f"{time.time() - t0:.1f}s")
+    else:
+        print(json.dumps(stats(), ensure_ascii=False))
@@ -0,0 +1,239 @@
+# src/agent_lc/retention.py
+"""
+Обслуживание памяти агента: retention / архив / компакция.
+
+  - старые tx + decisions (старше горизонта) уезжают в сжатые помесячные
+    архивы  ARCHIVE_DIR/tx_YYYY-MM.jsonl.gz  и удаляются из БД;
+  - по каждому ИНН архивный период сворачивается в agg_archive, чтобы
+    agg_counterparty (и PRIOR) продолжали учитывать всю историю;
+  - llm_log, учёт вызовов (llm_usage) и журнал прогонов (runs / run_journal)
+    чистятся по своему горизонту;
+  - кэш объяснений LLM (purpose_lsh.py) и кэш ml_metric (ml_cache) — по горизонту памяти;
+  - в конце — инкрементальный VACUUM.
+
+Запуск (пока пайплайн простаивает):
+    python -m src.agent_lc.retention --days 365 --llm-log-days 90
+"""
+import argparse, calendar, gzip, json, os, time
+from typing import Dict, Any, Optional
+
+from .config import RETENTION_DAYS, LLM_LOG_RETENTION_DAYS, ARCHIVE_DIR
+from .memory import mem_init, _connect, _recalc_for_inn, epoch_to_str, decay_merge, \
+    _archive_hist, _hist_add, _hist_quantiles
+from .purpose_lsh import prune_explanations
+
+
+def _cutoff(days: int, now_ts: float = None) -> int:
+    now_ts = time.time() if now_ts is None else now_ts
+    return int(now_ts - days * 86400)
+
+
+def _month_bounds(month: str):
+    """'YYYY-MM' → [начало месяца, начало следующего) в epoch (UTC)."""
+    y, m = map(int, month.split("-"))
+    lo = calendar.timegm((y, m, 1, 0, 0, 0))
+    hi = calendar.timegm((y + m // 12, m % 12 + 1, 1, 0, 0, 0))
+    return lo, hi
+
+
+def _merge_archive_row(cur, inn: int, add: Dict[str, Any], archived_until: int):
+    """Складываем сводку нового архивного куска с уже имеющейся в agg_archive."""
+    cur.execute("""
+        SELECT cnt_total, cnt_suspicious, amt_total, amt_suspicious, llm_flags_total,
+               last_seen_ts, p50, p75, p90, p95, d_cnt, d_susp, d_amt, decay_ts, amt_hist,
+               archived_until
+          FROM agg_archive WHERE inn=?""", (inn,))
+    old = cur.fetchone()
+    # граница архива ИНН не сдвигается назад (прогон с горизонтом длиннее прежнего)
+    archived_until = max(archived_until, old[15] or 0) if old else archived_until
+    # затухающие счётчики куска складываются с архивными с досчётом до более позднего момента
+    decay = decay_merge(tuple(old[10:14]), add["decay"]) if old and old[13] is not None else add["decay"]
+
+    # гистограммы сумм складываются точно; квантили — из суммарной
+    hist = _archive_hist(old[14], old[0], old[6:10]) if old else {}
+    hist = _hist_add(hist, add["amounts"])
+    q = _hist_quantiles(hist)
+    if old:
+        last_seen = max([x for x in (old[5], add["last_seen_ts"]) if x], default=None)
+        vals = (int(old[0] or 0) + add["cnt_total"], int(old[1] or 0) + add["cnt_suspicious"],
+                float(old[2] or 0.0) + add["amt_total"], float(old[3] or 0.0) + add["amt_suspicious"],
+                int(old[4] or 0) + add["llm_flags_total"], last_seen, *q)
+    else:
+        vals = (add["cnt_total"], add["cnt_suspicious"], add["amt_total"], add["amt_suspicious"],
+                add["llm_flags_total"], add["last_seen_ts"], *q)
+
+    cur.execute("""
+        INSERT OR REPLACE INTO agg_archive
+            (inn, cnt_total, cnt_suspicious, amt_total, amt_suspicious, llm_flags_total,
+             last_seen_ts, p50, p75, p90, p95, archived_until, d_cnt, d_susp, d_amt, decay_ts, amt_hist)
+        VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)""",
+                (inn, *vals, archived_until, *decay, json.dumps(hist, separators=(",", ":"))))
+
+
+def _archive_month(con, month: str, cutoff: int) -> Dict[str, Any]:
+    """Один месяц = одна транзакция БД: файл → сводка → удаление."""
+    lo, hi = _month_bounds(month)
+    cur = con.cursor()
+    cur.execute("BEGIN IMMEDIATE")
+    cur.execute("""
+        SELECT t.tx_id, t.ts, t.debit_inn, t.credit_inn, t.amount, p.text AS purpose,
+               d.p_ml, d.p_prior, d.p_llm, d.p_final, d.label_pred, d.is_suspicious,
+               d.rule_hits, d.reasons_llm, d.inserted_at, d.version
+          FROM tx t
+          LEFT JOIN decisions d ON d.tx_id = t.tx_id
+          LEFT JOIN purpose_dict p ON p.purpose_id = t.purpose_id
+         WHERE t.ts >= ? AND t.ts < ?""", (lo, min(hi, cutoff)))
+    cols = [c[0] for c in cur.description]
+    rows = [dict(zip(cols, r)) for r in cur.fetchall()]
+    if not rows:
+        con.rollback()
+        return {"month": month, "rows": 0, "inns": set()}
+
+    # 1) файл (дописываем gzip-member — валидно для gzip/zcat); fsync до удаления из БД
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    path = os.path.join(ARCHIVE_DIR, f"tx_{month}.jsonl.gz")
+    with open(path, "ab") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="ab") as gz:
+            for r in rows:
+                rec = {**r, "ts_iso": epoch_to_str(r["ts"]), "inserted_at_iso": epoch_to_str(r["inserted_at"])}
+                gz.write((json.dumps(rec, ensure_ascii=False) + "\n").encode("utf-8"))
+        raw.flush()
+        os.fsync(raw.fileno())
+
+    # 2) сводка по ИНН за архивный кусок
+    per_inn: Dict[str, Dict[str, Any]] = {}
+    for r in rows:
+        amt = float(r["amount"] or 0.0)
+        is_susp = int(bool(r["is_suspicious"]))
+        try:
+            llm_flag = int(float(r["p_llm"] or 0.0) >= 0.99)
+        except Exception:
+            llm_flag = 0
+        for inn in {r["debit_inn"], r["credit_inn"]}:   # свой-себе платёж считаем один раз
+            if not inn:
+                continue
+            a = per_inn.setdefault(inn, dict(cnt_total=0, cnt_suspicious=0, amt_total=0.0,
+                                             amt_suspicious=0.0, llm_flags_total=0,
+                                             last_seen_ts=None, amounts=[], decay=(0.0, 0.0, 0.0, None)))
+            a["cnt_total"] += 1
+            a["amt_total"] += amt
+            a["cnt_suspicious"] += is_susp
+            a["amt_suspicious"] += amt if is_susp else 0.0
+            a["llm_flags_total"] += llm_flag
+            a["amounts"].append(amt)
+            if r["ts"] and (a["last_seen_ts"] is None or r["ts"] > a["last_seen_ts"]):
+                a["last_seen_ts"] = r["ts"]
+            if r["ts"] and r["ts"] > 0:
+                a["decay"] = decay_merge(a["decay"], (1.0, float(is_susp), amt, r["ts"]))
+    for inn, add in per_inn.items():
+        _merge_archive_row(cur, inn, add, cutoff)
+
+    # 3) удаление из «горячих» таблиц
+    ids = [(r["tx_id"],) for r in rows]
+    party = [(r[f"{role}_inn"], r["ts"] or 0, r["tx_id"], role[0].upper())
+             for r in rows for role in ("debit", "credit") if r[f"{role}_inn"]]
+    cur.executemany("DELETE FROM tx_party WHERE inn=? AND ts=? AND tx_id=? AND role=?", party)
+    cur.executemany("DELETE FROM decisions WHERE tx_id=?", ids)
+    cur.executemany("DELETE FROM tx WHERE tx_id=?", ids)
+
+    # 4) агрегаты: итоги не меняются (архив + live), но квантили/last_seen — могут
+    for inn in per_inn:
+        _recalc_for_inn(cur, inn)
+
+    con.commit()
+    return {"month": month, "rows": len(rows), "inns": set(per_inn), "file": path}
+
+
+def mem_retention_run(horizon_days: Optional[int] = None,
+                      llm_log_days: Optional[int] = None,
+                      vacuum_pages: int = 2000,
+                      dry_run: bool = False) -> Dict[str, Any]:
+    """
+    Обслуживание памяти. Каждый месяц архивируется отдельной короткой транзакцией,
+    поэтому читатели (WAL) не блокируются, а параллельный писатель просто подождёт.
+    """
+    horizon_days = RETENTION_DAYS if horizon_days is None else int(horizon_days)
+    llm_log_days = LLM_LOG_RETENTION_DAYS if llm_log_days is None else int(llm_log_days)
+    mem_init()
+
+    cutoff = _cutoff(horizon_days)
+    cutoff_llm = _cutoff(llm_log_days)
+    con = _connect()
+    con.isolation_level = None  # транзакции управляем сами (BEGIN IMMEDIATE)
+    cur = con.cursor()
+
+    # ts=NULL/0 (дата не распознана) не архивируем — у таких строк нет «возраста»
+    months = [m for (m,) in cur.execute("""
+        SELECT DISTINCT strftime('%Y-%m', ts, 'unixepoch') FROM tx
+         WHERE ts > 0 AND ts < ?
+         ORDER BY 1""", (cutoff,)).fetchall()]
+
+    stats = {"cutoff": epoch_to_str(cutoff), "months": months, "tx_archived": 0, "inns_touched": 0,
+             "llm_log_pruned": 0, "files": []}
+    if dry_run:
+        stats["tx_archived"] = cur.execute(
+            "SELECT COUNT(*) FROM tx WHERE ts > 0 AND ts < ?",
+            (cutoff,)).fetchone()[0]
+        stats["llm_log_pruned"] = cur.execute(
+            "SELECT COUNT(*) FROM llm_log WHERE ts < ?", (cutoff_llm,)).fetchone()[0]
+        stats["runs_pruned"] = cur.execute(
+            "SELECT COUNT(*) FROM runs WHERE started_at < ?", (cutoff_llm,)).fetchone()[0]
+        con.close()
+        return stats
+
+    touched = set()
+    for month in months:
+        r = _archive_month(con, month, cutoff)
+        stats["tx_archived"] += r["rows"]
+        touched |= r["inns"]
+        if r.get("file") and r["file"] not in stats["files"]:
+            stats["files"].append(r["file"])
+    stats["inns_touched"] = len(touched)
+
+    # llm_log: сырые промпты/ответы дублируются в logs/*.jsonl — в БД держим недавние
+    cur.execute("BEGIN IMMEDIATE")
+    cur.execute("DELETE FROM llm_log WHERE ts < ?", (cutoff_llm,))
+    stats["llm_log_pruned"] = cur.rowcount
+    # журнал прогонов нужен только для --resume недавних прогонов
+    cur.execute("""DELETE FROM run_journal
+                    WHERE run_id IN (SELECT run_id FROM runs WHERE started_at < ?)""", (cutoff_llm,))
+    cur.execute("DELETE FROM runs WHERE started_at < ?", (cutoff_llm,))
+    stats["runs_pruned"] = cur.rowcount
+    cur.execute("DELETE FROM llm_usage WHERE ts < ?", (cutoff_llm,))
+    stats["llm_usage_pruned"] = cur.rowcount
+    # назначения, на которые больше не ссылается ни одна tx
+    cur.execute("""DELETE FROM purpose_dict
+                    WHERE purpose_id NOT IN (SELECT purpose_id FROM tx WHERE purpose_id IS NOT NULL)""")
+    stats["purposes_pruned"] = cur.rowcount
+    # ml_metric, посчитанные давно (в т.ч. прежними файлами модели)
+    cur.execute("DELETE FROM ml_cache WHERE ts < ?", (cutoff,))
+    stats["ml_cache_pruned"] = cur.rowcount
+    con.commit()
+    stats["explanations_pruned"] = prune_explanations(cutoff)
+
+    # компакция: БД, созданные до auto_vacuum=INCREMENTAL, один раз переводим полным VACUUM
+    if cur.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        cur.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        cur.execute("VACUUM")
+        stats["vacuum"] = "full"
+    else:
+        free_before = cur.execute("PRAGMA freelist_count").fetchone()[0]
+        cur.execute(f"PRAGMA incremental_vacuum({int(vacuum_pages)})").fetchall()
+        free_after = cur.execute("PRAGMA freelist_count").fetchone()[0]
+        stats["vacuum"] = f"incremental: {free_before - free_after} pages"
+    con.close()
+    return stats
+
+
+def main():
+    p = argparse.ArgumentParser(description="Retention/архив/компакция памяти агента")
+    p.add_argument("--days", type=int, default=RETENTION_DAYS, help="горизонт хранения tx/decisions, дней")
+    p.add_argument("--llm-log-days", type=int, default=LLM_LOG_RETENTION_DAYS, help="горизонт llm_log, дней")
+    p.add_argument("--vacuum-pages", type=int, default=2000, help="страниц за один incremental_vacuum")
+    p.add_argument("--dry-run", action="store_true", help="только посчитать, ничего не трогать")
+    args = p.parse_args()
+    print(mem_retention_run(args.days, args.llm_log_days, args.vacuum_pages, args.dry_run))
+
+
+if __name__ == "__main__":
+    main()
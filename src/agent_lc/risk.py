@@ -13,16 +13,25 @@ def compute_prior(hist: Dict[str, Any], row: Dict[str, Any]):
     PRIOR из памяти: сигмоида поверх истории.
 
     Используем:
-      - susp_rate / cnt_susp   — как и раньше
+      - susp_rate / cnt_susp   — как и раньше; если в hist есть затухающие счётчики (PRIOR_DECAY,
+                                 *_susp_rate_decayed / *_cnt_suspicious_decayed) — по ним:
+                                 давние подозрительные операции весят меньше свежих
       - recency                — давность активности
       - amount_outlier         — крупность относительно p95
       - (опц.) llm_soft_rate   — мягкий вклад от LLM-красных, если такие счётчики есть в памяти
                                  (если колонок ещё нет — вклад = 0, код НЕ ломается)
+      - (опц.) network_risk    — подозрительность соседей по графу платежей (network.py)
     """
     def sigmoid(x): return 1/(1+math.exp(-x))
 
-    susp_rate = max(hist.get("debit_susp_rate", 0.0), hist.get("credit_susp_rate", 0.0))
-    cnt_susp  = max(hist.get("debit_cnt_suspicious", 0.0), hist.get("credit_cnt_suspicious", 0.0))
+    if "debit_susp_rate_decayed" in hist or "credit_susp_rate_decayed" in hist:
+        susp_rate = max(float(hist.get("debit_susp_rate_decayed") or 0.0),
+                        float(hist.get("credit_susp_rate_decayed") or 0.0))
+        cnt_susp  = max(float(hist.get("debit_cnt_suspicious_decayed") or 0.0),
+                        float(hist.get("credit_cnt_suspicious_decayed") or 0.0))
+    else:
+        susp_rate = max(hist.get("debit_susp_rate", 0.0), hist.get("credit_susp_rate", 0.0))
+        cnt_susp  = max(hist.get("debit_cnt_suspicious", 0.0), hist.get("credit_cnt_suspicious", 0.0))
     last_days = min(hist.get("debit_last_seen_days", 1e6), hist.get("credit_last_seen_days", 1e6))
     recency   = max(0.0, 30.0 - float(last_days)) / 30.0
 
@@ -32,6 +41,10 @@ def compute_prior(hist: Dict[str, Any], row: Dict[str, Any]):
     llm_soft   = max(llm_soft_d, llm_soft_c)
     llm_soft_rate = min(1.0, llm_soft / 5.0)  # каждые ~5 красных LLM → до +1.0 (очень мягко)
 
+    # риск соседей на 1–2 шага по графу (0..1; нет в памяти — 0)
+    network_risk = max(float(hist.get("debit_network_risk", 0.0) or 0.0),
+                       float(hist.get("credit_network_risk", 0.0) or 0.0))
+
     # крупность относительно p95
     amt  = float(row.get("amount") or 0.0)
     p95d = hist.get("debit_p95"); p95c = hist.get("credit_p95")
@@ -44,7 +57,8 @@ def compute_prior(hist: Dict[str, Any], row: Dict[str, Any]):
             continue
 
     # логистическая регрессия «на глаз» (как была), с мягким добавлением llm_soft_rate
-    z = 3.0 * susp_rate + 0.8 * math.log1p(cnt_susp) + 1.2 * recency + 0.4 * llm_soft_rate + 0.7 * amount_outlier - 1.5
+    z = 3.0 * susp_rate + 0.8 * math.log1p(cnt_susp) + 1.2 * recency + 0.4 * llm_soft_rate + 0.7 * amount_outlier \
+        + 2.0 * network_risk - 1.5
     p_prior = sigmoid(z)
 
     return p_prior, dict(
@@ -53,6 +67,7 @@ def compute_prior(hist: Dict[str, Any], row: Dict[str, Any]):
         recency=recency,
         amount_outlier=amount_outlier,
         llm_soft_rate=llm_soft_rate,
+        network_risk=network_risk,
         z=z
     )
 
@@ -0,0 +1,243 @@
+# src/agent_lc/sampler.py
+"""
+Выборка строк из выписки за один проход, без загрузки файла в pandas.
+
+    python -m src.agent_lc.sampler data/real_data.csv data/sample_transactions.csv -n 50
+    python -m src.agent_lc.sampler big.csv sample.csv --strata debit_inn --per-stratum 3 -n 500
+    python -m src.agent_lc.sampler big.csv sample.csv --inn-histories -n 20000
+
+Файл читается модулем csv построчно: текст полей не меняется (ведущие нули
+ИНН и счетов, формат дат и сумм), кодировка и разделитель — как их перебирает
+pipeline._read_csv_robust (или --encoding / --sep). Результат — UTF-8 через
+запятую, строки в порядке исходного файла. Одинаковые файл и --seed — та же
+выборка.
+
+Режимы:
+  * по умолчанию — равномерная выборка n строк (reservoir sampling): в
+    памяти только n строк;
+  * --strata debit_inn|credit_inn|pair|month|day — до --per-stratum строк
+    из каждой страты (свой резервуар у каждой), -n — общий предел: строки
+    набираются по кругу из страт в случайном порядке, чтобы покрыть как
+    можно больше страт. Память — страты × per-stratum;
+  * --inn-histories — выбираются ИНН, а не строки: в выборку попадают ВСЕ
+    операции выбранных ИНН (в любой роли), чтобы частотные окна, цепочки и
+    профили сумм в памяти агента были как на полной выписке. ИНН выбирается,
+    если его хеш (с --seed) ниже порога; порог опускается по ходу чтения,
+    пока буфер не уложится в n строк (bottom-k по хешу). Память — O(n).
+    Строки без ИНН в этот режим не попадают.
+"""
+import argparse, csv, hashlib, heapq, random, sys, time
+from functools import lru_cache
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from .memory import canon_inn, to_epoch
+
+_ENCODINGS = ("utf-8-sig", "cp1251", "latin1")     # utf-8-sig читает и utf-8 без BOM
+_SEPARATORS = (",", ";", "\t", "|")
+_PROBE = 1 << 20                                    # байт для определения кодировки/разделителя
+_STRATA = ("debit_inn", "credit_inn", "pair", "month", "day")
+
+csv.field_size_limit(sys.maxsize)
+
+
+# ─────────────────────────────────────────────────────────────
+# Чтение
+# ─────────────────────────────────────────────────────────────
+def _detect(path: str, encoding: Optional[str], sep: Optional[str]) -> Tuple[str, str]:
+    with open(path, "rb") as f:
+        head = f.read(_PROBE)
+    if encoding is None:
+        for enc in _ENCODINGS:
+            try:
+                head.decode(enc)
+            except UnicodeDecodeError as e:
+                if e.start < len(head) - 4:       # не оборванный на границе пробы символ
+                    continue
+            encoding = enc
+            break
+    if sep is None:
+        first = head.decode(encoding, errors="replace").splitlines()[0] if head else ""
+        sep = max(_SEPARATORS, key=lambda s: len(next(csv.reader([first], delimiter=s), [])))
+    return encoding, sep
+
+
+def _rows(path: str, encoding: str, sep: str) -> Tuple[List[str], Iterator[List[str]]]:
+    f = open(path, newline="", encoding=encoding, errors="replace")
+    reader = csv.reader(f, delimiter=sep)
+    header = next(reader, None)
+    if header is None:
+        f.close()
+        raise SystemExit(f"{path}: пустой файл")
+
+    def it():
+        with f:
+            yield from reader
+    return header, it()
+
+
+def _column(header: List[str], name: str) -> int:
+    if name not in header:
+        raise SystemExit(f"нет колонки {name!r} (есть: {', '.join(header)})")
+    return header.index(name)
+
+
+# ─────────────────────────────────────────────────────────────
+# Ключи страт
+# ─────────────────────────────────────────────────────────────
+@lru_cache(maxsize=100_000)
+def _period(value: str, unit: str) -> str:
+    e = to_epoch(value) if value else None          # разбор дат — как у памяти агента
+    if e is None:
+        return ""
+    return time.strftime("%Y-%m" if unit == "month" else "%Y-%m-%d", time.gmtime(e))
+
+
+def _inn(value: str) -> str:
+    return str(canon_inn(value) or "")
+
+
+def _stratum_key(header: List[str], by: str) -> Callable[[List[str]], str]:
+    if by in ("month", "day"):
+        i = _column(header, "date") if "date" in header else _column(header, "ts")
+        return lambda r: _period(r[i] if i < len(r) else "", by)
+    d, c = _column(header, "debit_inn"), _column(header, "credit_inn")
+    if by == "debit_inn":
+        return lambda r: _inn(r[d] if d < len(r) else "")
+    if by == "credit_inn":
+        return lambda r: _inn(r[c] if c < len(r) else "")
+    return lambda r: _inn(r[d] if d < len(r) else "") + "|" + _inn(r[c] if c < len(r) else "")
+
+
+# ─────────────────────────────────────────────────────────────
+# Выборки (→ [(номер строки, строка)] в порядке файла, число прочитанных строк)
+# ─────────────────────────────────────────────────────────────
+def reservoir(rows: Iterator[List[str]], n: int, seed: int):
+    """Равномерная выборка n строк (алгоритм R)."""
+    rnd = random.Random(seed)
+    res: List[Tuple[int, List[str]]] = []
+    seen = 0
+    for seen, r in enumerate(rows, 1):
+        if len(res) < n:
+            res.append((seen, r))
+        else:
+            j = rnd.randrange(seen)
+            if j < n:
+                res[j] = (seen, r)
+    return sorted(res, key=lambda x: x[0]), seen
+
+
+def stratified(rows: Iterator[List[str]], key: Callable[[List[str]], str], per: int,
+               n: Optional[int], seed: int):
+    """До per строк из каждой страты; n — общий предел (по кругу из страт в случайном порядке)."""
+    rnd = random.Random(seed)
+    strata: Dict[str, List] = {}                    # страта → [строк в ней, резервуар]
+    seen = 0
+    for seen, r in enumerate(rows, 1):
+        st = strata.setdefault(key(r), [0, []])
+        st[0] += 1
+        if len(st[1]) < per:
+            st[1].append((seen, r))
+        else:
+            j = rnd.randrange(st[0])
+            if j < per:
+                st[1][j] = (seen, r)
+    out = [x for _, res in strata.values() for x in res]
+    if n is not None and len(out) > n:
+        pools = [res[:] for _, res in strata.values()]
+        rnd.shuffle(pools)
+        for p in pools:
+            rnd.shuffle(p)
+        out = []
+        while len(out) < n:
+            for p in pools:
+                if p and len(out) < n:
+                    out.append(p.pop())
+    return sorted(out, key=lambda x: x[0]), seen, len(strata)
+
+
+def inn_histories(rows: Iterator[List[str]], d: int, c: int, n: int, seed: int):
+    """
+    Все операции ИНН с хешем ниже порога; порог опускается, пока буфер > n строк.
+    Строка попадает в группу ИНН с меньшим хешем из двух: она в выборке, пока этот
+    (а значит, хотя бы один из её ИНН) ниже порога.
+    """
+    salt = str(seed).encode()
+
+    @lru_cache(maxsize=1_000_000)
+    def h(value: str) -> Optional[int]:
+        inn = canon_inn(value) if value else None
+        if inn is None:
+            return None
+        return int.from_bytes(hashlib.blake2b(str(inn).encode(), digest_size=8, key=salt).digest(), "big")
+
+    groups: Dict[int, List[Tuple[int, List[str]]]] = {}
+    top: List[int] = []                             # хеши групп, max-куча (через минус)
+    size, bound, seen = 0, None, 0                  # bound — порог: хеш ≥ bound не берётся
+    for seen, r in enumerate(rows, 1):
+        hs = [x for x in (h(r[d] if d < len(r) else ""), h(r[c] if c < len(r) else "")) if x is not None]
+        if not hs:
+            continue
+        k = min(hs)
+        if bound is not None and k >= bound:
+            continue
+        g = groups.get(k)
+        if g is None:
+            g = groups[k] = []
+            heapq.heappush(top, -k)
+        g.append((seen, r))
+        size += 1
+        while size > n and len(top) > 1:            # выкидываем ИНН с наибольшим хешем
+            k_max = -heapq.heappop(top)
+            size -= len(groups.pop(k_max))
+            bound = k_max
+    out = [x for g in groups.values() for x in g]
+    return sorted(out, key=lambda x: x[0]), seen, len(groups)
+
+
+# ─────────────────────────────────────────────────────────────
+# CLI
+# ─────────────────────────────────────────────────────────────
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Выборка строк выписки за один проход (постоянная память)")
+    p.add_argument("input", nargs="?", default="data/real_data.csv")
+    p.add_argument("output", nargs="?", default="data/sample_transactions.csv")
+    p.add_argument("-n", type=int, default=None, help="строк в выборке (по умолчанию 50; со --strata — без предела)")
+    p.add_argument("--seed", type=int, default=42)
+    mode = p.add_mutually_exclusive_group()
+    mode.add_argument("--strata", choices=_STRATA, help="стратифицировать по контрагенту/паре/месяцу/дню")
+    mode.add_argument("--inn-histories", action="store_true",
+                      help="брать ИНН целиком: все их операции, ~n строк всего")
+    p.add_argument("--per-stratum", type=int, default=1, help="строк из каждой страты (со --strata)")
+    p.add_argument("--encoding", default=None, help="кодировка входа (по умолчанию — определить)")
+    p.add_argument("--sep", default=None, help="разделитель входа (по умолчанию — определить)")
+    args = p.parse_args(argv)
+    n = args.n if args.n is not None or args.strata else 50
+    if (n is not None and n < 1) or args.per_stratum < 1:
+        p.error("-n и --per-stratum должны быть ≥ 1")
+
+    t0 = time.perf_counter()
+    encoding, sep = _detect(args.input, args.encoding, args.sep)
+    header, rows = _rows(args.input, encoding, sep)
+    extra = ""
+    if args.strata:
+        out, seen, k = stratified(rows, _stratum_key(header, args.strata), args.per_stratum, n, args.seed)
+        extra = f", страт {args.strata}: {k}"
+    elif args.inn_histories:
+        out, seen, k = inn_histories(rows, _column(header, "debit_inn"), _column(header, "credit_inn"),
+                                     n, args.seed)
+        extra = f", ИНН с полной историей: {k}"
+    else:
+        out, seen = reservoir(rows, n, args.seed)
+        if seen < n:
+            print(f"В файле всего {seen} строк, выбираю все.")
+
+    with open(args.output, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(header)
+        w.writerows(r for _, r in out)
+    print(f"Прочитано {seen} строк ({encoding}, {sep!r}) за {time.perf_counter() - t0:.1f}s; "
+          f"сохранено {len(out)} в {args.output}{extra}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+# src/agent_lc/scheduler.py
+"""
+LLM-пакеты по приоритету в пределах бюджета (срок по стене и/или токены).
+
+Без бюджета строки уходят в LLM в порядке выписки — при ограниченном окне
+(ночной прогон, SLA разовой проверки) это худший порядок. Здесь каждая
+строка получает приоритет ещё до LLM:
+
+  * uncertainty — насколько близок итог без LLM (ML + PRIOR + правила,
+    p_llm как в фолбэке) к границе меток 0.40 / THRESH / 0.70: LLM весит
+    W_LLM и может перевести строку через границу только вблизи неё;
+  * risk — сам итог без LLM (красные объяснить важнее зелёных);
+  * flags — число доменных флагов (транзит, аномалии, стоп-слова, память).
+
+Пакеты набираются из очереди с приоритетами (heapq), после каждого бюджет
+пересчитывается: следующий пакет не начинается, если по средней длительности/
+стоимости прошлых он не успеет или не поместится. Оставшиеся строки решаются
+без LLM (tools.assess_without_llm) со статусом skipped — в отчёте видно, что
+LLM их не смотрел, а следующий прогон той же версии отправит их заново.
+"""
+import heapq, json, time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from .config import W_LLM, THRESH, LLM_DEDUPE, PURPOSE_LSH
+from .dedupe import run_deduplicated
+from .risk import compute_prior, apply_hard_rules, mix_final
+from .storage import get_store
+from .telemetry import span
+from . import llm_usage
+
+# веса приоритета («на глаз», как и PRIOR)
+W_UNCERTAINTY = 0.5
+W_RISK        = 0.35
+W_FLAGS       = 0.15
+FLAGS_SAT     = 4          # столько флагов и больше — максимальный вклад
+P_LLM_NONE    = 0.2        # p_llm строки без LLM (как в фолбэке tools._fallback_tx)
+
+
+class LLMBudget:
+    """Бюджет LLM-этапа прогона: deadline_s — секунд от начала прогона, tokens — токенов (0/None — без предела)."""
+
+    def __init__(self, deadline_s: Optional[float] = None, tokens: Optional[int] = None):
+        self.deadline_at = time.monotonic() + float(deadline_s) if deadline_s else None
+        self.tokens = int(tokens) if tokens else None
+        self.stats: Dict[str, Any] = {}
+
+    @property
+    def active(self) -> bool:
+        return self.deadline_at is not None or self.tokens is not None
+
+    def stop_reason(self, next_rows: int, batch_wall: List[float], tokens_used: int, tokens_per_row: float):
+        """None — следующий пакет помещается; иначе причина остановки."""
+        now = time.monotonic()
+        if self.deadline_at is not None:
+            expected = float(np.mean(batch_wall)) if batch_wall else 0.0
+            if now + expected > self.deadline_at:
+                return "deadline"
+        if self.tokens is not None:
+            if tokens_used >= self.tokens or (tokens_per_row and tokens_used + tokens_per_row * next_rows > self.tokens):
+                return "tokens"
+        return None
+
+
+def priorities(df: pd.DataFrame) -> np.ndarray:
+    """Приоритет строки для LLM (больше — раньше), по признакам и истории, уже посчитанным пайплайном."""
+    from .tools import _HIST_KEEP, _hist_from_base, _flags_from_row   # tools импортирует llm → тяжёлый импорт
+    records = json.loads(df.to_json(orient="records", force_ascii=False))
+    has_hist = _HIST_KEEP.issubset(df.columns)
+    store = get_store()
+    defaults = _hist_from_base({})
+    bounds = np.array(sorted({0.40, THRESH, 0.70}))
+    reach = max(W_LLM, 1e-6)
+    out = np.empty(len(records))
+    for i, r in enumerate(records):
+        hist = _hist_from_base(r if has_hist else {**r, **store.combine_hist_for_row(r)})
+        hist = {k: (defaults[k] if v is None else v) for k, v in hist.items()}   # NaN из JSON → по умолчанию
+        p_ml = float(r.get("ml_metric") or 0.0)
+        p_prior, _ = compute_prior(hist, r)
+        hard_hit, _ = apply_hard_rules(r, hist)
+        p0, _, _ = mix_final(p_ml, p_prior, P_LLM_NONE, hard_hit)
+        uncertainty = 0.0 if hard_hit else max(0.0, 1.0 - float(np.min(np.abs(bounds - p0))) / reach)
+        n_flags = len(_flags_from_row({**r, **hist}))
+        out[i] = W_UNCERTAINTY * uncertainty + W_RISK * p0 + W_FLAGS * min(1.0, n_flags / FLAGS_SAT)
+    return out
+
+
+def run_llm_scheduled(df_scored: pd.DataFrame, llm_batch_size: int, budget: LLMBudget, verbose: bool = True,
+                      run_id: Optional[str] = None, done: Optional[Dict] = None) -> List[dict]:
+    """
+    Шаг 5 в пределах бюджета: пакеты по убыванию приоритета, остаток — без LLM (skipped).
+    Журнал прогона: пакеты «s<k>:1»; при --resume строки готовых пакетов не отправляются повторно,
+    а потраченные в прерванной попытке токены учитываются в бюджете.
+    С LLM_DEDUPE / PURPOSE_LSH в очередь встают только представители групп равнозначных строк
+    без объяснения в кэше (dedupe.py).
+    → итоговые транзакции (порядок — как отправлялись; pipeline сортирует по выписке).
+    """
+    if not (LLM_DEDUPE or PURPOSE_LSH) or not len(df_scored):
+        return _run_scheduled(df_scored, llm_batch_size, budget, verbose, run_id, done)
+    tx = run_deduplicated(df_scored, lambda reps: _run_scheduled(reps, llm_batch_size, budget, verbose,
+                                                                 run_id, done))
+    for t in tx:
+        if t.get("llm_shared_with") is not None or "llm_cached_from" in t:
+            t.setdefault("llm_status", "updated")
+    return tx
+
+
+def _run_scheduled(df_scored, llm_batch_size, budget, verbose, run_id, done) -> List[dict]:
+    from .pipeline import run_llm_batches          # pipeline импортирует этот модуль
+    from .tools import assess_without_llm
+
+    merged: List[dict] = []
+    sent = set()
+    for key, (ids, tx) in (done or {}).items():
+        if key.startswith("s"):
+            merged.extend({**t, "llm_status": "updated"} for t in tx)
+            sent.update(int(x) for x in ids)
+    k = sum(1 for key in (done or {}) if key.startswith("s"))
+
+    todo = df_scored[~df_scored["id"].astype(int).isin(sent)]
+    with span("prioritize", rows=len(todo)):
+        prio = priorities(todo) if len(todo) else np.empty(0)
+    heap = [(-p, pos) for pos, p in enumerate(prio)]
+    heapq.heapify(heap)
+
+    # токены прерванных попыток этого прогона (--resume) — тоже из бюджета
+    spent_before = sum((u["prompt_tokens"] or 0) + (u["completion_tokens"] or 0)
+                       for u in get_store().read_llm_usage(run_id)) if run_id and done else 0
+    tokens0 = llm_usage.tokens_spent(run_id) - spent_before
+    batch_wall: List[float] = []
+    rows_llm, reason = len(sent), None
+    while heap:
+        tokens_used = llm_usage.tokens_spent(run_id) - tokens0
+        reason = budget.stop_reason(min(llm_batch_size, len(heap)), batch_wall, tokens_used,
+                                    tokens_used / rows_llm if rows_llm else 0.0)
+        if reason:
+            break
+        pos = [heapq.heappop(heap)[1] for _ in range(min(llm_batch_size, len(heap)))]
+        k += 1
+        t0 = time.monotonic()
+        tx = run_llm_batches(todo.iloc[sorted(pos)], llm_batch_size, verbose=False,
+                             run_id=run_id, key_prefix=f"s{k}:", dedupe=False)
+        batch_wall.append(time.monotonic() - t0)
+        rows_llm += len(pos)
+        for t in tx:
+            t.setdefault("llm_status", "updated")      # фолбэк при сбое LLM остаётся error
+        merged.extend(tx)
+        if verbose:
+            print(f"  - пакет {k} (приоритет ≥ {-heap[0][0] if heap else 0:.2f} у следующих), "
+                  f"в LLM {rows_llm}/{len(df_scored)}, токенов {llm_usage.tokens_spent(run_id) - tokens0}")
+
+    left = todo.iloc[sorted(pos for _, pos in heap)]
+    if len(left):
+        with span("skipped", rows=len(left)):
+            merged.extend(assess_without_llm(left.to_json(orient="records", force_ascii=False),
+                                             llm_status="skipped"))
+    budget.stats = dict(rows_llm=rows_llm, rows_skipped=len(left), stopped_by=reason,
+                        tokens=llm_usage.tokens_spent(run_id) - tokens0, batches=k)
+    if verbose:
+        print(f"[scheduler] в LLM {rows_llm}, без LLM {len(left)}"
+              + (f" (остановлено: {reason})" if reason else ""))
+    return merged
@@ -0,0 +1,107 @@
+# src/agent_lc/sharding.py
+"""
+Шардированный прогон: выписка делится по хешу пары (debit_inn, credit_inn)
+между N процессами-воркерами.
+
+Что где считается:
+  * родитель — признаки всей выписки (окна, цепочки, аномалии смотрят на
+    выписку целиком и дёшевы векторно), предзагрузка в память, as-of история;
+  * воркер — свой шард: скоринг моделью, payload, LLM, смешивание с PRIOR и
+    правилами (run_llm_batches). Артефакт модели грузится один раз на процесс
+    через joblib mmap_mode="r": numpy-массивы не копируются в каждый процесс,
+    а делят страницы файла через page cache;
+  * запись решений в tx/decisions/agg_counterparty — один процесс-писатель
+    (memory.mem_decision_writer): воркеры отдают (row, decision) в очередь,
+    SQLite не дерётся за блокировку, агрегаты пересчитываются пачками.
+
+Одна пара контрагентов всегда целиком в одном шарде (её решения идут
+последовательно); шардов больше, чем воркеров — для балансировки.
+Результаты собираются обратно в исходном порядке строк.
+"""
+import multiprocessing as mp
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .config import LEAN_FRAMES
+from .history import canon_inn_array
+from .memory import mem_set_decision_sink, mem_decision_writer
+from .model import load_artifacts, predict_with_pipeline
+from .telemetry import attach, collect, span
+
+SHARDS_PER_WORKER = 4
+
+_PIPE = None     # модель в процессе-воркере (грузится в _init_worker)
+
+
+def shard_of(df: pd.DataFrame, n_shards: int) -> np.ndarray:
+    """Номер шарда строки: стабильный хеш пары ИНН (не зависит от порядка строк и запуска)."""
+    d = pd.util.hash_array(canon_inn_array(df["debit_inn"]))
+    c = pd.util.hash_array(canon_inn_array(df["credit_inn"]))
+    return ((d * np.uint64(31)) ^ c) % np.uint64(n_shards)
+
+
+def _init_worker(queue) -> None:
+    global _PIPE
+    _PIPE, _ = load_artifacts(mmap_mode="r")
+    mem_set_decision_sink(queue.put)
+
+
+def _run_shard(df_shard: pd.DataFrame, llm_batch_size: int, run_id: Optional[str],
+               done: Dict, key_prefix: str) -> Tuple[pd.Series, List[dict], List[dict]]:
+    from .pipeline import run_llm_batches   # pipeline импортирует этот модуль
+    with collect() as spans, span("shard", rows=len(df_shard), key=key_prefix, pid=os.getpid()):
+        with span("predict", rows=len(df_shard)):
+            df_scored = predict_with_pipeline(_PIPE, df_shard)
+        tx = run_llm_batches(df_scored, llm_batch_size, verbose=False,
+                             run_id=run_id, done=done, key_prefix=key_prefix)
+    return df_scored["ml_metric"], tx, spans
+
+
+def run_sharded(df: pd.DataFrame, workers: int, llm_batch_size: int = 10, verbose: bool = True,
+                run_id: Optional[str] = None, done: Optional[Dict] = None) -> Tuple[pd.DataFrame, List[dict]]:
+    """
+    Шаги 4–5 пайплайна на N процессах. → (df_scored в исходном порядке, транзакции в том же порядке).
+    Пакеты в журнале прогона — «<шардов>/<шард>:<пакет>»: при другом числе воркеров не совпадут и
+    будут пересчитаны.
+    """
+    n_shards = workers * SHARDS_PER_WORKER
+    shard = shard_of(df, n_shards)
+    ctx = mp.get_context()
+    queue = ctx.Queue()
+    writer = ctx.Process(target=mem_decision_writer, args=(queue,), name="agent-lc-writer")
+    writer.start()
+
+    ml = pd.Series(np.nan, index=df.index)
+    merged: List[dict] = []
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                                 initializer=_init_worker, initargs=(queue,)) as pool:
+            futures = []
+            for k in range(n_shards):
+                if not (shard == k).any():
+                    continue
+                prefix = f"{n_shards}/{k}:"
+                mine = {key: v for key, v in (done or {}).items() if key.startswith(prefix)}
+                futures.append(pool.submit(_run_shard, df[shard == k], llm_batch_size, run_id, mine, prefix))
+            for i, f in enumerate(as_completed(futures), 1):
+                m, tx, spans = f.result()
+                attach(spans)       # спаны воркера — в трассу родителя
+                ml.loc[m.index] = m.to_numpy()
+                merged.extend(tx)
+                if verbose:
+                    print(f"[shard] {i}/{len(futures)} готово (+{len(tx)} tx)")
+    finally:
+        queue.put(None)
+        writer.join()
+    if writer.exitcode != 0:
+        raise RuntimeError(f"Процесс записи решений завершился с кодом {writer.exitcode}")
+
+    df_scored = df if LEAN_FRAMES else df.copy()
+    df_scored["ml_metric"] = ml.to_numpy()
+    order = {int(x): i for i, x in enumerate(df_scored["id"])}
+    merged.sort(key=lambda t: order.get(int(t.get("id", -1)), len(order)))
+    return df_scored, merged
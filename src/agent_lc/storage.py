@@ -0,0 +1,421 @@
+# src/agent_lc/storage.py
+"""
+Хранилище памяти агента за одним интерфейсом (MemoryStore).
+
+Пайплайн, история, признаки, сетевой риск, логирование LLM и отчёт ходят
+в память только через get_store(); какой движок за ним — решает
+MEMORY_BACKEND:
+
+  * "sqlite" (по умолчанию) — SQLiteStore, постоянная память в DB_PATH
+    (SQL живёт в memory.py, здесь только делегирование);
+  * "memory" — InMemoryStore: хеш-таблицы + NumPy, без диска. Для разовых
+    прогонов (эксперименты, подбор порогов, CI): память живёт до конца
+    процесса и не видна другим процессам, поэтому шардированный прогон
+    с ним идёт последовательно.
+
+Семантика у движков одна (tx_id идемпотентен, решения — upsert, агрегаты
+пересчитываются из фактов, watchlisted не затирается); сравнение скорости —
+bench/storage.py.
+"""
+import abc, heapq, json, time, uuid
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from . import memory as _m
+from .config import MEMORY_BACKEND
+
+
+class MemoryStore(abc.ABC):
+    """Интерфейс памяти. shared — видна ли память другим процессам (шардированный прогон).
+
+    Методы интерфейса абстрактные: движок, где чего-то не хватает, падает
+    при создании (get_store), а не посреди прогона.
+    """
+    shared = False
+
+    @abc.abstractmethod
+    def init(self) -> None:
+        ...
+
+    # ---------- чтение ----------
+    @abc.abstractmethod
+    def read_counterparty(self, inn) -> Dict[str, Any]:
+        ...
+
+    @abc.abstractmethod
+    def read_counterparties(self, inns: Iterable) -> Dict[int, Dict[str, Any]]:
+        ...
+
+    @abc.abstractmethod
+    def read_party_history(self, inns: Iterable):
+        ...
+
+    @abc.abstractmethod
+    def read_tx_window(self, inns: Iterable, since_ts: Optional[int] = None):
+        ...
+
+    @abc.abstractmethod
+    def read_graph(self):
+        ...
+
+    @abc.abstractmethod
+    def top_counterparties(self, n: int = 200) -> List[tuple]:
+        ...
+
+    @abc.abstractmethod
+    def read_decided(self, tx_ids: Iterable, version: str) -> Dict[str, tuple]:
+        ...
+
+    # ---------- запись ----------
+    @abc.abstractmethod
+    def upsert_decision(self, row: Dict[str, Any], decision: Dict[str, Any]) -> None:
+        ...
+
+    @abc.abstractmethod
+    def bulk_preload(self, df_like) -> None:
+        ...
+
+    @abc.abstractmethod
+    def rebuild_aggregates(self, inns: Optional[Iterable] = None) -> int:
+        ...
+
+    @abc.abstractmethod
+    def write_network_risk(self, updates: Iterable) -> int:
+        ...
+
+    @abc.abstractmethod
+    def log_llm(self, endpoint: str, prompt: dict, response: dict, meta: dict = None) -> None:
+        ...
+
+    @abc.abstractmethod
+    def log_llm_usage(self, rec: Dict[str, Any]) -> None:
+        ...
+
+    @abc.abstractmethod
+    def read_llm_usage(self, run_id: str) -> List[Dict[str, Any]]:
+        ...
+
+    # ---------- кэш предсказаний модели ----------
+    @abc.abstractmethod
+    def read_ml_cache(self, model: str, keys: Iterable[tuple]) -> Dict[tuple, float]:
+        ...
+
+    @abc.abstractmethod
+    def write_ml_cache(self, model: str, rows: Iterable[tuple]) -> None:
+        ...
+
+    @abc.abstractmethod
+    def read_ml_columns(self, model: str) -> Optional[list]:
+        ...
+
+    @abc.abstractmethod
+    def write_ml_columns(self, model: str, columns: list) -> None:
+        ...
+
+    # ---------- журнал прогонов ----------
+    @abc.abstractmethod
+    def run_open(self, input_hash: str, params: Dict[str, Any], resume: bool = False):
+        ...
+
+    @abc.abstractmethod
+    def run_batch_done(self, run_id: str, batch_key: str, tx_ids, transactions) -> None:
+        ...
+
+    @abc.abstractmethod
+    def run_finish(self, run_id: str, status: str = "done") -> None:
+        ...
+
+    # ---------- общее ----------
+    def combine_hist_for_row(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        return _m.combine_hist_for_row(row, self.read_counterparty)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# SQLite: постоянная память (memory.py)
+# ─────────────────────────────────────────────────────────────────────────────
+class SQLiteStore(MemoryStore):
+    shared = True
+
+    def init(self):
+        _m.mem_init()
+
+    def read_counterparty(self, inn):
+        return _m.mem_read_counterparty(inn)
+
+    def read_counterparties(self, inns):
+        return _m.mem_read_counterparties(inns)
+
+    def read_party_history(self, inns):
+        return _m.mem_read_party_history(inns)
+
+    def read_tx_window(self, inns, since_ts=None):
+        return _m.mem_read_tx_window(inns, since_ts)
+
+    def read_graph(self):
+        return _m.mem_read_graph()
+
+    def top_counterparties(self, n=200):
+        return _m.mem_top_counterparties(n)
+
+    def read_decided(self, tx_ids, version):
+        return _m.mem_read_decided(tx_ids, version)
+
+    def upsert_decision(self, row, decision):
+        _m.mem_upsert_after_decision(row, decision)
+
+    def bulk_preload(self, df_like):
+        _m.mem_bulk_preload_statement(df_like)
+
+    def rebuild_aggregates(self, inns=None):
+        return _m.mem_rebuild_aggregates(inns)
+
+    def write_network_risk(self, updates):
+        return _m.mem_write_network_risk(updates)
+
+    def log_llm(self, endpoint, prompt, response, meta=None):
+        _m.mem_log_llm(int(time.time()), endpoint, json.dumps(prompt, ensure_ascii=False),
+                       json.dumps(response, ensure_ascii=False), json.dumps(meta or {}, ensure_ascii=False))
+
+    def log_llm_usage(self, rec):
+        _m.mem_log_llm_usage(rec)
+
+    def read_llm_usage(self, run_id):
+        return _m.mem_read_llm_usage(run_id)
+
+    def read_ml_cache(self, model, keys):
+        return _m.mem_read_ml_cache(model, keys)
+
+    def write_ml_cache(self, model, rows):
+        _m.mem_write_ml_cache(model, rows)
+
+    def read_ml_columns(self, model):
+        return _m.mem_read_ml_columns(model)
+
+    def write_ml_columns(self, model, columns):
+        _m.mem_write_ml_columns(model, columns)
+
+    def run_open(self, input_hash, params, resume=False):
+        return _m.mem_run_open(input_hash, params, resume)
+
+    def run_batch_done(self, run_id, batch_key, tx_ids, transactions):
+        _m.mem_run_batch_done(run_id, batch_key, tx_ids, transactions)
+
+    def run_finish(self, run_id, status="done"):
+        _m.mem_run_finish(run_id, status)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# In-memory: хеш-таблицы по ключам SQLite-схемы, агрегаты — NumPy по событиям ИНН
+# ─────────────────────────────────────────────────────────────────────────────
+_NO_DECAY = (0.0, 0.0, 0.0, None)
+
+
+class InMemoryStore(MemoryStore):
+    shared = False
+
+    def __init__(self):
+        self._tx: Dict[str, tuple] = {}          # tx_id → (ts, debit, credit, amount, purpose_id)
+        self._purpose: Dict[str, int] = {}       # текст → purpose_id (словарь, как purpose_dict)
+        self._party: Dict[int, Dict[str, tuple]] = {}   # inn → {tx_id: (ts, amount)} (как tx_party)
+        self._dec: Dict[str, tuple] = {}         # tx_id → значения DECISION_COLUMNS
+        self._agg: Dict[int, Dict[str, Any]] = {}       # inn → агрегаты (_AGG_KEYS)
+        self._decay: Dict[int, tuple] = {}       # inn → (d_cnt, d_susp, d_amt, decay_ts) (как триггеры v9)
+        self._edges: Dict[tuple, list] = {}      # (src, dst) → [cnt, amt]
+        self._llm_log: List[tuple] = []
+        self._llm_usage: List[Dict[str, Any]] = []
+        self._ml_cache: Dict[tuple, float] = {}  # (model, h1, h2) → ml_metric
+        self._ml_columns: Dict[str, list] = {}   # model → входные признаки
+        self._runs: Dict[str, Dict[str, Any]] = {}      # run_id → {input_hash, status, batches}
+
+    def init(self):
+        pass
+
+    # ---------- запись ----------
+    def _insert_tx(self, tx_id, ts, debit, credit, amount, purpose) -> None:
+        """INSERT OR IGNORE в tx + tx_party + graph_edge (как триггер v3) + затухающие счётчики (v9)."""
+        if tx_id in self._tx:
+            return
+        pid = self._purpose.setdefault(purpose, len(self._purpose) + 1) if purpose else None
+        self._tx[tx_id] = (ts, debit, credit, amount, pid)
+        for inn in {debit, credit}:
+            if inn:
+                self._party.setdefault(inn, {})[tx_id] = (ts or 0, amount)
+                if ts and ts > 0:
+                    self._decay[inn] = _m.decay_merge(self._decay.get(inn, _NO_DECAY), (1.0, 0.0, amount or 0.0, ts))
+        if debit and credit and debit != credit:
+            e = self._edges.setdefault((debit, credit), [0.0, 0.0])
+            e[0] += 1
+            e[1] += amount or 0.0
+
+    def upsert_decision(self, row, decision):
+        now = int(time.time())
+        tx = _m._decision_tx_values(row, now)
+        self._insert_tx(*tx)
+        old = self._dec.get(tx[0])
+        self._dec[tx[0]] = _m._decision_values(decision, now)
+        # вклад в затухающую долю подозрительных: снять прежнее решение, добавить новое
+        delta = int(self._dec[tx[0]][5]) - int(bool(old and old[5]))
+        ts = self._tx[tx[0]][0]
+        for inn in {tx[2], tx[3]}:
+            if delta and inn and ts and ts > 0:
+                d_cnt, d_susp, d_amt, at = self._decay[inn]
+                self._decay[inn] = (d_cnt, max(0.0, d_susp + delta * _m.decay_w(at - ts)), d_amt, at)
+            self._recalc(inn)
+
+    def bulk_preload(self, df_like):
+        rows = _m._statement_tx_values(df_like)
+        for r in rows:
+            self._insert_tx(*r)
+        for inn in {k for r in rows for k in (r[2], r[3]) if k}:
+            self._recalc(inn)
+
+    def rebuild_aggregates(self, inns=None):
+        keys = set(self._party) | set(self._agg) if inns is None else \
+            {k for k in (_m.canon_inn(x) for x in inns) if k}
+        for inn in keys:
+            self._recalc(inn)
+        return len(keys)
+
+    def _recalc(self, inn) -> None:
+        """Та же формула, что memory._recalc_for_inn (архива у эфемерной памяти нет)."""
+        if not inn:
+            return
+        events = self._party.get(inn, {})
+        n = len(events)
+        ts = np.fromiter((e[0] for e in events.values()), np.int64, n)
+        amt = np.fromiter((e[1] or 0.0 for e in events.values()), np.float64, n)
+        dec = [self._dec.get(t) for t in events]
+        susp = np.fromiter((bool(d and d[5]) for d in dec), bool, n)
+        flags = sum(1 for d in dec if d and d[2] >= 0.99)
+
+        last_seen = int(ts[ts != 0].max()) if (ts != 0).any() else None
+        q = np.percentile(amt, [50, 75, 90, 95]).tolist() if n else [None] * 4
+        prev = self._agg.get(inn) or _m._empty_counterparty()
+        cnt_susp = float(susp.sum())              # счётчики — REAL, как в agg_counterparty
+        self._agg[inn] = dict(
+            cnt_total=float(n), cnt_suspicious=cnt_susp, susp_rate=cnt_susp / n if n else 0.0,
+            amt_total=float(amt.sum()), amt_suspicious=float(amt[susp].sum()),
+            last_seen_ts=last_seen, watchlisted=prev["watchlisted"] or 0,
+            p50=q[0], p75=q[1], p90=q[2], p95=q[3],
+            llm_flags_total=float(flags), llm_last_seen_ts=last_seen,
+            network_risk=prev["network_risk"] or 0.0,
+            **dict(zip(("d_cnt", "d_susp", "d_amt", "decay_ts"), self._decay.get(inn, _NO_DECAY))))
+
+    def write_network_risk(self, updates):
+        n = 0
+        for inn, r in updates:
+            a = self._agg.get(int(inn))
+            if a is not None:
+                a["network_risk"] = float(r)
+                n += 1
+        return n
+
+    def log_llm(self, endpoint, prompt, response, meta=None):
+        self._llm_log.append((int(time.time()), endpoint, prompt, response, meta or {}))
+
+    def log_llm_usage(self, rec):
+        self._llm_usage.append({c: rec.get(c) for c in _m.LLM_USAGE_COLUMNS})
+
+    def read_llm_usage(self, run_id):
+        return [dict(r) for r in self._llm_usage if r["run_id"] == run_id]
+
+    def read_ml_cache(self, model, keys):
+        return {k: self._ml_cache[(model, *k)] for k in keys if (model, *k) in self._ml_cache}
+
+    def write_ml_cache(self, model, rows):
+        self._ml_cache.update(((model, int(h1), int(h2)), float(m)) for h1, h2, m in rows)
+
+    def read_ml_columns(self, model):
+        return self._ml_columns.get(model)
+
+    def write_ml_columns(self, model, columns):
+        self._ml_columns[model] = list(columns)
+
+    # журнал живёт в процессе: возобновить можно только в нём же (повтор run_pipeline)
+    def run_open(self, input_hash, params, resume=False):
+        if resume:
+            for run_id, r in reversed(list(self._runs.items())):
+                if r["input_hash"] == input_hash and r["status"] != "done":
+                    return run_id, dict(r["batches"])
+        run_id = uuid.uuid4().hex[:16]
+        self._runs[run_id] = dict(input_hash=input_hash, params=params, status="running", batches={})
+        return run_id, {}
+
+    def run_batch_done(self, run_id, batch_key, tx_ids, transactions):
+        self._runs[run_id]["batches"][batch_key] = (list(tx_ids), transactions)
+
+    def run_finish(self, run_id, status="done"):
+        self._runs[run_id]["status"] = status
+
+    # ---------- чтение ----------
+    def read_counterparty(self, inn):
+        a = self._agg.get(_m.canon_inn(inn))
+        return dict(a) if a else _m._empty_counterparty()
+
+    def read_counterparties(self, inns):
+        keys = {k for k in (_m.canon_inn(x) for x in inns) if k}
+        return {k: dict(self._agg[k]) for k in keys if k in self._agg}
+
+    def read_party_history(self, inns):
+        events = []
+        for inn in {k for k in (_m.canon_inn(x) for x in inns) if k}:
+            for tx_id, (ts, amount) in self._party.get(inn, {}).items():
+                d = self._dec.get(tx_id)
+                events.append((inn, ts, amount, d[5] if d else None, d[2] if d else None, tx_id))
+        return events, {}
+
+    def read_tx_window(self, inns, since_ts=None):
+        since = int(since_ts or 0)
+        ids = {tx_id
+               for inn in {k for k in (_m.canon_inn(x) for x in inns) if k}
+               for tx_id, (ts, _) in self._party.get(inn, {}).items() if ts >= since}
+        return [(t,) + self._tx[t][:4] for t in ids]
+
+    def read_decided(self, tx_ids, version):
+        i_ver, i_res = _m.DECISION_COLUMNS.index("version"), _m.DECISION_COLUMNS.index("result_json")
+        i_st = _m.DECISION_COLUMNS.index("llm_status")
+        out = {}
+        for t in tx_ids:
+            d = self._dec.get(str(t))
+            if d and d[i_ver] == version and d[i_res] is not None and d[i_st] in (None, "done"):
+                out[str(t)] = (d[0], json.loads(d[i_res]))
+        return out
+
+    def read_graph(self):
+        n = len(self._edges)
+        src = np.fromiter((k[0] for k in self._edges), np.int64, n)
+        dst = np.fromiter((k[1] for k in self._edges), np.int64, n)
+        cnt = np.fromiter((v[0] for v in self._edges.values()), np.float64, n)
+        amt = np.fromiter((v[1] for v in self._edges.values()), np.float64, n)
+        m = len(self._agg)
+        col = lambda key, dt: np.fromiter((a[key] or 0 for a in self._agg.values()), dt, m)
+        nodes = (np.fromiter(self._agg, np.int64, m), col("cnt_total", np.float64),
+                 col("cnt_suspicious", np.float64), col("watchlisted", np.int64), col("network_risk", np.float64))
+        return (src, dst, cnt, amt), nodes
+
+    def top_counterparties(self, n=200):
+        def rate(a):
+            return round(100.0 * a["cnt_suspicious"] / a["cnt_total"], 1) if a["cnt_total"] else 0.0
+        top = heapq.nsmallest(int(n), self._agg.items(), key=lambda kv: (-kv[1]["cnt_suspicious"], -rate(kv[1])))
+        return [(_m.inn_str(inn), a["cnt_total"], a["cnt_suspicious"], rate(a), a["amt_total"], a["amt_suspicious"],
+                 _m.epoch_to_str(a["last_seen_ts"]), a["watchlisted"], a["p50"], a["p75"], a["p90"], a["p95"],
+                 a["llm_flags_total"], _m.epoch_to_str(a["llm_last_seen_ts"]), round(a["network_risk"] or 0.0, 3))
+                for inn, a in top]
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Выбор движка (MEMORY_BACKEND), один экземпляр на процесс
+# ─────────────────────────────────────────────────────────────────────────────
+STORES = {"sqlite": SQLiteStore, "memory": InMemoryStore}
+
+_STORE: Optional[MemoryStore] = None
+
+
+def get_store() -> MemoryStore:
+    global _STORE
+    if _STORE is None:
+        if MEMORY_BACKEND not in STORES:
+            raise ValueError(f"MEMORY_BACKEND={MEMORY_BACKEND!r}: ожидается одно из {sorted(STORES)}")
+        _STORE = STORES[MEMORY_BACKEND]()
+    return _STORE
@@ -0,0 +1,154 @@
+# src/agent_lc/telemetry.py
+"""
+Телеметрия прогона: вложенные спаны по этапам run_pipeline.
+
+    with span("features", rows=len(df)):
+        ...
+
+Каждый спан пишет: wall (perf_counter), CPU процесса (process_time), rows,
+пик RSS процесса к концу спана и число SQL-выражений SQLite за время спана
+(счётчик ставит memory._connect через set_trace_callback). Спаны вкладываются
+по стеку: run → llm_batches → batch → payload_build / llm_call / json_parse /
+risk_mix → memory_write. merge=True склеивает повторы одного имени внутри
+родителя (запись в память — на каждую строку пакета) в один спан с calls.
+
+В конце прогона: JSON-трасса в TRACE_DIR/run_<id>.json, опционально —
+Prometheus textfile (METRICS_TEXTFILE, формат node_exporter textfile
+collector) и сводка по этапам в результат run_pipeline.
+
+Трасса — своя у каждого потока: LLM-фаза двухфазного прогона идёт в фоне
+и пишет отдельную трассу, не вмешиваясь в стек спанов вызывающего потока.
+"""
+import json, os, threading, time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:     # Windows
+    resource = None
+
+from .config import TRACE_DIR, METRICS_TEXTFILE
+
+_TLS = threading.local()
+_SQL = 0
+
+
+def _trace():
+    """(корневые спаны, стек открытых) текущего потока."""
+    if not hasattr(_TLS, "roots"):
+        _TLS.roots, _TLS.stack = [], []
+    return _TLS.roots, _TLS.stack
+
+
+def count_sql(_statement: str) -> None:
+    """trace-callback sqlite3: +1 на каждое выполненное выражение."""
+    global _SQL
+    _SQL += 1
+
+
+def peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1)   # Linux: KiB
+
+
+@contextmanager
+def span(name: str, rows: Optional[int] = None, merge: bool = False, **attrs):
+    """Спан этапа; rows можно дописать внутри: with span(...) as s: s["rows"] = n."""
+    roots, stack = _trace()
+    siblings = stack[-1]["children"] if stack else roots
+    rec = next((s for s in reversed(siblings) if s["name"] == name), None) if merge else None
+    if rec is None:
+        rec = {"name": name, "rows": rows, **attrs, "calls": 0,
+               "wall_s": 0.0, "cpu_s": 0.0, "sql": 0, "children": []}
+        siblings.append(rec)
+    elif rows is not None:
+        rec["rows"] = (rec["rows"] or 0) + rows
+    t0, c0, q0 = time.perf_counter(), time.process_time(), _SQL
+    stack.append(rec)
+    try:
+        yield rec
+    finally:
+        stack.pop()
+        rec["calls"] += 1
+        rec["wall_s"] += time.perf_counter() - t0
+        rec["cpu_s"] += time.process_time() - c0
+        rec["sql"] += _SQL - q0
+        rec["rss_peak_mb"] = peak_rss_mb()
+
+
+def attach(spans: List[Dict[str, Any]]) -> None:
+    """Спаны, собранные в другом процессе (воркер шарда), — детьми текущего спана."""
+    roots, stack = _trace()
+    (stack[-1]["children"] if stack else roots).extend(spans)
+
+
+@contextmanager
+def collect():
+    """Отдельная трасса на время блока (воркер шарда): → список корневых спанов блока."""
+    saved = _trace()
+    _TLS.roots, _TLS.stack = [], []
+    try:
+        yield _TLS.roots
+    finally:
+        _TLS.roots, _TLS.stack = saved
+
+
+def reset() -> None:
+    for items in _trace():
+        items.clear()
+
+
+def stages(spans: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Dict[str, Any]]:
+    """Сводка по имени этапа (все уровни, повторы суммируются; wall включает вложенные спаны)."""
+    out: Dict[str, Dict[str, Any]] = {}
+
+    def walk(items):
+        for s in items:
+            a = out.setdefault(s["name"], dict(calls=0, wall_s=0.0, cpu_s=0.0, rows=0, sql=0))
+            a["calls"] += s["calls"]
+            a["wall_s"] += s["wall_s"]
+            a["cpu_s"] += s["cpu_s"]
+            a["rows"] += s["rows"] or 0
+            a["sql"] += s["sql"]
+            walk(s["children"])
+    walk(_trace()[0] if spans is None else spans)
+    return {k: {**v, "wall_s": round(v["wall_s"], 3), "cpu_s": round(v["cpu_s"], 3)} for k, v in out.items()}
+
+
+def write_trace(run_id: str) -> Dict[str, Any]:
+    """JSON-трасса + (если задан METRICS_TEXTFILE) Prometheus textfile. → сводка для run_pipeline."""
+    summary = stages()
+    os.makedirs(TRACE_DIR, exist_ok=True)
+    path = os.path.join(TRACE_DIR, f"run_{run_id}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"run_id": run_id, "finished_at": int(time.time()), "rss_peak_mb": peak_rss_mb(),
+                   "stages": summary, "spans": _trace()[0]}, f, ensure_ascii=False, indent=1, default=str)
+    if METRICS_TEXTFILE:
+        _write_prometheus(METRICS_TEXTFILE, summary)
+    return {"trace": path, "rss_peak_mb": peak_rss_mb(), "stages": summary}
+
+
+def _write_prometheus(path: str, summary: Dict[str, Dict[str, Any]]) -> None:
+    metrics = [("agent_lc_stage_wall_seconds", "wall_s", "Wall time of pipeline stage, last run"),
+               ("agent_lc_stage_cpu_seconds", "cpu_s", "CPU time of pipeline stage, last run"),
+               ("agent_lc_stage_rows", "rows", "Rows processed by pipeline stage, last run"),
+               ("agent_lc_stage_sql_queries", "sql", "SQLite statements executed by stage, last run"),
+               ("agent_lc_stage_calls", "calls", "Span count of pipeline stage, last run")]
+    lines = []
+    for metric, key, help_ in metrics:
+        lines += [f"# HELP {metric} {help_}", f"# TYPE {metric} gauge"]
+        lines += [f'{metric}{{stage="{name}"}} {v[key]}' for name, v in sorted(summary.items())]
+    rss = peak_rss_mb()
+    if rss is not None:
+        lines += ["# HELP agent_lc_peak_rss_bytes Peak RSS of the pipeline process",
+                  "# TYPE agent_lc_peak_rss_bytes gauge", f"agent_lc_peak_rss_bytes {int(rss * 2**20)}"]
+    lines += ["# HELP agent_lc_last_run_timestamp_seconds Finish time of the last run",
+              "# TYPE agent_lc_last_run_timestamp_seconds gauge",
+              f"agent_lc_last_run_timestamp_seconds {int(time.time())}"]
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:     # textfile collector читает только целый файл
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp, path)
@@ -3,12 +3,41 @@ import json
 from io import StringIO
 import pandas as pd
 import numpy as np
-from langchain.tools import tool
 from typing import Dict, Any, List
 
-from .memory import combine_hist_for_row, mem_upsert_after_decision
+from .memory import canon_inn, inn_str, DECAY_HIST_KEYS
+from .storage import get_store
+from .identity import decision_version
+from .telemetry import span
 from .risk import compute_prior, apply_hard_rules, label_to_prob, mix_final, llm_hint_floor
-from .llm import call_llm
+from .config import LLM_STREAM, PRIOR_DECAY
+
+
+# ─────────────────────────────
+# Ленивый стек LLM: langchain, langchain_gigachat, requests импортируются при первом вызове,
+# а не при импорте pipeline (cli.py --help, прогоны без LLM — без них)
+# ─────────────────────────────
+def call_llm(rows, *args, **kwargs):
+    from .llm import call_llm as _call
+    return _call(rows, *args, **kwargs)
+
+
+def call_llm_stream(rows, *args, **kwargs):
+    from .llm import call_llm_stream as _stream
+    return _stream(rows, *args, **kwargs)
+
+
+_TOOLS = {"build_llm_payload_tool": "build_llm_payload", "llm_assess_risk_tool": "llm_assess_risk"}
+
+
+def __getattr__(name: str):
+    """build_llm_payload_tool / llm_assess_risk_tool — langchain-инструменты, создаются при первом обращении."""
+    if name not in _TOOLS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    from langchain.tools import tool
+    fn = _TOOLS[name]
+    obj = globals()[name] = tool(fn, return_direct=True)(globals()[fn])
+    return obj
 
 
 # ─────────────────────────────
@@ -227,10 +256,23 @@ def _round2(x):
 # ─────────────────────────────
 # TOOL: сбор payload для LLM (с памятью)
 # ─────────────────────────────
-@tool("build_llm_payload", return_direct=True)
-def build_llm_payload_tool(df_json: str) -> str:
+_HIST_KEEP = {
+    "debit_susp_rate","debit_cnt_suspicious","debit_last_seen_days","debit_watchlisted","debit_p95",
+    "credit_susp_rate","credit_cnt_suspicious","credit_last_seen_days","credit_watchlisted","credit_p95",
+    "debit_network_risk","credit_network_risk"
+}
+# затухающая история (PRIOR_DECAY) — только для compute_prior, в промпт не идёт
+_DECAY_KEYS = {f"{role}_{k}" for role in ("debit", "credit") for k in DECAY_HIST_KEYS} if PRIOR_DECAY else set()
+_HIST_KEEP |= _DECAY_KEYS
+
+def build_llm_payload(df_json: str) -> str:
     """Вход: JSON df (records). Выход: обогащённые строки для LLM (с памятью)."""
-    df = pd.read_json(StringIO(df_json), orient="records")
+    with span("payload_build"):
+        return _build_payload(df_json)
+
+
+def _build_payload(df_json: str) -> str:
+    df = pd.read_json(StringIO(df_json), orient="records", dtype={"tx_id": str})
     df = df.reset_index(drop=True)
 
     rows: List[Dict[str, Any]] = []
@@ -252,8 +294,8 @@ def build_llm_payload_tool(df_json: str) -> str:
             "debit_amount": _round2(r.get("debit_amount")),
             "credit_amount": _round2(r.get("credit_amount")),
             "amount": _round2(r.get("amount")),
-            "debit_inn": "" if pd.isna(r.get("debit_inn")) else str(r.get("debit_inn")),
-            "credit_inn": "" if pd.isna(r.get("credit_inn")) else str(r.get("credit_inn")),
+            "debit_inn": inn_str(canon_inn(r.get("debit_inn"))),
+            "credit_inn": inn_str(canon_inn(r.get("credit_inn"))),
             "chain_match": None if pd.isna(r.get("chain_id")) else str(r.get("chain_id")),
             "chain_length": _to_int_or_none(r.get("chain_length")),
             "chain_duration_hours": _round2(r.get("chain_duration_hours")),
@@ -261,14 +303,14 @@ def build_llm_payload_tool(df_json: str) -> str:
             "ts": (_to_iso(r.get("ts") or r.get("date")) or "")[:19],
         }
 
-        # 🔶 ПАМЯТЬ: подмешиваем историю контрагентов (SQLite)
-        hist = combine_hist_for_row(row)
+        # 🔶 ПАМЯТЬ: подмешиваем историю контрагентов (storage.py);
+        # если пайплайн уже посчитал as-of историю (history.py) — берём её из строки
+        if _HIST_KEEP.issubset(r.index):
+            hist = {k: (None if pd.isna(r.get(k)) else r.get(k)) for k in _HIST_KEEP}
+        else:
+            hist = get_store().combine_hist_for_row(row)
         # оставляем только нужные поля, округляем
-        keep = {
-            "debit_susp_rate","debit_cnt_suspicious","debit_last_seen_days","debit_watchlisted","debit_p95",
-            "credit_susp_rate","credit_cnt_suspicious","credit_last_seen_days","credit_watchlisted","credit_p95"
-        }
-        hist = {k: _round2(v) if isinstance(v,(int,float)) else v for k,v in hist.items() if k in keep}
+        hist = {k: _round2(v) if isinstance(v,(int,float)) else v for k,v in hist.items() if k in _HIST_KEEP}
 
         # если есть причины от ML — шлём, но не засоряем пустым
         ml_reasons = r.get("ml_top_reasons", [])
@@ -277,6 +319,8 @@ def build_llm_payload_tool(df_json: str) -> str:
 
         # финальный jsonable row
         row = {**{k: _to_jsonable(v) for k, v in row.items()}, **{k: _to_jsonable(v) for k, v in hist.items()}}
+        if pd.notna(r.get("tx_id")):
+            row["tx_id"] = str(r.get("tx_id"))     # ключ памяти (identity.py); в LLM не уходит
         rows.append(row)
 
     return json.dumps({"transactions": rows, "input_len": len(rows)}, ensure_ascii=False)
@@ -285,64 +329,199 @@ def build_llm_payload_tool(df_json: str) -> str:
 # ─────────────────────────────
 # TOOL: вызов LLM + смешивание с ML/Prior/Rules + лог в память
 # ─────────────────────────────
-@tool("llm_assess_risk", return_direct=True)
-def llm_assess_risk_tool(enriched_rows_json: str) -> str:
+_LOCAL_KEYS = {"tx_id"} | _DECAY_KEYS     # поля payload только для памяти и PRIOR — в промпт не отправляем
+
+
+def _decision_row(base: Dict[str, Any], rid) -> Dict[str, Any]:
+    return dict(id=rid, tx_id=base.get("tx_id"), ts=base.get("ts"),
+                debit_inn=base.get("debit_inn"), credit_inn=base.get("credit_inn"),
+                amount=base.get("amount"), purpose=base.get("purpose"))
+
+
+def _hist_from_base(base: Dict[str, Any]) -> Dict[str, Any]:
+    hist = {
+        "debit_cnt_suspicious": base.get("debit_cnt_suspicious", 0.0),
+        "debit_susp_rate": base.get("debit_susp_rate", 0.0),
+        "debit_last_seen_days": base.get("debit_last_seen_days", 1e6),
+        "debit_watchlisted": base.get("debit_watchlisted", 0),
+        "debit_p95": base.get("debit_p95"),
+        "credit_cnt_suspicious": base.get("credit_cnt_suspicious", 0.0),
+        "credit_susp_rate": base.get("credit_susp_rate", 0.0),
+        "credit_last_seen_days": base.get("credit_last_seen_days", 1e6),
+        "credit_watchlisted": base.get("credit_watchlisted", 0),
+        "credit_p95": base.get("credit_p95"),
+        "debit_network_risk": base.get("debit_network_risk", 0.0),
+        "credit_network_risk": base.get("credit_network_risk", 0.0),
+    }
+    hist.update({k: base.get(k, 0.0) for k in _DECAY_KEYS})
+    return hist
+
+
+def _fallback_tx(base: Dict[str, Any], version: str, llm_status: str = "error") -> Dict[str, Any]:
+    """
+    Строка без ответа LLM: ML + prior + правила, p_llm консервативно «зелёный»; + запись в память.
+    llm_status: error — сбой LLM; pending / skipped — решение без LLM по выбору пайплайна
+    (assess_without_llm). Окончательным ("done") такое решение не бывает: следующий прогон
+    или --resume снова отправит строку в LLM.
+    """
+    p_ml = float(base.get("ml_metric", 0.0) or 0.0)
+    hist = _hist_from_base(base)
+    with span("risk_mix", rows=1, merge=True):
+        p_prior, _ = compute_prior(hist, base)
+        p_llm = 0.2  # консервативно зелёный
+        hard_hit, rule_ids = apply_hard_rules(base, hist)
+        p_final, is_suspicious, label = mix_final(p_ml, p_prior, p_llm, hard_hit)
+
+    t = {
+        "id": int(base.get("id")),
+        "purpose": base.get("purpose",""),
+        "risk_label": label,
+        "risk_score": float(round(p_final, 2)),
+        "flags": [],
+        "primary_reasons": [],
+        "evidence": {}
+    }
+    # флаги/причины + evidence + тексты
+    t = _merge_flags_and_reasons(t, base)
+    ev = t.get("evidence", {})
+    ev.update({"ml_metric": p_ml, "prior": round(p_prior,3), "p_llm": round(p_llm,3), "p_final": round(p_final,3),
+               "llm_answer": False})
+    t["evidence"]=ev; t["rule_hits"]=rule_ids
+    t = _fill_missing(t)
+    if llm_status != "done":
+        t["llm_status"] = llm_status
+    out = {k: _to_jsonable(v) for k, v in t.items()}
+    # пишем в память
+    with span("memory_write", rows=1, merge=True):
+        get_store().upsert_decision(
+            _decision_row(base, int(base.get("id"))),
+            dict(p_ml=p_ml, p_prior=p_prior, p_llm=p_llm, p_final=p_final,
+                 label_pred=label, is_suspicious=is_suspicious,
+                 rule_hits=rule_ids, reasons_llm=t.get("primary_reasons", []),
+                 version=version, result=out, llm_status=llm_status)
+        )
+    return out
+
+
+def assess_without_llm(df_json: str, llm_status: str = "pending") -> List[Dict[str, Any]]:
+    """
+    Итог без LLM по ML + prior + жёстким правилам с шаблонными текстами (_fill_missing); решения —
+    в память со статусом llm_status и следующими прогонами не переиспользуются. pending — фаза 1
+    двухфазного прогона, skipped — строки, на которые не хватило бюджета LLM (scheduler.py).
+    """
+    with span("payload_build"):
+        payload = json.loads(_build_payload(df_json))
+    version = decision_version()
+    return [_fallback_tx(base, version, llm_status=llm_status) for base in payload.get("transactions", [])]
+
+
+def assess_like(df_json: str, shared: Dict[int, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Строки без собственного вызова LLM (dedupe.py): shared — id строки → итог представителя её группы
+    или объяснение из кэша (purpose_lsh.py, с llm_cached_from). Берутся p_llm, объяснение и рекомендация;
+    смесь, флаги и метка — по своей строке.
+    """
+    with span("payload_build"):
+        payload = json.loads(_build_payload(df_json))
+    version = decision_version()
+    out = []
+    for base in payload.get("transactions", []):
+        rid = _to_int_or_none(base.get("id"))
+        rep = shared[rid]
+        t = {"id": rid, "purpose": base.get("purpose", ""),
+             "risk_label": None, "risk_score": (rep.get("evidence") or {}).get("p_llm"),
+             "risk_explanation": rep.get("risk_explanation", ""), "recommendation": rep.get("recommendation", ""),
+             "flags": [], "primary_reasons": []}
+        if rep.get("id") is None:          # из кэша — строки этой выписки нет
+            t["llm_cached_from"] = rep.get("llm_cached_from")
+        else:
+            t["llm_shared_with"] = rep["id"]
+        out.append(_final_tx(t, base, rid, version))
+    return out
+
+
+def _final_tx(t: Dict[str, Any], base: Dict[str, Any], rid, version: str) -> Dict[str, Any]:
+    """Ответ LLM по строке → смесь ML/prior/LLM/правила, тексты, запись в память."""
+    p_ml = float(base.get("ml_metric", 0.0) or 0.0)
+    hist = _hist_from_base(base)
+
+    # prior / llm / правила
+    with span("risk_mix", rows=1, merge=True):
+        p_prior, _ = compute_prior(hist, base)
+        p_llm = label_to_prob(t.get("risk_label"), t.get("risk_score"))
+        hard_hit, rule_ids = apply_hard_rules(base, hist)
+
+        # 🔸 LLM-floor: если LLM «красный», не опускаем итог ниже мягкого порога
+        floor_hint = llm_hint_floor(base, p_llm)
+
+        # финальная смесь
+        p_final, is_suspicious, label = mix_final(p_ml, p_prior, p_llm, hard_hit, llm_floor=floor_hint)
+
+    # итоговые поля → чтобы _fill_missing видел финальную метку
+    t["risk_label"] = label
+    t["risk_score"] = float(round(p_final, 2))
+    t["rule_hits"] = rule_ids
+
+    # автодобавим флаги/причины
+    t = _merge_flags_and_reasons(t, base)
+
+    # evidence + компоненты
+    ev = t.get("evidence", {}) or {}
+    ev.update({
+        "ml_metric": p_ml,
+        "prior": round(p_prior, 3),
+        "p_llm": round(p_llm, 3),
+        "p_final": round(p_final, 3),
+    })
+    t["evidence"] = ev
+
+    # заполнить пустые тексты (учитывает финальную метку)
+    t = _fill_missing(t)
+
+    t = _enforce_text_consistency(t)
+
+    # json-совместимость на выходе
+    out = {k: _to_jsonable(v) for k, v in t.items()}
+
+    # 🔶 ЛОГ В ПАМЯТЬ (и идемпотентные агрегаты будут пересчитаны в хранилище);
+    # итог с подписью версии — для переиспользования в следующих прогонах
+    with span("memory_write", rows=1, merge=True):
+        get_store().upsert_decision(
+            _decision_row(base, rid),
+            dict(p_ml=p_ml, p_prior=p_prior, p_llm=p_llm, p_final=p_final,
+                 label_pred=label, is_suspicious=is_suspicious,
+                 rule_hits=rule_ids, reasons_llm=t.get("primary_reasons", []),
+                 version=version, result=out)
+        )
+    return out
+
+
+def _with_fallback(final_tx: List[Dict[str, Any]], rows_enriched: List[Dict[str, Any]],
+                   version: str) -> List[Dict[str, Any]]:
+    """Строки пакета без ответа LLM (сбой, обрыв потока, модель их пропустила) → фолбэк, llm_status=error."""
+    got = {_to_int_or_none(t.get("id")) for t in final_tx}
+    return final_tx + [_fallback_tx(base, version, llm_status="error") for base in rows_enriched
+                       if _to_int_or_none(base.get("id")) not in got]
+
+
+def llm_assess_risk(enriched_rows_json: str) -> str:
     """Вход: JSON enriched rows. Выход: финальные транзакции (ML+prior+LLM+rules) + лог в память."""
     payload = json.loads(enriched_rows_json) if isinstance(enriched_rows_json, str) else enriched_rows_json
     rows_enriched: List[Dict[str, Any]] = payload.get("transactions", [])
 
+    version = decision_version()
+    llm_rows = [{k: v for k, v in r.items() if k not in _LOCAL_KEYS} for r in rows_enriched]
+    if LLM_STREAM:
+        return _assess_streaming(rows_enriched, llm_rows, version)
+
     # 1) Вспомогательная оценка LLM + объяснения (устойчиво)
     try:
-        data = call_llm(rows_enriched)
+        with span("llm_call", rows=len(rows_enriched)):
+            data = call_llm(llm_rows)
         tx = data.get("transactions", [])
     except Exception:
         # 🔁 Fallback: если LLM оборвался/ошибка — считаем без LLM, чтобы отчёт не был пустым
-        tx = []
-        for base in rows_enriched:
-            p_ml = float(base.get("ml_metric", 0.0) or 0.0)
-            hist = {
-                "debit_cnt_suspicious": base.get("debit_cnt_suspicious", 0.0),
-                "debit_susp_rate": base.get("debit_susp_rate", 0.0),
-                "debit_last_seen_days": base.get("debit_last_seen_days", 1e6),
-                "debit_watchlisted": base.get("debit_watchlisted", 0),
-                "debit_p95": base.get("debit_p95"),
-                "credit_cnt_suspicious": base.get("credit_cnt_suspicious", 0.0),
-                "credit_susp_rate": base.get("credit_susp_rate", 0.0),
-                "credit_last_seen_days": base.get("credit_last_seen_days", 1e6),
-                "credit_watchlisted": base.get("credit_watchlisted", 0),
-                "credit_p95": base.get("credit_p95"),
-            }
-            p_prior, _ = compute_prior(hist, base)
-            p_llm = 0.2  # консервативно зелёный
-            hard_hit, rule_ids = apply_hard_rules(base, hist)
-            p_final, is_suspicious, label = mix_final(p_ml, p_prior, p_llm, hard_hit)
-
-            t = {
-                "id": int(base.get("id")),
-                "purpose": base.get("purpose",""),
-                "risk_label": label,
-                "risk_score": float(round(p_final, 2)),
-                "flags": [],
-                "primary_reasons": [],
-                "evidence": {}
-            }
-            # флаги/причины + evidence + тексты
-            t = _merge_flags_and_reasons(t, base)
-            ev = t.get("evidence", {})
-            ev.update({"ml_metric": p_ml, "prior": round(p_prior,3), "p_llm": round(p_llm,3), "p_final": round(p_final,3)})
-            t["evidence"]=ev; t["rule_hits"]=rule_ids
-            t = _fill_missing(t)
-            # пишем в память
-            mem_upsert_after_decision(
-                dict(id=int(base.get("id")), ts=base.get("ts"),
-                     debit_inn=base.get("debit_inn"), credit_inn=base.get("credit_inn"),
-                     amount=base.get("amount"), purpose=base.get("purpose")),
-                dict(p_ml=p_ml, p_prior=p_prior, p_llm=p_llm, p_final=p_final,
-                     label_pred=label, is_suspicious=is_suspicious,
-                     rule_hits=rule_ids, reasons_llm=t.get("primary_reasons", []))
-            )
-            tx.append({k: _to_jsonable(v) for k, v in t.items()})
-
+        tx = _with_fallback([], rows_enriched, version)
         return json.dumps({"overall_observation": "", "transactions": tx}, ensure_ascii=False)
 
     # 2) Основной путь: есть ответ LLM → смешиваем и логируем
@@ -350,72 +529,36 @@ def llm_assess_risk_tool(enriched_rows_json: str) -> str:
     for t in tx:
         rid = _to_int_or_none(t.get("id"))
         base = next((r for r in rows_enriched if _to_int_or_none(r.get("id")) == rid), {})
+        final_tx.append(_final_tx(t, base, rid, version))
+    final_tx = _with_fallback(final_tx, rows_enriched, version)
 
-        p_ml = float(base.get("ml_metric", 0.0) or 0.0)
-        hist = {
-            "debit_cnt_suspicious": base.get("debit_cnt_suspicious", 0.0),
-            "debit_susp_rate": base.get("debit_susp_rate", 0.0),
-            "debit_last_seen_days": base.get("debit_last_seen_days", 1e6),
-            "debit_watchlisted": base.get("debit_watchlisted", 0),
-            "debit_p95": base.get("debit_p95"),
-            "credit_cnt_suspicious": base.get("credit_cnt_suspicious", 0.0),
-            "credit_susp_rate": base.get("credit_susp_rate", 0.0),
-            "credit_last_seen_days": base.get("credit_last_seen_days", 1e6),
-            "credit_watchlisted": base.get("credit_watchlisted", 0),
-            "credit_p95": base.get("credit_p95"),
-        }
-
-        # prior / llm / правила
-        p_prior, _ = compute_prior(hist, base)
-        p_llm = label_to_prob(t.get("risk_label"), t.get("risk_score"))
-        hard_hit, rule_ids = apply_hard_rules(base, hist)
-
-        # 🔸 LLM-floor: если LLM «красный», не опускаем итог ниже мягкого порога
-        floor_hint = llm_hint_floor(base, p_llm)
+    return json.dumps(
+        {"overall_observation": data.get("overall_observation", ""), "transactions": final_tx},
+        ensure_ascii=False
+    )
 
-        # финальная смесь
-        p_final, is_suspicious, label = mix_final(p_ml, p_prior, p_llm, hard_hit, llm_floor=floor_hint)
 
-        # итоговые поля → чтобы _fill_missing видел финальную метку
-        t["risk_label"] = label
-        t["risk_score"] = float(round(p_final, 2))
-        t["rule_hits"] = rule_ids
-
-        # автодобавим флаги/причины
-        t = _merge_flags_and_reasons(t, base)
-
-        # evidence + компоненты
-        ev = t.get("evidence", {}) or {}
-        ev.update({
-            "ml_metric": p_ml,
-            "prior": round(p_prior, 3),
-            "p_llm": round(p_llm, 3),
-            "p_final": round(p_final, 3),
-        })
-        t["evidence"] = ev
-
-        # заполнить пустые тексты (учитывает финальную метку)
-        t = _fill_missing(t)
-
-        t = _enforce_text_consistency(t)
-
-        # 🔶 ЛОГ В ПАМЯТЬ (и идемпотентные агрегаты будут пересчитаны в memory.py)
-        mem_upsert_after_decision(
-            dict(id=rid,
-                 ts=base.get("ts"),
-                 debit_inn=base.get("debit_inn"),
-                 credit_inn=base.get("credit_inn"),
-                 amount=base.get("amount"),
-                 purpose=base.get("purpose")),
-            dict(p_ml=p_ml, p_prior=p_prior, p_llm=p_llm, p_final=p_final,
-                 label_pred=label, is_suspicious=is_suspicious,
-                 rule_hits=rule_ids, reasons_llm=t.get("primary_reasons", []))
-        )
-
-        # json-совместимость на выходе
-        final_tx.append({k: _to_jsonable(v) for k, v in t.items()})
+def _assess_streaming(rows_enriched: List[Dict[str, Any]], llm_rows: List[Dict[str, Any]], version: str) -> str:
+    """
+    Потоковый путь: каждая транзакция смешивается и пишется в память, как только закрылась
+    в ответе (risk_mix/memory_write — внутри спана llm_call). Обрыв потока: готовые строки
+    остаются, остальным — расчёт без LLM, как в фолбэке (llm_status=error — следующий прогон
+    или --resume отправит их снова). Так же и со строками, которые модель пропустила в
+    завершённом ответе.
+    """
+    final_tx: List[Dict[str, Any]] = []
+    meta: Dict[str, Any] = {}
+    try:
+        with span("llm_call", rows=len(rows_enriched), stream=True):
+            for t in call_llm_stream(llm_rows, meta):
+                rid = _to_int_or_none(t.get("id"))
+                base = next((r for r in rows_enriched if _to_int_or_none(r.get("id")) == rid), {})
+                final_tx.append(_final_tx(t, base, rid, version))
+    except Exception:
+        pass                            # обрыв потока: полученные строки остаются, остальные — фолбэк ниже
+    final_tx = _with_fallback(final_tx, rows_enriched, version)
 
     return json.dumps(
-        {"overall_observation": data.get("overall_observation", ""), "transactions": final_tx},
+        {"overall_observation": meta.get("overall_observation", ""), "transactions": final_tx},
         ensure_ascii=False
     )
@@ -0,0 +1,17 @@
+# tests/conftest.py
+"""Общие фикстуры: свежая SQLite-память во временном каталоге."""
+import pytest
+
+from src.agent_lc import memory, purpose_lsh, retention
+
+
+@pytest.fixture
+def memory_db(tmp_path, monkeypatch):
+    """DB_PATH / ARCHIVE_DIR / индекс назначений — во tmp_path (config читает их при импорте). → каталог."""
+    monkeypatch.setattr(memory, "DB_PATH", str(tmp_path / "mem.sqlite"))
+    monkeypatch.setattr(memory, "_DECISION_SINK", None)
+    monkeypatch.setattr(retention, "ARCHIVE_DIR", str(tmp_path / "archive"))
+    monkeypatch.setattr(purpose_lsh, "MEMORY_BACKEND", "sqlite")
+    monkeypatch.setattr(purpose_lsh, "PURPOSE_LSH_PATH", str(tmp_path / "purpose_lsh.sqlite"))
+    memory.mem_init()
+    return tmp_path
@@ -0,0 +1,78 @@
+# tests/test_dedupe.py
+"""dedupe: группы равнозначных строк, в LLM — представитель, члены получают его ответ или его статус."""
+import json
+
+import pandas as pd
+import pytest
+
+from src.agent_lc import dedupe, tools
+from src.agent_lc.dedupe import _amount_bucket, run_deduplicated, split_groups
+
+
+def test_amount_bucket():
+    assert _amount_bucket(100) == _amount_bucket(102.0) == _amount_bucket("-101")
+    assert _amount_bucket(100) != _amount_bucket(120)
+    assert _amount_bucket(0) == _amount_bucket(float("nan")) == "0"
+    assert _amount_bucket(None) == _amount_bucket("n/a") == ""
+
+
+# id: группа — 10/11/12 одна, 20/21 вторая, 30 — одиночка
+_IDS = [10, 20, 11, 30, 21, 12]
+_PROFILE = ["a", "b", "a", "a", "b", "a"]
+_PURPOSE = ["оплата", "аренда", "оплата", "возврат", "аренда", "оплата"]
+
+
+def _frame():
+    df = pd.DataFrame({"id": _IDS, "amount": [100.0] * len(_IDS)}, index=range(100, 100 + len(_IDS)))
+    parts = pd.DataFrame({"profile": _PROFILE, "purpose": _PURPOSE, "cache_profile": _PROFILE}, index=df.index)
+    return df, parts
+
+
+def test_split_groups_first_row_represents_group():
+    df, parts = _frame()
+    reps, members, rep_of = split_groups(df, parts)
+    assert reps["id"].tolist() == [10, 20, 30]
+    assert members["id"].tolist() == [11, 21, 12]
+    assert rep_of == {11: 10, 21: 20, 12: 10}
+
+
+@pytest.fixture
+def fake_tools(monkeypatch):
+    df, parts = _frame()
+    monkeypatch.setattr(dedupe, "LLM_DEDUPE", True)
+    monkeypatch.setattr(dedupe, "PURPOSE_LSH", False)
+    monkeypatch.setattr(dedupe, "key_parts", lambda d: parts.loc[d.index])
+
+    def assess_like(df_json, shared):
+        return [{"id": r["id"], "llm_status": "updated", "llm_shared_with": shared[r["id"]]["id"]}
+                for r in json.loads(df_json)]
+
+    def assess_without_llm(df_json, llm_status="pending"):
+        return [{"id": r["id"], "llm_status": llm_status} for r in json.loads(df_json)]
+
+    monkeypatch.setattr(tools, "assess_like", assess_like)
+    monkeypatch.setattr(tools, "assess_without_llm", assess_without_llm)
+    return df
+
+
+def test_members_share_representative_answer(fake_tools):
+    sent = []
+
+    def run(rows):
+        sent.append(rows["id"].tolist())
+        return [{"id": int(i), "llm_status": "updated"} for i in rows["id"]]
+
+    tx = {t["id"]: t for t in run_deduplicated(fake_tools, run)}
+    assert sent == [[10, 20, 30]]                          # в LLM — только представители
+    assert sorted(tx) == sorted(_IDS)
+    assert {i: tx[i].get("llm_shared_with") for i in (11, 12, 21)} == {11: 10, 12: 10, 21: 20}
+    assert all(tx[i].get("llm_shared_with") is None for i in (10, 20, 30))
+
+
+def test_representative_without_answer_fans_out_its_status(fake_tools):
+    def run(rows):
+        # 10 модель пропустила, 20 пропущен по бюджету, 30 ответила
+        return [{"id": 20, "llm_status": "skipped"}, {"id": 30, "llm_status": "updated"}]
+
+    status = {t["id"]: t["llm_status"] for t in run_deduplicated(fake_tools, run)}
+    assert status == {10: "error", 11: "error", 12: "error", 20: "skipped", 21: "skipped", 30: "updated"}
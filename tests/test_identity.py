@@ -0,0 +1,50 @@
+# tests/test_identity.py
+"""identity.tx_ids: tx_id по содержимому строки, полные дубли — с суффиксом «#k»."""
+import pandas as pd
+
+from src.agent_lc.identity import TX_ID_LEN, tx_ids
+
+
+def _statement():
+    return pd.DataFrame({
+        "id": [1, 2, 3, 4, 5],
+        "date": ["2024-03-01 10:00:00", "2024-03-01 10:00:00", "2024-03-02 09:30:00",
+                 "2024-03-01 10:00:00", "2024-03-03 12:00:00"],
+        "debit_inn": [7700000001, 7700000001, 7700000002, 7700000001, 7700000003],
+        "credit_inn": [7700000009, 7700000009, 7700000009, 7700000009, 7700000001],
+        "debit_amount": [1000.0, 1000.0, 250.5, 1000.0, 99.99],
+        "purpose": ["оплата по счету 1", "оплата по счету 1", "аренда", "оплата по счету 1", "возврат"],
+    })
+
+
+def test_full_duplicates_get_k_suffix_in_order():
+    ids = tx_ids(_statement())
+    base = ids[0]
+    assert len(base) == TX_ID_LEN and "#" not in base
+    assert ids.tolist()[:4] == [base, base + "#1", ids[2], base + "#2"]
+    assert ids.nunique() == len(ids)
+
+
+def test_same_operation_same_id_across_statements():
+    month = _statement()
+    week = month.iloc[[2, 4]].copy()
+    week["id"] = [1, 2]                                    # своя нумерация строк у другой выписки
+    assert tx_ids(week).tolist() == tx_ids(month).iloc[[2, 4]].tolist()
+
+
+def test_id_ignores_row_number_and_formatting():
+    df = _statement()
+    other = df.copy()
+    other["id"] = other["id"] + 100
+    other["debit_inn"] = other["debit_inn"].astype(float).astype(str)   # «7700000001.0» из Excel
+    other["purpose"] = "  " + other["purpose"].str.replace(" ", "   ") + " "
+    assert tx_ids(other).tolist() == tx_ids(df).tolist()
+
+
+def test_content_change_changes_id():
+    df = _statement()
+    for col, value in (("debit_amount", 1000.01), ("date", "2024-03-01 10:00:01"),
+                       ("credit_inn", 7700000008), ("purpose", "оплата по счету 2")):
+        changed = df.copy()
+        changed.loc[4, col] = value
+        assert tx_ids(changed)[4] != tx_ids(df)[4], col
@@ -0,0 +1,51 @@
+# tests/test_json_stream.py
+"""json_stream.TransactionStream: объекты массива transactions по мере закрытия, на любых границах кусков."""
+import json, random
+
+from src.agent_lc.json_stream import TransactionStream
+
+_TX = [
+    {"id": 1, "risk_label": "желтый", "risk_explanation": "скобки { и } в тексте, \"кавычки\" и \\ слэш"},
+    {"id": 2, "risk_label": "красный", "evidence": {"transactions": [1, 2], "note": "вложенный ключ"}},
+    {"id": 3, "risk_label": "зеленый", "risk_explanation": "transactions: [{\"id\": 99}]"},
+]
+_BODY = json.dumps({"overall_observation": "obs {", "transactions": _TX}, ensure_ascii=False)
+_ANSWER = "Вот ответ:\n```json\n" + _BODY + "\n```"
+
+
+def _feed(parser, text, rnd):
+    out, i = [], 0
+    while i < len(text):
+        k = rnd.randint(1, 7)
+        out += list(parser.feed(text[i:i + k]))
+        i += k
+    return out
+
+
+def test_same_objects_on_any_chunking():
+    for seed in range(30):
+        parser = TransactionStream()
+        assert _feed(parser, _ANSWER, random.Random(seed)) == _TX
+        assert parser.done and parser.text == _ANSWER
+
+
+def test_objects_are_yielded_as_soon_as_they_close():
+    parser = TransactionStream()
+    cut = _ANSWER.index('{"id": 2')
+    assert list(parser.feed(_ANSWER[:cut])) == _TX[:1]
+    assert list(parser.feed(_ANSWER[cut:])) == _TX[1:]
+
+
+def test_truncated_answer_keeps_only_closed_objects():
+    # обрыв посреди второго объекта (в т.ч. внутри строки и вложенного объекта) — только первый
+    start, close = _ANSWER.index('{"id": 2'), _ANSWER.index(', {"id": 3') - 1     # close — его «}»
+    for cut in range(start, close + 1):
+        parser = TransactionStream()
+        assert list(parser.feed(_ANSWER[:cut])) == _TX[:1], cut
+        assert not parser.done
+
+
+def test_no_array_no_objects():
+    parser = TransactionStream()
+    assert list(parser.feed('{"overall_observation": "transactions: [{\\"id\\": 1}]", "other": [{"id": 1}]}')) == []
+    assert not parser.done
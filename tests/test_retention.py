@@ -0,0 +1,130 @@
+# tests/test_retention.py
+"""retention: старые операции — в gzip-архив и agg_archive, повторный прогон и слияние архивов без потерь."""
+import gzip, json, os, random, time
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.agent_lc import memory, retention
+from src.agent_lc.storage import SQLiteStore
+
+_DAY = 86400
+_NOW = int(time.time())
+_Q_TOL = (memory._HIST_GAMMA - 1) / (memory._HIST_GAMMA + 1)
+_INNS = [7700000000 + i for i in range(8)]
+
+
+def _amounts(rnd, n):
+    return [round(rnd.lognormvariate(10, 1.5), 2) for _ in range(n)]
+
+
+def test_hist_add_is_exact_merge():
+    rnd = random.Random(1)
+    a, b = _amounts(rnd, 500), _amounts(rnd, 300) + [0.0]
+    assert memory._hist_add(memory._hist_add({}, a), b) == memory._hist_add({}, a + b)
+
+
+def test_hist_quantiles_within_bucket_error():
+    amounts = _amounts(random.Random(2), 2000)
+    got = memory._hist_quantiles(memory._hist_add({}, amounts))
+    assert got == pytest.approx(tuple(np.percentile(amounts, memory._QUANTILES)), rel=_Q_TOL)
+    assert memory._hist_quantiles({}) == (None,) * len(memory._QUANTILES)
+
+
+def test_legacy_hist_keeps_count():
+    hist = memory._legacy_hist(40, (100.0, 200.0, 500.0, 900.0))
+    assert hist == {memory._hist_key(q): n for q, n in ((100.0, 20), (200.0, 10), (500.0, 6), (900.0, 4))}
+    assert memory._legacy_hist(0, (1.0, 2.0, 3.0, 4.0)) == {} == memory._legacy_hist(5, (None,) * 4)
+
+
+@pytest.fixture
+def statement(memory_db):
+    rnd = random.Random(5)
+    rows = 400
+    ts = [_NOW - rnd.randint(1, 400) * _DAY - rnd.randint(0, _DAY) for _ in range(rows)]
+    ts[0] = None                                           # без даты — не архивируется
+    d = [rnd.choice(_INNS) for _ in range(rows)]
+    df = pd.DataFrame({
+        "tx_id": [f"{i:024x}" for i in range(1, rows + 1)], "ts": ts, "debit_inn": d,
+        "credit_inn": [x if i % 41 == 0 else rnd.choice(_INNS) for i, x in enumerate(d)],
+        "amount": _amounts(rnd, rows), "purpose": "оплата",
+    })
+    SQLiteStore().bulk_preload(df)
+    return df
+
+
+def _old(df, days):
+    return df[df["ts"].notna() & (df["ts"] < retention._cutoff(days))]
+
+
+def _archive():
+    con = memory._connect()
+    out = {r[0]: r[1:] for r in con.execute("SELECT inn, cnt_total, amt_total, amt_hist, archived_until FROM agg_archive")}
+    con.close()
+    return out
+
+
+def _tx_count():
+    con = memory._connect()
+    n = con.execute("SELECT COUNT(*) FROM tx").fetchone()[0]
+    con.close()
+    return n
+
+
+def _expected(old):
+    """По ИНН: число операций (свой-себе — одна) и суммы."""
+    cnt, amounts = Counter(), {}
+    for r in old.itertuples():
+        for inn in {r.debit_inn, r.credit_inn}:
+            cnt[inn] += 1
+            amounts.setdefault(inn, []).append(r.amount)
+    return cnt, amounts
+
+
+def test_dry_run_changes_nothing(statement):
+    stats = retention.mem_retention_run(horizon_days=200, dry_run=True)
+    assert stats["tx_archived"] == len(_old(statement, 200))
+    assert _tx_count() == len(statement) and _archive() == {}
+    assert not os.path.exists(retention.ARCHIVE_DIR)
+
+
+def test_old_rows_go_to_files_and_agg_archive(statement):
+    old = _old(statement, 200)
+    stats = retention.mem_retention_run(horizon_days=200)
+    assert stats["tx_archived"] == len(old) > 0
+    assert _tx_count() == len(statement) - len(old)
+
+    recs = []
+    for path in stats["files"]:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            recs += [json.loads(line) for line in f]
+    assert sorted(r["tx_id"] for r in recs) == sorted(old["tx_id"])
+
+    cnt, _ = _expected(old)
+    arch = _archive()
+    assert {inn: a[0] for inn, a in arch.items()} == dict(cnt)
+    assert all(sum(json.loads(a[2]).values()) == a[0] for a in arch.values())
+
+    # повторный прогон: архивировать нечего, сводка та же
+    assert retention.mem_retention_run(horizon_days=200)["tx_archived"] == 0
+    assert _archive() == arch
+
+
+def test_shorter_horizon_merges_into_archive(statement):
+    retention.mem_retention_run(horizon_days=300)
+    first = _archive()
+    retention.mem_retention_run(horizon_days=100)
+
+    cnt, amounts = _expected(_old(statement, 100))
+    arch = _archive()
+    for inn, (n, total, hist, until) in arch.items():
+        assert n == cnt[inn]
+        assert total == pytest.approx(sum(amounts[inn]))
+        assert json.loads(hist) == memory._hist_add({}, amounts[inn])     # гистограмма слита точно
+        assert until >= first.get(inn, (0, 0, None, 0))[3]
+
+    # горизонт длиннее прежнего: граница архива назад не сдвигается
+    retention.mem_retention_run(horizon_days=300)
+    assert _archive() == arch
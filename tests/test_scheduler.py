@@ -0,0 +1,83 @@
+# tests/test_scheduler.py
+"""scheduler: остановка по бюджету и порядок пакетов по приоритету, остаток — skipped."""
+import json, time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.agent_lc import llm_usage, pipeline, scheduler, tools
+from src.agent_lc.scheduler import LLMBudget
+
+_RUN = "sched-test"
+
+
+def test_no_budget_never_stops():
+    b = LLMBudget()
+    assert not b.active
+    assert b.stop_reason(10, [100.0], 10**9, 1000.0) is None
+
+
+def test_deadline_counts_expected_batch_time():
+    b = LLMBudget(deadline_s=5)
+    assert b.active
+    assert b.stop_reason(10, [], 0, 0.0) is None
+    assert b.stop_reason(10, [1.0, 2.0], 0, 0.0) is None
+    assert b.stop_reason(10, [10.0, 20.0], 0, 0.0) == "deadline"       # средний пакет не успеет
+    b.deadline_at = time.monotonic() - 1
+    assert b.stop_reason(10, [], 0, 0.0) == "deadline"
+
+
+def test_tokens_stop_before_overrun():
+    b = LLMBudget(tokens=1000)
+    assert b.stop_reason(10, [], 0, 0.0) is None                        # стоимость строки ещё неизвестна
+    assert b.stop_reason(10, [], 600, 30.0) is None                     # 600 + 10·30 = 900
+    assert b.stop_reason(10, [], 600, 50.0) == "tokens"                 # 600 + 10·50 > 1000
+    assert b.stop_reason(10, [], 1000, 0.0) == "tokens"
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    """Пакет в «LLM» стоит 100 токенов на строку; строки без LLM — статус, с которым их решили."""
+    sent = []
+
+    def run_llm_batches(df, llm_batch_size, verbose=True, run_id=None, done=None, key_prefix="", dedupe=None):
+        sent.append(df["id"].tolist())
+        llm_usage._SPENT[run_id] = llm_usage._SPENT.get(run_id, 0) + 100 * len(df)
+        return [{"id": int(i)} for i in df["id"]]
+
+    def assess_without_llm(df_json, llm_status="pending"):
+        return [{"id": int(i), "llm_status": llm_status} for i in (r["id"] for r in json.loads(df_json))]
+
+    monkeypatch.setattr(pipeline, "run_llm_batches", run_llm_batches)
+    monkeypatch.setattr(tools, "assess_without_llm", assess_without_llm)
+    monkeypatch.setitem(llm_usage._SPENT, _RUN, 0)
+    return sent
+
+
+def _rows(prio, monkeypatch):
+    df = pd.DataFrame({"id": range(1, len(prio) + 1)})
+    monkeypatch.setattr(scheduler, "priorities", lambda todo: np.array(prio)[todo["id"].to_numpy() - 1])
+    return df
+
+
+def test_batches_by_priority_until_tokens_run_out(fake_llm, monkeypatch):
+    df = _rows([0.1, 0.9, 0.5, 0.7, 0.3, 0.8, 0.2], monkeypatch)
+    budget = LLMBudget(tokens=500)
+    tx = scheduler._run_scheduled(df, 2, budget, False, _RUN, None)
+
+    # 1-й пакет — два лучших; 2-й помещается (200 + 2·100 ≤ 500); 3-й уже нет
+    assert fake_llm == [[2, 6], [3, 4]]
+    status = {t["id"]: t["llm_status"] for t in tx}
+    assert {i for i, s in status.items() if s == "updated"} == {2, 3, 4, 6}
+    assert {i for i, s in status.items() if s == "skipped"} == {1, 5, 7}
+    assert budget.stats == dict(rows_llm=4, rows_skipped=3, stopped_by="tokens", tokens=400, batches=2)
+
+
+def test_without_budget_everything_goes_to_llm(fake_llm, monkeypatch):
+    df = _rows([0.1, 0.9, 0.5], monkeypatch)
+    budget = LLMBudget()
+    tx = scheduler._run_scheduled(df, 2, budget, False, _RUN, None)
+    assert fake_llm == [[2, 3], [1]]
+    assert sorted(t["id"] for t in tx) == [1, 2, 3]
+    assert budget.stats["rows_skipped"] == 0 and budget.stats["stopped_by"] is None
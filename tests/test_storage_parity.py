@@ -0,0 +1,136 @@
+# tests/test_storage_parity.py
+"""
+SQLiteStore и InMemoryStore на одних и тех же операциях должны отдавать одну и ту же память:
+предзагрузка выписки (в т.ч. повторная), решения (в т.ч. переоценка), retention.
+
+    python -m pytest -q tests
+
+У эфемерной памяти архива нет: после retention сверяем итоги SQLite (архив + «живые» строки)
+с полной историей InMemoryStore, квантили — с точностью корзин гистограммы архива.
+"""
+import random, time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.agent_lc import history, memory, retention
+from src.agent_lc.storage import InMemoryStore, SQLiteStore
+
+_DAY = 86400
+_NOW = int(time.time())            # одна точка отсчёта для обоих движков
+_HORIZON = 200                     # дней: примерно половина выписки уходит в архив
+_Q_TOL = (memory._HIST_GAMMA - 1) / (memory._HIST_GAMMA + 1)   # ошибка квантиля по гистограмме архива
+_QUANTILES = ["p50", "p75", "p90", "p95"]
+_COUNTERS = ["cnt_total", "cnt_suspicious", "amt_total", "amt_suspicious", "llm_flags_total",
+             "last_seen_ts", "watchlisted", "network_risk", "d_cnt", "d_susp", "d_amt", "decay_ts"]
+
+
+@pytest.fixture
+def stores(memory_db):
+    out = SQLiteStore(), InMemoryStore()
+    for s in out:
+        s.init()
+    return out
+
+
+def _statement(rnd, rows=600):
+    inns = [7700000000 + i for i in range(25)]
+    ts = [_NOW - rnd.randint(1, 400) * _DAY - rnd.randint(0, _DAY) for _ in range(rows)]
+    for i in range(0, rows, 97):
+        ts[i] = None                                       # дата не распознана
+    d = [rnd.choice(inns) for _ in range(rows)]
+    c = [x if i % 53 == 0 else rnd.choice(inns) for i, x in enumerate(d)]   # платежи «сам себе»
+    return pd.DataFrame({
+        "tx_id": [f"{i:024x}" for i in range(1, rows + 1)],
+        "ts": ts, "debit_inn": d, "credit_inn": c,
+        "amount": [round(rnd.lognormvariate(10, 1.5), 2) for _ in range(rows)],
+        "purpose": [f"оплата по счету {rnd.randint(1, 50)}" for _ in range(rows)],
+    }), inns
+
+
+def _decide(store, df, rnd):
+    """Решения по части выписки, затем переоценка части из них и решения по операциям вне выписки."""
+    recs = df.sample(250, random_state=1).to_dict("records")
+    extra = [dict(tx_id=f"e{i:023x}", ts=_NOW - i * _DAY, debit_inn=7700000000 + i,
+                  credit_inn=7700000001 + i, amount=1000.0 * (i + 1), purpose="вне выписки") for i in range(5)]
+    for r in recs + extra + recs[::3]:
+        store.upsert_decision(r, dict(p_ml=0.5, p_prior=0.1, p_llm=rnd.choice([0.2, 0.95, 0.99, 0.995]),
+                                      p_final=0.5, label_pred="желтый", is_suspicious=rnd.random() < 0.3,
+                                      version="test"))
+
+
+def _run(store, df, seed=3):
+    store.bulk_preload(df)
+    store.bulk_preload(df)                                 # tx_id идемпотентен
+    _decide(store, df, random.Random(seed))
+
+
+def _same(a, b):
+    if a is None or b is None:
+        return a is None and b is None
+    return b == pytest.approx(a, rel=1e-9, abs=1e-6)
+
+
+def _events(store, inns):
+    events, archive = store.read_party_history(inns)
+    return sorted(events, key=lambda e: (e[0], e[5])), archive
+
+
+def test_same_memory_before_retention(stores):
+    sql, mem = stores
+    df, inns = _statement(random.Random(7))
+    for s in stores:
+        _run(s, df)
+
+    a, b = sql.read_counterparties(inns), mem.read_counterparties(inns)
+    assert a.keys() == b.keys()
+    for inn in a:
+        bad = [k for k in memory._AGG_KEYS if not _same(a[inn][k], b[inn][k])]
+        assert not bad, (inn, {k: (a[inn][k], b[inn][k]) for k in bad})
+
+    (ea, arch), (eb, _) = _events(sql, inns), _events(mem, inns)
+    assert arch == {}
+    assert len(ea) == len(eb)
+    for x, y in zip(ea, eb):
+        assert (x[0], x[1], x[5], x[3]) == (y[0], y[1], y[5], y[3])
+        assert _same(x[2], y[2]) and _same(x[4], y[4])
+
+
+def test_same_totals_after_retention(stores, monkeypatch):
+    sql, mem = stores
+    df, inns = _statement(random.Random(11))
+    for s in stores:
+        _run(s, df, seed=5)
+
+    stats = retention.mem_retention_run(horizon_days=_HORIZON)
+    assert stats["tx_archived"] > 0
+    sql.bulk_preload(df)                                   # старая выписка ещё раз: архив не удваивается
+    mem.bulk_preload(df)
+
+    a, b = sql.read_counterparties(inns), mem.read_counterparties(inns)
+    assert a.keys() == b.keys()
+    for inn in a:
+        bad = [k for k in _COUNTERS if not _same(a[inn][k], b[inn][k])]
+        bad += [k for k in _QUANTILES if a[inn][k] != pytest.approx(b[inn][k], rel=_Q_TOL)]
+        assert not bad, (inn, {k: (a[inn][k], b[inn][k]) for k in bad})
+
+    # as-of: после горизонта архив целиком в прошлом — срез SQLite (архив + префикс) = полный префикс
+    cutoff = retention._cutoff(_HORIZON)
+    keys = np.array(inns, dtype=np.int64)
+    for at in (np.nan, cutoff + 30 * _DAY):
+        ts = np.full(len(keys), at)
+        h = {}
+        for name, store in (("sql", sql), ("mem", mem)):
+            monkeypatch.setattr(history, "get_store", lambda store=store: store)
+            h[name] = history.AsOfHistory.from_memory(inns).lookup(keys, ts)
+        assert h["sql"]["cnt_total"].tolist() == h["mem"]["cnt_total"].tolist()
+        assert h["sql"]["p95"] == pytest.approx(h["mem"]["p95"], rel=_Q_TOL)
+
+    (ea, arch), (eb, _) = _events(sql, inns), _events(mem, inns)
+    live = [e for e in eb if not 0 < e[1] < cutoff]
+    assert [(e[0], e[5]) for e in ea] == [(e[0], e[5]) for e in live]
+    for inn in inns:
+        n_mem = sum(1 for e in eb if e[0] == inn)
+        n_sql = sum(1 for e in ea if e[0] == inn) + int((arch.get(inn) or (0,))[0] or 0)
+        assert n_sql == n_mem, inn